@@ -2,7 +2,6 @@ import streamlit as st
 import sqlite3
 import pandas as pd
 import os
-import numpy as np
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
@@ -11,6 +10,8 @@ from streamlit_option_menu import option_menu
 import base64
 from io import BytesIO
 import json
+import shutil
+import tempfile
 import time
 
 # Set page configuration
@@ -22,7 +23,46 @@ st.set_page_config(
 )
 
 # Database connection
-DB_PATH = "accounts_payable.db"
+from utils.artifacts import entity_artifacts, get_artifact, read_artifact, register_artifact
+from utils.backup import (
+    BACKUP_DIR, BACKUP_INTERVALS, BACKUP_JOB, BACKUP_KEEP, BACKUP_SCHEDULE, DOWNLOAD_LIMIT as BACKUP_DOWNLOAD_LIMIT,
+    BackupError, list_backups, restore_backup
+)
+from utils.blob_store import read_blob, release as release_blob, store as store_blob
+from utils.date_keys import day_key, month_label, month_start
+from utils.db import DB_PATH, get_db_connection, get_pool, reset_pool
+from utils.excel_generator import AGING_JOB, PAYMENT_ADVICE_JOB
+from utils.jobs import cancel as cancel_job, enqueue as enqueue_job, set_schedule, start_worker, worker_status
+from utils.migrations import rebuild_aging_summary
+from utils.money import format_money, to_dollars
+from utils.olap import OPEN_STATUSES, UNDATED, get_cube
+from utils.payment_batches import (
+    approve_payment_requests, create_payment_requests, group_by_vendor, load_selection, reject_payment_requests
+)
+from utils.queries import (
+    ACTIVE_VENDOR_COUNT_SQL, ACTIVE_VENDOR_OPTIONS_SQL, AGING_SUMMARY_SQL, DASHBOARD_AGING_SQL, IMPORT_HISTORY_SQL,
+    LOGIN_SQL, OUTSTANDING_TOTAL_SQL, PAYMENT_HISTORY_SQL, PAYMENT_REQUEST_ADVICES_SQL, PAYMENT_REQUEST_ITEMS_SQL,
+    PAYMENT_REQUEST_LIST_SQL, PENDING_APPROVAL_INVOICES_SQL, PENDING_APPROVALS_SQL, PENDING_INVOICE_COUNT_SQL,
+    PENDING_REQUEST_COUNT_SQL, RECENT_INVOICES_SQL, REJECT_REQUEST_INVOICES_SQL, USER_LIST_SQL, USER_SEARCH_SQL,
+    VENDOR_BANK_DETAILS_SQL, VENDOR_DOCUMENTS_SQL, VENDOR_LIST_SQL, VENDOR_SEARCH_SQL, aging_details_query,
+    invoice_page_query
+)
+from utils.query_cache import query_cache
+from utils.report_reader import (
+    expire_snapshot, get_report_connection, report_staleness, request_snapshot, schedule_snapshots, snapshot_time,
+    SNAPSHOT_PATH
+)
+from utils.search import search as search_index
+from utils.settings import load_settings, save_settings
+from utils.profiler import profiler
+from utils.tally_connector import (
+    DEFAULT_REPLAY_DIR, SOURCES as TALLY_SOURCES, SYNC_INTERVALS, SYNC_JOB as TALLY_SYNC_JOB,
+    SYNC_SCHEDULE as TALLY_SYNC_SCHEDULE, source_from_settings
+)
+from utils.tally_sync import ENTITIES as TALLY_ENTITIES, get_watermark, reset_watermark
+from utils.tally_xml import XmlHttpTallySource
+from utils.tracing import span, traced, tracer
+from utils.aging import AGING_COLORS, AGING_LABELS, age_invoices, bucket_due_ranges, bucket_labels, days_overdue
 
 def init_database_if_needed():
     """Initialize the database if it doesn't exist yet"""
@@ -34,10 +74,14 @@ def init_database_if_needed():
 # Initialize database if needed
 init_database_if_needed()
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Time Plotly figure building and Streamlit element calls in page traces
+tracer.install_hooks()
+
+# Background worker for syncs and other jobs that should not block a rerun
+start_worker()
+
+# Seconds between reruns while a page waits for a report job
+REPORT_POLL_SECONDS = 1
 
 # Create necessary directories
 os.makedirs("uploads", exist_ok=True)
@@ -51,13 +95,45 @@ if 'user' not in st.session_state:
 if 'user_role' not in st.session_state:
     st.session_state.user_role = None
 
+# Slow query threshold saved from the Database settings tab
+profiler.slow_ms = load_settings().get("slow_query_ms", profiler.slow_ms)
+
+# Data grids
+def action_grid(rows, key, column_config, action_column, editable=()):
+    """Show rows (indexed by id) in one data_editor with a checkbox action column.
+    
+    Returns the edited frame and the id of the row whose action box was ticked, if any.
+    """
+    # The version is part of the widget key; bumping it discards the editor's pending edits
+    version_key = f"{key}_version"
+    version = st.session_state.get(version_key, 0)
+    
+    rows = rows.assign(**{action_column: False})
+    edited = st.data_editor(
+        rows,
+        key=f"{key}_{version}",
+        hide_index=True,
+        use_container_width=True,
+        column_config=column_config,
+        column_order=list(editable) + [c for c in rows.columns if c != action_column and c not in editable] + [action_column],
+        disabled=[c for c in rows.columns if c != action_column and c not in editable]
+    )
+    
+    ticked = edited.index[edited[action_column].fillna(False).astype(bool)]
+    if len(ticked):
+        reset_grid(key)
+        return edited, ticked[0]
+    return edited, None
+
+def reset_grid(key):
+    """Drop the pending edits of a grid drawn by action_grid"""
+    version_key = f"{key}_version"
+    st.session_state[version_key] = st.session_state.get(version_key, 0) + 1
+
 # Authentication functions
 def login(username, password):
     conn = get_db_connection()
-    user = conn.execute(
-        "SELECT * FROM users WHERE username = ? AND status = 'active'", 
-        (username,)
-    ).fetchone()
+    user = conn.execute(LOGIN_SQL, (username,)).fetchone()
     conn.close()
     
     if user and check_password(user['password_hash'], password):
@@ -168,28 +244,31 @@ def main_app():
             logout()
             st.rerun()
     
-    # Main content based on selection
-    if selected == "Dashboard":
-        display_dashboard()
-    elif selected == "Vendors":
-        display_vendors()
-    elif selected == "Invoices":
-        display_invoices()
-    elif selected == "Payment Requests":
-        display_payment_requests()
-    elif selected == "Payment Approvals":
-        display_payment_approvals()
-    elif selected == "Reports":
-        display_reports()
-    elif selected == "Users":
-        display_users()
-    elif selected == "Settings":
-        display_settings()
-    elif selected == "Data Manager":
-        from data_manager import data_management
-        data_management()
+    # Main content based on selection; the profiler times the render and tags its
+    # queries, and the tracer records the rerun as a tree of spans
+    with profiler.page(selected), tracer.trace(selected):
+        if selected == "Dashboard":
+            display_dashboard()
+        elif selected == "Vendors":
+            display_vendors()
+        elif selected == "Invoices":
+            display_invoices()
+        elif selected == "Payment Requests":
+            display_payment_requests()
+        elif selected == "Payment Approvals":
+            display_payment_approvals()
+        elif selected == "Reports":
+            display_reports()
+        elif selected == "Users":
+            display_users()
+        elif selected == "Settings":
+            display_settings()
+        elif selected == "Data Manager":
+            from data_manager import data_management
+            data_management()
 
 # Dashboard Page
+@traced()
 def display_dashboard():
     st.title("Accounts Payable Dashboard")
     
@@ -198,76 +277,38 @@ def display_dashboard():
     
     conn = get_db_connection()
     
+    # Dashboard queries are served from the shared cache until a write
+    # to the tables they read (or the TTL) invalidates them
+    
     # Total Vendors
-    total_vendors = conn.execute("SELECT COUNT(*) FROM vendors WHERE status = 'active'").fetchone()[0]
+    total_vendors = query_cache.scalar(ACTIVE_VENDOR_COUNT_SQL, conn, tables=("vendors",))
     col1.metric("Active Vendors", total_vendors)
     
     # Pending Invoices
-    pending_invoices = conn.execute("SELECT COUNT(*) FROM invoices WHERE status = 'pending'").fetchone()[0]
+    pending_invoices = query_cache.scalar(PENDING_INVOICE_COUNT_SQL, conn, tables=("invoices",))
     col2.metric("Pending Invoices", pending_invoices)
     
     # Total Outstanding
-    total_outstanding = conn.execute(
-        "SELECT SUM(total_amount) FROM invoices WHERE status IN ('pending', 'approved')"
-    ).fetchone()[0]
-    total_outstanding = total_outstanding or 0
-    col3.metric("Total Outstanding", f"${total_outstanding:,.2f}")
+    total_outstanding = query_cache.scalar(OUTSTANDING_TOTAL_SQL, conn, tables=("invoices",))
+    col3.metric("Total Outstanding", format_money(total_outstanding))
     
     # Pending Approvals
-    pending_approvals = conn.execute("SELECT COUNT(*) FROM payment_requests WHERE status = 'pending'").fetchone()[0]
+    pending_approvals = query_cache.scalar(PENDING_REQUEST_COUNT_SQL, conn, tables=("payment_requests",))
     col4.metric("Pending Approvals", pending_approvals)
     
     # Aging Dashboard
     st.subheader("Accounts Payable Aging")
     
-    # Get invoices data for aging
-    invoices_df = pd.read_sql("""
-        SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number, 
-               i.invoice_date, i.due_date, i.total_amount, i.status
-        FROM invoices i
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        WHERE i.status IN ('pending', 'approved')
-    """, conn)
+    # Open invoice totals per vendor and due date (kept current by triggers)
+    aging_df = query_cache.read_sql(DASHBOARD_AGING_SQL, conn, tables=("invoices", "vendors"))
     
-    if not invoices_df.empty:
-        # Convert date columns
-        invoices_df['invoice_date'] = pd.to_datetime(invoices_df['invoice_date'])
-        invoices_df['due_date'] = pd.to_datetime(invoices_df['due_date'])
-        
-        # Calculate days overdue - FIXED
-        today = datetime.now().date()
-        invoices_df['due_date_obj'] = invoices_df['due_date'].dt.date  # Extract date objects
-        # Use apply lambda function to calculate days for each row
-        invoices_df['days_overdue'] = invoices_df['due_date_obj'].apply(lambda x: (today - x).days)
-        
-        # Create aging buckets
-        conditions = [
-            (invoices_df['days_overdue'] <= 0),
-            (invoices_df['days_overdue'] > 0) & (invoices_df['days_overdue'] <= 30),
-            (invoices_df['days_overdue'] > 30) & (invoices_df['days_overdue'] <= 60),
-            (invoices_df['days_overdue'] > 60) & (invoices_df['days_overdue'] <= 90),
-            (invoices_df['days_overdue'] > 90)
-        ]
-        
-        choices = ['Current', '1-30 Days', '31-60 Days', '61-90 Days', 'Over 90 Days']
-        invoices_df['aging_bucket'] = np.select(conditions, choices, default='Current')
-        
-        # Group by aging bucket
-        aging_summary = invoices_df.groupby('aging_bucket').agg(
-            count=('invoice_id', 'count'),
-            total=('total_amount', 'sum')
-        ).reset_index()
-        
-        # Sort buckets
-        bucket_order = {
-            'Current': 0,
-            '1-30 Days': 1,
-            '31-60 Days': 2,
-            '61-90 Days': 3,
-            'Over 90 Days': 4
-        }
-        aging_summary['bucket_order'] = aging_summary['aging_bucket'].map(bucket_order)
-        aging_summary = aging_summary.sort_values('bucket_order').drop('bucket_order', axis=1)
+    if not aging_df.empty:
+        # Bucket each due date as of today; totals stay in cents until they are charted
+        with span("age invoices"):
+            _, _, aging_summary = age_invoices(
+                aging_df, datetime.now().date(), amount_col='total_cents', count_col='invoice_count'
+            )
+            aging_summary['total'] = to_dollars(aging_summary['total'])
         
         # Create two columns for charts
         col1, col2 = st.columns(2)
@@ -282,13 +323,7 @@ def display_dashboard():
                 title='Outstanding Amount by Aging Bucket',
                 labels={'aging_bucket': 'Aging Bucket', 'total': 'Amount ($)'},
                 color='aging_bucket',
-                color_discrete_map={
-                    'Current': '#28a745',
-                    '1-30 Days': '#ffc107',
-                    '31-60 Days': '#fd7e14',
-                    '61-90 Days': '#dc3545',
-                    'Over 90 Days': '#6c757d'
-                }
+                color_discrete_map=AGING_COLORS
             )
             fig.update_layout(showlegend=False)
             st.plotly_chart(fig, use_container_width=True)
@@ -301,23 +336,19 @@ def display_dashboard():
                 names='aging_bucket',
                 title='Outstanding Amount Distribution',
                 color='aging_bucket',
-                color_discrete_map={
-                    'Current': '#28a745',
-                    '1-30 Days': '#ffc107',
-                    '31-60 Days': '#fd7e14',
-                    '61-90 Days': '#dc3545',
-                    'Over 90 Days': '#6c757d'
-                }
+                color_discrete_map=AGING_COLORS
             )
             st.plotly_chart(fig, use_container_width=True)
         
         # Top Vendors by Outstanding Amount
         st.subheader("Top Vendors by Outstanding Amount")
         
-        vendor_summary = invoices_df.groupby('vendor_name').agg(
-            count=('invoice_id', 'count'),
-            total=('total_amount', 'sum')
-        ).reset_index().sort_values('total', ascending=False).head(10)
+        with span("top vendors"):
+            vendor_summary = aging_df.groupby('vendor_name').agg(
+                count=('invoice_count', 'sum'),
+                total=('total_cents', 'sum')
+            ).reset_index().sort_values('total', ascending=False).head(10)
+            vendor_summary['total'] = to_dollars(vendor_summary['total'])
         
         fig = px.bar(
             vendor_summary,
@@ -334,10 +365,10 @@ def display_dashboard():
         
         # Recent invoices
         st.subheader("Recent Pending Invoices")
-        recent_invoices = invoices_df.sort_values('invoice_date', ascending=False).head(5)
-        recent_invoices['invoice_date'] = recent_invoices['invoice_date'].dt.strftime('%Y-%m-%d')
-        recent_invoices['due_date'] = recent_invoices['due_date'].dt.strftime('%Y-%m-%d')
-        recent_invoices['total_amount'] = recent_invoices['total_amount'].apply(lambda x: f"${x:,.2f}")
+        recent_invoices = query_cache.read_sql(RECENT_INVOICES_SQL, conn, tables=("invoices", "vendors"))
+        recent_invoices['invoice_date'] = pd.to_datetime(recent_invoices['invoice_date']).dt.strftime('%Y-%m-%d')
+        recent_invoices['due_date'] = pd.to_datetime(recent_invoices['due_date']).dt.strftime('%Y-%m-%d')
+        recent_invoices['total_amount'] = format_money(recent_invoices['total_cents'])
         
         st.dataframe(
             recent_invoices[['vendor_name', 'invoice_number', 'invoice_date', 'due_date', 'total_amount', 'status']],
@@ -361,23 +392,19 @@ def display_vendors():
     with tab2:
         create_vendor_form()
 
+@traced()
 def display_vendor_list():
-    conn = get_db_connection()
-    vendors = pd.read_sql("""
-        SELECT v.vendor_id, v.vendor_name, v.contact_person, v.email, v.phone, v.status,
-               COUNT(DISTINCT i.invoice_id) as invoice_count,
-               SUM(CASE WHEN i.status IN ('pending', 'approved') THEN i.total_amount ELSE 0 END) as outstanding_amount
-        FROM vendors v
-        LEFT JOIN invoices i ON v.vendor_id = i.vendor_id
-        GROUP BY v.vendor_id
-        ORDER BY v.vendor_name
-    """, conn)
-    conn.close()
-    
-    # Search filter
+    # Search filter; matching vendors come from the full-text index, best match first
     search = st.text_input("Search Vendors", "")
+    
+    conn = get_db_connection()
     if search:
-        vendors = vendors[vendors['vendor_name'].str.contains(search, case=False)]
+        vendors = pd.read_sql(
+            VENDOR_SEARCH_SQL, conn, params=(json.dumps(search_index(conn, "vendors", search)),)
+        )
+    else:
+        vendors = pd.read_sql(VENDOR_LIST_SQL, conn)
+    conn.close()
     
     # Status filter
     status_filter = st.multiselect(
@@ -389,31 +416,30 @@ def display_vendor_list():
         vendors = vendors[vendors['status'].isin(status_filter)]
     
     # Format the dataframe
-    vendors['outstanding_amount'] = vendors['outstanding_amount'].fillna(0).apply(lambda x: f"${x:,.2f}")
+    vendors['outstanding_amount'] = to_dollars(vendors.pop('outstanding_cents'))
+    vendors['status'] = vendors['status'].str.title()
+    
+    # Display vendors in a single grid; tick "Edit" to open a vendor
+    _, edit_vendor_id = action_grid(
+        vendors.set_index('vendor_id'),
+        key="vendor_grid",
+        action_column="edit",
+        column_config={
+            "vendor_name": "Vendor",
+            "contact_person": "Contact",
+            "email": "Email",
+            "phone": "Phone",
+            "status": "Status",
+            "invoice_count": st.column_config.NumberColumn("Invoices"),
+            "outstanding_amount": st.column_config.NumberColumn("Outstanding", format="$%.2f"),
+            "edit": st.column_config.CheckboxColumn("Edit", width="small")
+        }
+    )
+    st.caption(f"{len(vendors)} vendors")
     
-    # Display vendors with edit button
-    for i, vendor in vendors.iterrows():
-        col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
-        
-        with col1:
-            st.subheader(vendor['vendor_name'])
-            st.write(f"Contact: {vendor['contact_person'] or 'N/A'}")
-        
-        with col2:
-            st.write(f"Email: {vendor['email'] or 'N/A'}")
-            st.write(f"Phone: {vendor['phone'] or 'N/A'}")
-        
-        with col3:
-            st.write(f"Status: {vendor['status'].title()}")
-            st.write(f"Invoices: {vendor['invoice_count']}")
-        
-        with col4:
-            st.write(f"Outstanding: {vendor['outstanding_amount']}")
-            if st.button("Edit", key=f"edit_{vendor['vendor_id']}"):
-                st.session_state.edit_vendor_id = vendor['vendor_id']
-                st.rerun()
-        
-        st.divider()
+    if edit_vendor_id is not None:
+        st.session_state.edit_vendor_id = int(edit_vendor_id)
+        st.rerun()
     
     # Edit vendor modal
     if 'edit_vendor_id' in st.session_state and st.session_state.edit_vendor_id:
@@ -424,18 +450,10 @@ def display_edit_vendor_modal(vendor_id):
     vendor = conn.execute("SELECT * FROM vendors WHERE vendor_id = ?", (vendor_id,)).fetchone()
     
     # Get bank details
-    bank_details = pd.read_sql(
-        "SELECT * FROM vendor_bank_details WHERE vendor_id = ?", 
-        conn, 
-        params=(vendor_id,)
-    )
+    bank_details = pd.read_sql(VENDOR_BANK_DETAILS_SQL, conn, params=(vendor_id,))
     
     # Get documents
-    documents = pd.read_sql(
-        "SELECT * FROM vendor_documents WHERE vendor_id = ?", 
-        conn, 
-        params=(vendor_id,)
-    )
+    documents = pd.read_sql(VENDOR_DOCUMENTS_SQL, conn, params=(vendor_id,))
     
     conn.close()
     
@@ -566,13 +584,13 @@ def display_edit_vendor_modal(vendor_id):
                     
                     # Handle document viewing/download
                     if os.path.exists(doc['document_path']):
-                        with open(doc['document_path'], "rb") as file:
-                            btn = st.download_button(
-                                label="Download Document",
-                                data=file,
-                                file_name=os.path.basename(doc['document_path']),
-                                mime="application/octet-stream"
-                            )
+                        deferred_download_button(
+                            "Download Document",
+                            f"download_doc_{doc['document_id']}",
+                            lambda path=doc['document_path']: read_blob(path),
+                            f"{doc['document_type'].replace(' ', '_')}{os.path.splitext(doc['document_path'])[1]}",
+                            "application/octet-stream"
+                        )
                     else:
                         st.error("Document file not found.")
                     
@@ -603,11 +621,10 @@ def display_edit_vendor_modal(vendor_id):
                             conn = get_db_connection()
                             conn.execute("DELETE FROM vendor_documents WHERE document_id = ?", (doc['document_id'],))
                             conn.commit()
-                            conn.close()
                             
-                            # Delete file
-                            if os.path.exists(doc['document_path']):
-                                os.remove(doc['document_path'])
+                            # Drop the reference; the file goes once no other row uses the same content
+                            release_blob(conn, doc['document_path'])
+                            conn.close()
                             
                             st.success("Document deleted!")
                             st.rerun()
@@ -626,23 +643,25 @@ def display_edit_vendor_modal(vendor_id):
                 upload_doc = st.form_submit_button("Upload")
                 
                 if upload_doc and uploaded_file:
-                    # Save file
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                    file_ext = os.path.splitext(uploaded_file.name)[1]
-                    file_path = os.path.join("uploads", f"vendor_{vendor_id}_{document_type.replace(' ', '_')}_{timestamp}{file_ext}")
-                    
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    # Add to database
+                    # Save file in the content-addressed store
                     conn = get_db_connection()
-                    conn.execute("""
-                        INSERT INTO vendor_documents
-                        (vendor_id, document_type, document_path, status)
-                        VALUES (?, ?, ?, 'pending')
-                    """, (vendor_id, document_type, file_path))
-                    conn.commit()
-                    conn.close()
+                    file_path = store_blob(conn, uploaded_file, uploaded_file.name)
+                    
+                    # Add to database; if the row is not saved, drop the blob reference again
+                    try:
+                        conn.execute("""
+                            INSERT INTO vendor_documents
+                            (vendor_id, document_type, document_path, status)
+                            VALUES (?, ?, ?, 'pending')
+                        """, (vendor_id, document_type, file_path))
+                        conn.commit()
+                    except sqlite3.Error as e:
+                        conn.rollback()
+                        release_blob(conn, file_path)
+                        st.error(f"Error saving document: {str(e)}")
+                        return
+                    finally:
+                        conn.close()
                     
                     st.success("Document uploaded!")
                     st.rerun()
@@ -709,31 +728,19 @@ def display_invoices():
     with tab3:
         import_invoices_from_tally()
 
-def display_invoice_list():
+def fetch_invoice_page(search, status_filter, date_filter, after=None, limit=10):
+    """Fetch one page of invoices ordered by (due_date, invoice_id), starting after the given key"""
     conn = get_db_connection()
-    
-    # Get invoices with vendor info
-    invoices = pd.read_sql("""
-        SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number, 
-               i.invoice_date, i.due_date, i.amount, i.tax_amount, i.total_amount, 
-               i.status, i.description
-        FROM invoices i
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        ORDER BY i.due_date ASC
-    """, conn)
+    sql, params = invoice_page_query(conn, search, status_filter, date_filter, after, limit)
+    invoices = pd.read_sql(sql, conn, params=params)
     conn.close()
     
-    # Convert date columns
-    invoices['invoice_date'] = pd.to_datetime(invoices['invoice_date']).dt.strftime('%Y-%m-%d')
-    invoices['due_date'] = pd.to_datetime(invoices['due_date']).dt.strftime('%Y-%m-%d')
-    
-    # Calculate days to due or overdue - fixed calculation
-    today = datetime.now().date()
-    # Convert due_date back to datetime for comparison
-    invoices['due_date_dt'] = pd.to_datetime(invoices['due_date']).dt.date
-    # Calculate days difference
-    invoices['days'] = invoices['due_date_dt'].apply(lambda x: (x - today).days)
-    
+    # The extra row only tells us whether another page exists
+    has_next = len(invoices) > limit
+    return invoices.head(limit), has_next
+
+@traced()
+def display_invoice_list():
     # Filters
     col1, col2, col3 = st.columns(3)
     
@@ -754,36 +761,35 @@ def display_invoice_list():
             index=0
         )
     
-    # Apply filters
-    filtered_invoices = invoices.copy()
-    
-    if search:
-        filtered_invoices = filtered_invoices[
-            filtered_invoices['invoice_number'].str.contains(search, case=False) | 
-            filtered_invoices['vendor_name'].str.contains(search, case=False)
-        ]
-    
-    if status_filter:
-        filtered_invoices = filtered_invoices[filtered_invoices['status'].isin(status_filter)]
+    page_size = int(load_settings().get("items_per_page", 10))
     
-    if date_filter == "Due this week":
-        filtered_invoices = filtered_invoices[
-            (filtered_invoices['days'] >= 0) & (filtered_invoices['days'] <= 7)
-        ]
-    elif date_filter == "Due this month":
-        filtered_invoices = filtered_invoices[
-            (filtered_invoices['days'] >= 0) & (filtered_invoices['days'] <= 30)
-        ]
-    elif date_filter == "Overdue":
-        filtered_invoices = filtered_invoices[filtered_invoices['days'] < 0]
+    # Keyset pagination: keep the start key of every page visited so far
+    filter_key = (search, tuple(status_filter), date_filter, page_size)
+    if st.session_state.get('invoice_page_filters') != filter_key:
+        st.session_state.invoice_page_filters = filter_key
+        st.session_state.invoice_page_keys = [None]
+        reset_grid("invoice_grid")
+    if 'selected_invoice_ids' not in st.session_state:
+        st.session_state.selected_invoice_ids = set()
     
-    # Display invoice count
-    st.write(f"Showing {len(filtered_invoices)} invoices")
+    page_keys = st.session_state.invoice_page_keys
+    filtered_invoices, has_next = fetch_invoice_page(
+        search, status_filter, date_filter, after=page_keys[-1], limit=page_size
+    )
     
-    # Format currency columns
-    filtered_invoices['amount'] = filtered_invoices['amount'].apply(lambda x: f"${x:,.2f}")
-    filtered_invoices['tax_amount'] = filtered_invoices['tax_amount'].apply(lambda x: f"${x:,.2f}")
-    filtered_invoices['total_amount'] = filtered_invoices['total_amount'].apply(lambda x: f"${x:,.2f}")
+    # Calculate days to due or overdue
+    filtered_invoices['days'] = -days_overdue(filtered_invoices['due_date'], datetime.now().date())
+    filtered_invoices['due_date_key'] = filtered_invoices['due_date']
+    filtered_invoices['invoice_date'] = pd.to_datetime(filtered_invoices['invoice_date']).dt.strftime('%Y-%m-%d')
+    filtered_invoices['due_date'] = pd.to_datetime(filtered_invoices['due_date']).dt.strftime('%Y-%m-%d')
+    filtered_invoices['total_amount'] = to_dollars(filtered_invoices['total_cents'])
+    
+    # Display page position
+    first_row = (len(page_keys) - 1) * page_size + 1
+    if filtered_invoices.empty:
+        st.write("No invoices match the selected filters")
+    else:
+        st.write(f"Page {len(page_keys)}: showing invoices {first_row}-{first_row + len(filtered_invoices) - 1}")
     
     # Add days column with formatting
     def format_days(days):
@@ -795,49 +801,68 @@ def display_invoice_list():
             return f"✅ Due in {days} days"
     
     filtered_invoices['due_in'] = filtered_invoices['days'].apply(format_days)
+    filtered_invoices['payable'] = filtered_invoices['status'].isin(['pending', 'approved'])
+    
+    # Display the page in a single grid: "Select" marks invoices for payment, "View" opens one
+    selected_invoices = st.session_state.selected_invoice_ids
+    page = filtered_invoices.set_index('invoice_id')
+    page['select'] = page['payable'] & page.index.isin(list(selected_invoices))
+    page['status'] = page['status'].str.title()
+    
+    edited, view_invoice_id = action_grid(
+        page[['select', 'invoice_number', 'vendor_name', 'due_date', 'due_in', 'total_amount', 'status']],
+        key="invoice_grid",
+        action_column="view",
+        editable=["select"],
+        column_config={
+            "select": st.column_config.CheckboxColumn("Select", width="small"),
+            "invoice_number": "Invoice #",
+            "vendor_name": "Vendor",
+            "due_date": "Due Date",
+            "due_in": "Due",
+            "total_amount": st.column_config.NumberColumn("Amount", format="$%.2f"),
+            "status": "Status",
+            "view": st.column_config.CheckboxColumn("View", width="small")
+        }
+    )
     
-    # Create display columns
-    display_cols = ['invoice_number', 'vendor_name', 'invoice_date', 'due_date', 'due_in', 'total_amount', 'status']
+    # Selection survives paging; only pending and approved invoices can be paid
+    ticked = edited['select'].fillna(False).astype(bool)
+    for invoice_id, payable in page['payable'].items():
+        if payable and ticked[invoice_id]:
+            selected_invoices.add(int(invoice_id))
+        else:
+            selected_invoices.discard(int(invoice_id))
+    if (ticked & ~page['payable']).any():
+        st.warning("Only pending or approved invoices can be selected for payment")
+        reset_grid("invoice_grid")
     
-    # Display invoices with action buttons
-    selected_invoices = []
+    if view_invoice_id is not None:
+        st.session_state.edit_invoice_id = int(view_invoice_id)
+        st.rerun()
     
-    for i, invoice in filtered_invoices.iterrows():
-        col1, col2, col3, col4, col5 = st.columns([2, 3, 2, 2, 1])
-        
-        with col1:
-            st.write(f"**Invoice #:** {invoice['invoice_number']}")
-        
-        with col2:
-            st.write(f"**Vendor:** {invoice['vendor_name']}")
-        
-        with col3:
-            st.write(f"**Due Date:** {invoice['due_date']}")
-            st.write(invoice['due_in'])
-        
-        with col4:
-            st.write(f"**Amount:** {invoice['total_amount']}")
-            st.write(f"**Status:** {invoice['status'].title()}")
-        
-        with col5:
-            # Select for payment checkbox
-            if invoice['status'] in ['pending', 'approved']:
-                if st.checkbox("Select", key=f"select_{invoice['invoice_id']}"):
-                    selected_invoices.append(invoice['invoice_id'])
-            
-            # View/Edit button
-            if st.button("View", key=f"view_{invoice['invoice_id']}"):
-                st.session_state.edit_invoice_id = invoice['invoice_id']
-                st.rerun()
-        
-        st.divider()
+    # Page navigation
+    col1, col2, col3 = st.columns([1, 1, 4])
+    
+    with col1:
+        if st.button("Previous", disabled=len(page_keys) == 1):
+            page_keys.pop()
+            reset_grid("invoice_grid")
+            st.rerun()
+    
+    with col2:
+        if st.button("Next", disabled=not has_next):
+            last = filtered_invoices.iloc[-1]
+            page_keys.append((last['due_date_key'], int(last['invoice_id'])))
+            reset_grid("invoice_grid")
+            st.rerun()
     
     # Create payment request button
     if selected_invoices and st.session_state.user_role in ['admin', 'accountant']:
         st.write(f"Selected {len(selected_invoices)} invoices for payment")
         
         if st.button("Create Payment Request"):
-            st.session_state.create_payment_request = selected_invoices
+            st.session_state.create_payment_request = sorted(selected_invoices)
             st.rerun()
     
     # Edit invoice modal
@@ -847,6 +872,8 @@ def display_invoice_list():
     # Create payment request modal
     if 'create_payment_request' in st.session_state and st.session_state.create_payment_request:
         display_create_payment_request_modal(st.session_state.create_payment_request)
+    elif st.session_state.get('payment_batch_result'):
+        display_payment_batch_result(st.session_state.payment_batch_result)
 
 def display_edit_invoice_modal(invoice_id):
     conn = get_db_connection()
@@ -898,13 +925,14 @@ def display_edit_invoice_modal(invoice_id):
         st.sidebar.subheader("Invoice File")
         
         if invoice['invoice_file_path'] and os.path.exists(invoice['invoice_file_path']):
-            with open(invoice['invoice_file_path'], "rb") as file:
-                st.sidebar.download_button(
-                    label="Download Invoice",
-                    data=file,
-                    file_name=os.path.basename(invoice['invoice_file_path']),
-                    mime="application/octet-stream"
-                )
+            deferred_download_button(
+                "Download Invoice",
+                f"download_invoice_{invoice_id}",
+                lambda: read_blob(invoice['invoice_file_path']),
+                f"{invoice['invoice_number'].replace('/', '_')}{os.path.splitext(invoice['invoice_file_path'])[1]}",
+                "application/octet-stream",
+                st.sidebar
+            )
         else:
             st.sidebar.info("No invoice file uploaded.")
             
@@ -914,22 +942,24 @@ def display_edit_invoice_modal(invoice_id):
                 upload_submitted = st.form_submit_button("Upload")
                 
                 if upload_submitted and uploaded_file:
-                    # Save file
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                    file_ext = os.path.splitext(uploaded_file.name)[1]
-                    file_path = os.path.join("uploads", f"invoice_{invoice_id}_{timestamp}{file_ext}")
-                    
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    # Update invoice
+                    # Save file in the content-addressed store
                     conn = get_db_connection()
-                    conn.execute(
-                        "UPDATE invoices SET invoice_file_path = ? WHERE invoice_id = ?", 
-                        (file_path, invoice_id)
-                    )
-                    conn.commit()
-                    conn.close()
+                    file_path = store_blob(conn, uploaded_file, uploaded_file.name)
+                    
+                    # Update invoice; if the row is not saved, drop the blob reference again
+                    try:
+                        conn.execute(
+                            "UPDATE invoices SET invoice_file_path = ? WHERE invoice_id = ?", 
+                            (file_path, invoice_id)
+                        )
+                        conn.commit()
+                    except sqlite3.Error as e:
+                        conn.rollback()
+                        release_blob(conn, file_path)
+                        st.sidebar.error(f"Error saving invoice file: {str(e)}")
+                        return
+                    finally:
+                        conn.close()
                     
                     st.success("Invoice file uploaded!")
                     st.rerun()
@@ -945,7 +975,7 @@ def create_invoice_form():
         
         # Get vendor list
         conn = get_db_connection()
-        vendors = pd.read_sql("SELECT vendor_id, vendor_name FROM vendors WHERE status = 'active' ORDER BY vendor_name", conn)
+        vendors = pd.read_sql(ACTIVE_VENDOR_OPTIONS_SQL, conn)
         conn.close()
         
         if vendors.empty:
@@ -982,24 +1012,26 @@ def create_invoice_form():
             else:
                 conn = get_db_connection()
                 
-                # Save file if uploaded
+                # Save file in the content-addressed store if uploaded
                 file_path = None
                 if uploaded_file:
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                    file_ext = os.path.splitext(uploaded_file.name)[1]
-                    file_path = os.path.join("uploads", f"invoice_{timestamp}{file_ext}")
-                    
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+                    file_path = store_blob(conn, uploaded_file, uploaded_file.name)
                 
-                # Insert invoice
-                conn.execute("""
-                    INSERT INTO invoices
-                    (vendor_id, invoice_number, invoice_date, due_date, amount, tax_amount, total_amount, description, status, invoice_file_path)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
-                """, (vendor_id, invoice_number, invoice_date, due_date, amount, tax_amount, total_amount, description, file_path))
-                conn.commit()
-                conn.close()
+                # Insert invoice; if it is not saved, drop the blob reference again
+                try:
+                    conn.execute("""
+                        INSERT INTO invoices
+                        (vendor_id, invoice_number, invoice_date, due_date, amount, tax_amount, total_amount, description, status, invoice_file_path)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?)
+                    """, (vendor_id, invoice_number, invoice_date, due_date, amount, tax_amount, total_amount, description, file_path))
+                    conn.commit()
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    release_blob(conn, file_path)
+                    st.error(f"Error creating invoice: {str(e)}")
+                    return
+                finally:
+                    conn.close()
                 
                 st.success(f"Invoice '{invoice_number}' created successfully!")
                 st.balloons()
@@ -1007,169 +1039,140 @@ def create_invoice_form():
 def import_invoices_from_tally():
     st.subheader("Import Invoices from Tally")
     
+    settings = load_settings()
+    
     st.write("""
-    This feature allows you to import pending bills from Tally ERP using ODBC connection. 
-    Ensure Tally is running and the ODBC driver is configured correctly.
+    This feature imports vendors and pending bills from Tally ERP. Only records created or altered 
+    in Tally since the last sync are fetched; the data source is configured under Settings > Tally Integration.
     """)
+    st.caption(f"Data source: {settings.get('tally_source', TALLY_SOURCES[0])}")
     
-    # Tally connection settings
-    with st.expander("Tally Connection Settings"):
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            tally_server = st.text_input("Tally Server", "localhost")
-        with col2:
-            tally_port = st.text_input("Tally Port", "9000")
-    
-    # Import buttons
+    # Import buttons; the sync itself runs on the background worker
     col1, col2 = st.columns(2)
     
     with col1:
         if st.button("Import Vendors from Tally"):
-            try:
-                from utils.tally_connector import TallyConnector
-                
-                tally = TallyConnector()
-                count = tally.sync_vendors()
-                
-                if count > 0:
-                    st.success(f"Successfully imported/updated {count} vendors from Tally.")
-                else:
-                    st.info("No new vendors found in Tally.")
-            except Exception as e:
-                st.error(f"Error importing vendors: {str(e)}")
+            conn = get_db_connection()
+            job_id = enqueue_job(conn, TALLY_SYNC_JOB, {"entities": ["vendors"]})
+            conn.close()
+            st.success(f"Vendor import queued as job #{job_id}.")
     
     with col2:
         if st.button("Import Pending Bills from Tally"):
-            try:
-                from utils.tally_connector import TallyConnector
-                
-                tally = TallyConnector()
-                count = tally.sync_invoices()
-                
-                if count > 0:
-                    st.success(f"Successfully imported {count} pending bills from Tally.")
-                else:
-                    st.info("No new pending bills found in Tally.")
-            except Exception as e:
-                st.error(f"Error importing bills: {str(e)}")
+            # Vendors first, so bills from new parties resolve
+            conn = get_db_connection()
+            job_id = enqueue_job(conn, TALLY_SYNC_JOB, {"entities": ["vendors", "invoices"]})
+            conn.close()
+            st.success(f"Bill import queued as job #{job_id}.")
+    
+    display_job_table(TALLY_SYNC_JOB, limit=5)
+    if st.button("Refresh Import Status"):
+        st.rerun()
     
-    # Last import status
+    # Sync run log
     st.divider()
     st.subheader("Import History")
     
-    # Display recent imports
     conn = get_db_connection()
-    imports = pd.read_sql("""
-        SELECT action, entity_type, COUNT(entity_id) as count, MAX(created_at) as last_import
-        FROM audit_logs
-        WHERE action LIKE 'import%'
-        GROUP BY action, entity_type
-        ORDER BY last_import DESC
-        LIMIT 5
-    """, conn)
+    runs = pd.read_sql(IMPORT_HISTORY_SQL, conn)
     conn.close()
     
-    if not imports.empty:
-        for i, row in imports.iterrows():
-            st.write(f"**{row['action'].title()}**: {row['count']} {row['entity_type']}s on {row['last_import']}")
+    if not runs.empty:
+        st.dataframe(
+            runs,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'started_at': "Started",
+                'entity': "Entity",
+                'source': "Source",
+                'status': "Status",
+                'watermark_from': "From ALTERID",
+                'watermark_to': "To ALTERID",
+                'rows_fetched': "Fetched",
+                'rows_inserted': "Inserted",
+                'rows_updated': "Updated",
+                'rows_skipped': "Skipped",
+                'duration_ms': st.column_config.NumberColumn("Duration (ms)", format="%.1f"),
+                'error': "Error",
+            }
+        )
     else:
         st.info("No import history found.")
 
 def display_create_payment_request_modal(invoice_ids):
     conn = get_db_connection()
+    selection = load_selection(conn, invoice_ids)
+    conn.close()
     
-    # Get invoices
-    invoices_str = ','.join(['?'] * len(invoice_ids))
-    invoices = pd.read_sql(f"""
-        SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number, 
-               i.invoice_date, i.due_date, i.total_amount, i.status
-        FROM invoices i
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        WHERE i.invoice_id IN ({invoices_str})
-    """, conn, params=invoice_ids)
-    
-    # Convert date columns
-    invoices['invoice_date'] = pd.to_datetime(invoices['invoice_date']).dt.strftime('%Y-%m-%d')
-    invoices['due_date'] = pd.to_datetime(invoices['due_date']).dt.strftime('%Y-%m-%d')
-    
-    # Get unique vendor IDs
-    vendor_ids = invoices['vendor_id'].unique()
-    
-    if len(vendor_ids) > 1:
-        st.sidebar.error("Payment request can only be created for invoices from the same vendor.")
-        st.session_state.create_payment_request = None
-        return
-    
-    vendor_name = invoices['vendor_name'].iloc[0]
+    batches = group_by_vendor(selection)
+    skipped = [inv for inv in selection if inv['skip_reason'] is not None]
     
     st.sidebar.title("Create Payment Request")
-    st.sidebar.subheader(f"Vendor: {vendor_name}")
     
-    # Display selected invoices
-    st.sidebar.write("Selected Invoices:")
+    if not batches:
+        st.sidebar.error("None of the selected invoices can be added to a payment request.")
+        for invoice in skipped:
+            st.sidebar.write(f"• {invoice['invoice_number']} ({invoice['vendor_name']}): {invoice['skip_reason']}")
+        if st.sidebar.button("Close"):
+            st.session_state.create_payment_request = None
+            st.rerun()
+        return
     
-    total_amount = 0
-    for i, invoice in invoices.iterrows():
-        st.sidebar.write(f"• {invoice['invoice_number']} - ${float(invoice['total_amount']):,.2f} (Due: {invoice['due_date']})")
-        total_amount += float(invoice['total_amount'])
+    # One payment request is created per vendor
+    summary = pd.DataFrame([
+        {
+            'vendor_name': invoices[0]['vendor_name'],
+            'invoices': len(invoices),
+            'total_cents': sum(inv['total_cents'] for inv in invoices),
+            'earliest_due': min(inv['due_date'] for inv in invoices),
+        }
+        for invoices in batches
+    ])
+    total_invoices = int(summary['invoices'].sum())
+    total_cents = int(summary['total_cents'].sum())
+    summary['total_amount'] = format_money(summary['total_cents'])
+    
+    st.sidebar.subheader(f"{len(batches)} vendor(s), {total_invoices} invoice(s)")
+    st.sidebar.dataframe(
+        summary[['vendor_name', 'invoices', 'total_amount', 'earliest_due']],
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'vendor_name': "Vendor",
+            'invoices': "Invoices",
+            'total_amount': "Total",
+            'earliest_due': "Earliest Due",
+        }
+    )
+    st.sidebar.write(f"**Total Amount: {format_money(total_cents)}**")
     
-    st.sidebar.write(f"**Total Amount: ${total_amount:,.2f}**")
+    if skipped:
+        with st.sidebar.expander(f"{len(skipped)} invoice(s) will be skipped"):
+            for invoice in skipped:
+                st.write(f"• {invoice['invoice_number']} ({invoice['vendor_name']}): {invoice['skip_reason']}")
     
     # Payment request form
     with st.sidebar.form("payment_request_form"):
         notes = st.text_area("Notes/Comments")
         
-        submitted = st.form_submit_button("Submit Payment Request")
+        submitted = st.form_submit_button(
+            "Submit Payment Request" if len(batches) == 1 else f"Submit {len(batches)} Payment Requests"
+        )
         
         if submitted:
+            conn = get_db_connection()
             try:
-                # Generate request number
-                timestamp = datetime.now().strftime("%Y%m%d%H%M")
-                request_number = f"PR{timestamp}"
-                
-                # Insert payment request
-                conn.execute("""
-                    INSERT INTO payment_requests
-                    (request_number, requested_by, notes, status)
-                    VALUES (?, ?, ?, 'pending')
-                """, (request_number, st.session_state.user['user_id'], notes))
-                
-                # Get the request ID
-                request_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-                
-                # Add invoices to the request
-                for invoice_id in invoice_ids:
-                    conn.execute("""
-                        INSERT INTO payment_request_items
-                        (request_id, invoice_id)
-                        VALUES (?, ?)
-                    """, (request_id, invoice_id))
-                    
-                    # Update invoice status
-                    conn.execute("""
-                        UPDATE invoices
-                        SET status = 'approved'
-                        WHERE invoice_id = ?
-                    """, (invoice_id,))
+                result = create_payment_requests(conn, invoice_ids, st.session_state.user['user_id'], notes)
                 
-                # Add audit log
-                conn.execute("""
-                    INSERT INTO audit_logs
-                    (user_id, action, entity_type, entity_id, details)
-                    VALUES (?, 'created', 'payment_request', ?, ?)
-                """, (st.session_state.user['user_id'], request_id, f"Created payment request for {len(invoice_ids)} invoices"))
-                
-                conn.commit()
-                st.sidebar.success("Payment request created successfully!")
-                st.sidebar.info(f"Request Number: {request_number}")
-                
-                # Clear selection
+                # Clear selection and show the outcome after the rerun
+                st.session_state.payment_batch_result = result
                 st.session_state.create_payment_request = None
+                st.session_state.selected_invoice_ids = set()
+                reset_grid("invoice_grid")
                 st.rerun()
             
-            except Exception as e:
-                conn.rollback()
+            except sqlite3.Error as e:
                 st.sidebar.error(f"Error creating payment request: {str(e)}")
             finally:
                 conn.close()
@@ -1179,31 +1182,56 @@ def display_create_payment_request_modal(invoice_ids):
         st.session_state.create_payment_request = None
         st.rerun()
 
+def display_payment_batch_result(result):
+    st.sidebar.title("Payment Requests Created")
+    
+    if not result['requests']:
+        st.sidebar.warning("No payment requests were created.")
+    else:
+        st.sidebar.success(
+            f"Created {len(result['requests'])} payment request(s) for {result['invoices']} invoice(s), "
+            f"{format_money(result['total_cents'])} in {result['seconds'] * 1000:,.1f} ms"
+        )
+        
+        # Per-vendor batch timings
+        batches = pd.DataFrame(result['requests'])
+        batches['ms'] = batches['seconds'] * 1000
+        batches['total_amount'] = format_money(batches['total_cents'])
+        st.sidebar.dataframe(
+            batches[['request_number', 'vendor_name', 'invoices', 'total_amount', 'ms']],
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'request_number': "Request #",
+                'vendor_name': "Vendor",
+                'invoices': "Invoices",
+                'total_amount': "Total",
+                'ms': st.column_config.NumberColumn("Time (ms)", format="%.2f"),
+            }
+        )
+    
+    if result['skipped']:
+        with st.sidebar.expander(f"{len(result['skipped'])} invoice(s) skipped"):
+            for invoice in result['skipped']:
+                st.write(f"• {invoice['invoice_number']} ({invoice['vendor_name']}): {invoice['reason']}")
+    
+    if st.sidebar.button("Dismiss"):
+        st.session_state.payment_batch_result = None
+        st.rerun()
+
 # Payment Requests Page
 def display_payment_requests():
     st.title("Payment Requests")
     
     # Get payment requests
     conn = get_db_connection()
-    payment_requests = pd.read_sql("""
-        SELECT pr.request_id, pr.request_number, pr.requested_at, 
-               u1.full_name as requested_by, pr.status,
-               u2.full_name as approved_by, pr.approved_at, pr.notes,
-               COUNT(pri.invoice_id) as invoice_count,
-               SUM(i.total_amount) as total_amount
-        FROM payment_requests pr
-        JOIN users u1 ON pr.requested_by = u1.user_id
-        LEFT JOIN users u2 ON pr.approved_by = u2.user_id
-        JOIN payment_request_items pri ON pr.request_id = pri.request_id
-        JOIN invoices i ON pri.invoice_id = i.invoice_id
-        GROUP BY pr.request_id
-        ORDER BY pr.requested_at DESC
-    """, conn)
+    payment_requests = pd.read_sql(PAYMENT_REQUEST_LIST_SQL, conn)
     conn.close()
     
     # Convert date columns
     payment_requests['requested_at'] = pd.to_datetime(payment_requests['requested_at']).dt.strftime('%Y-%m-%d %H:%M')
     payment_requests['approved_at'] = payment_requests['approved_at'].apply(lambda x: pd.to_datetime(x).strftime('%Y-%m-%d %H:%M') if x else "")
+    payment_requests['amount_text'] = format_money(payment_requests['total_cents'])
     
     # Status filter
     status_filter = st.multiselect(
@@ -1233,7 +1261,7 @@ def display_payment_requests():
         
         with col3:
             st.write(f"**Invoices:** {pr['invoice_count']}")
-            st.write(f"**Amount:** ${float(pr['total_amount']):,.2f}")
+            st.write(f"**Amount:** {pr['amount_text']}")
         
         with col4:
             if st.button("View", key=f"view_pr_{pr['request_id']}"):
@@ -1259,30 +1287,21 @@ def display_payment_request_details(request_id):
     """, (request_id,)).fetchone()
     
     # Get invoices in this request
-    invoices = pd.read_sql("""
-        SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number, 
-               i.invoice_date, i.due_date, i.total_amount
-        FROM payment_request_items pri
-        JOIN invoices i ON pri.invoice_id = i.invoice_id
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        WHERE pri.request_id = ?
-    """, conn, params=(request_id,))
+    invoices = pd.read_sql(PAYMENT_REQUEST_ITEMS_SQL, conn, params=(request_id,))
     
     # Convert date columns
     invoices['invoice_date'] = pd.to_datetime(invoices['invoice_date']).dt.strftime('%Y-%m-%d')
     invoices['due_date'] = pd.to_datetime(invoices['due_date']).dt.strftime('%Y-%m-%d')
+    invoices['amount_text'] = format_money(invoices['total_cents'])
     
     # Get payment advices
-    payment_advices = pd.read_sql("""
-        SELECT * FROM payment_advices
-        WHERE request_id = ?
-        ORDER BY generated_at DESC
-    """, conn, params=(request_id,))
+    payment_advices = pd.read_sql(PAYMENT_REQUEST_ADVICES_SQL, conn, params=(request_id,))
     
     # Convert advice date columns
     if not payment_advices.empty:
         payment_advices['generated_at'] = pd.to_datetime(payment_advices['generated_at']).dt.strftime('%Y-%m-%d %H:%M')
         payment_advices['payment_date'] = pd.to_datetime(payment_advices['payment_date']).dt.strftime('%Y-%m-%d')
+        payment_advices['amount_text'] = format_money(payment_advices['total_cents'])
     
     conn.close()
     
@@ -1305,12 +1324,10 @@ def display_payment_request_details(request_id):
         # Invoices section
         st.sidebar.subheader("Invoices")
         
-        total_amount = 0
         for i, invoice in invoices.iterrows():
-            st.sidebar.write(f"• {invoice['invoice_number']} - ${float(invoice['total_amount']):,.2f} (Due: {invoice['due_date']})")
-            total_amount += float(invoice['total_amount'])
+            st.sidebar.write(f"• {invoice['invoice_number']} - {invoice['amount_text']} (Due: {invoice['due_date']})")
         
-        st.sidebar.write(f"**Total Amount: ${total_amount:,.2f}**")
+        st.sidebar.write(f"**Total Amount: {format_money(invoices['total_cents'].sum())}**")
         
         # Actions section
         st.sidebar.subheader("Actions")
@@ -1355,13 +1372,7 @@ def display_payment_request_details(request_id):
                         """, (st.session_state.user['user_id'], rejection_reason, request_id))
                         
                         # Update invoice status back to pending
-                        conn.execute("""
-                            UPDATE invoices
-                            SET status = 'pending'
-                            WHERE invoice_id IN (
-                                SELECT invoice_id FROM payment_request_items WHERE request_id = ?
-                            )
-                        """, (request_id,))
+                        conn.execute(REJECT_REQUEST_INVOICES_SQL, (request_id,))
                         
                         # Add audit log
                         conn.execute("""
@@ -1376,82 +1387,125 @@ def display_payment_request_details(request_id):
                         st.sidebar.error("Payment request rejected!")
                         st.rerun()
         
-        # Generate payment advice (for accountants after approval)
-        if payment_request['status'] == 'approved' and st.session_state.user_role in ['admin', 'accountant']:
+        # Generate payment advice (for accountants after approval) on the background worker
+        advice_job_key = f"advice_job_{request_id}"
+        if (payment_request['status'] == 'approved' and st.session_state.user_role in ['admin', 'accountant']
+                and not st.session_state.get(advice_job_key)):
             if st.sidebar.button("Generate Payment Advice", key=f"generate_advice_{request_id}"):
-                try:
-                    from utils.excel_generator import ExcelReportGenerator
-                    
-                    # Generate payment advice
-                    generator = ExcelReportGenerator()
-                    success, result = generator.generate_payment_advice(request_id)
-                    
-                    if success:
-                        # Create payment advice record
-                        advice_number = f"PA{datetime.now().strftime('%Y%m%d%H%M')}"
-                        
-                        conn = get_db_connection()
-                        conn.execute("""
-                            INSERT INTO payment_advices
-                            (request_id, advice_number, total_amount, generated_at, payment_date, status)
-                            VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?, 'pending')
-                        """, (request_id, advice_number, total_amount, datetime.now().date()))
-                        
-                        # Update payment request status
-                        conn.execute("""
-                            UPDATE payment_requests
-                            SET status = 'processed'
-                            WHERE request_id = ?
-                        """, (request_id,))
-                        
-                        conn.commit()
-                        conn.close()
-                        
-                        # Download button for advice
-                        with open(result, "rb") as file:
-                            st.sidebar.download_button(
-                                label="Download Payment Advice",
-                                data=file,
-                                file_name=os.path.basename(result),
-                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                            )
-                        
-                        st.sidebar.success("Payment advice generated successfully!")
-                        st.rerun()
-                    else:
-                        st.sidebar.error(f"Error generating payment advice: {result}")
-                
-                except Exception as e:
-                    st.sidebar.error(f"Error: {str(e)}")
+                conn = get_db_connection()
+                st.session_state[advice_job_key] = enqueue_job(
+                    conn, PAYMENT_ADVICE_JOB, {"request_id": int(request_id)}, max_attempts=2
+                )
+                conn.close()
+        
+        advice_pending = display_report_job(advice_job_key, "Download Payment Advice", sidebar=True)
         
         # Payment advices history
         if not payment_advices.empty:
             st.sidebar.subheader("Payment Advices")
             
+            # Advice files from the artifact registry in one lookup
+            conn = get_db_connection()
+            advice_files = entity_artifacts(conn, 'payment_advice', payment_advices['advice_id'])
+            conn.close()
+            
             for i, advice in payment_advices.iterrows():
-                st.sidebar.write(f"• {advice['advice_number']} - ${float(advice['total_amount']):,.2f} ({advice['generated_at']})")
-                
-                # Find the file
-                advice_file = None
-                for file in os.listdir("reports"):
-                    if advice['advice_number'] in file:
-                        advice_file = os.path.join("reports", file)
-                        break
+                st.sidebar.write(f"• {advice['advice_number']} - {advice['amount_text']} ({advice['generated_at']})")
                 
-                if advice_file and os.path.exists(advice_file):
-                    with open(advice_file, "rb") as file:
-                        st.sidebar.download_button(
-                            label="Download",
-                            data=file,
-                            file_name=os.path.basename(advice_file),
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            key=f"download_advice_{advice['advice_id']}"
-                        )
+                if advice['advice_id'] in advice_files:
+                    artifact_download_button(
+                        advice_files[advice['advice_id']],
+                        "Download",
+                        f"download_advice_{advice['advice_id']}",
+                        st.sidebar
+                    )
         
         # Close button
         if st.sidebar.button("Close"):
             st.session_state.view_payment_request_id = None
             st.rerun()
+        
+        # Poll until the advice job finishes
+        if advice_pending:
+            time.sleep(REPORT_POLL_SECONDS)
+            st.rerun()
+
+def display_report_job(session_key, download_label, sidebar=False):
+    """Progress of the report job stored under session_key, then its download.
+
+    Returns True while the job is still queued or running so the caller
+    can poll with a rerun once the rest of the page has rendered.
+    """
+    job_id = st.session_state.get(session_key)
+    if not job_id:
+        return False
+    
+    conn = get_db_connection()
+    job = conn.execute("""
+        SELECT status, attempts, progress, progress_message, result, error
+        FROM jobs WHERE job_id = ?
+    """, (job_id,)).fetchone()
+    conn.close()
+    
+    target = st.sidebar if sidebar else st
+    
+    if job is None:
+        del st.session_state[session_key]
+        return False
+    
+    if job['status'] in ('queued', 'running'):
+        if job['status'] == 'queued' and job['attempts']:
+            message = "Retrying after an error..."
+        elif job['status'] == 'queued':
+            message = "Waiting for a free report worker..."
+        else:
+            message = job['progress_message'] or "Generating..."
+        target.progress(job['progress'] or 0.0, text=f"Job #{job_id}: {message}")
+        return True
+    
+    if job['status'] == 'succeeded':
+        result = json.loads(job['result'])
+        if result.get('skipped'):
+            target.info(result['skipped'])
+        else:
+            conn = get_db_connection()
+            artifact = get_artifact(conn, result['artifact_id'])
+            conn.close()
+            target.success(f"Report generated ({artifact['size'] / 1024:,.0f} KB).")
+            artifact_download_button(artifact, download_label, f"download_{session_key}", target)
+    else:
+        target.error(f"Error generating report: {(job['error'] or job['status']).splitlines()[0]}")
+    
+    if target.button("Dismiss", key=f"dismiss_{session_key}"):
+        del st.session_state[session_key]
+        st.rerun()
+    
+    return False
+
+def deferred_download_button(label, key, load, file_name, mime, target=st):
+    """Download button whose bytes, from load(), are only read once the user asks for them"""
+    if st.session_state.get('download_key') != key:
+        if target.button(label, key=key):
+            st.session_state.download_key = key
+            st.rerun()
+        return
+    
+    data = load()
+    if data is None:
+        target.warning(f"{file_name} is no longer available.")
+        return
+    
+    target.download_button(
+        label=f"Save {file_name}",
+        data=data,
+        file_name=file_name,
+        mime=mime,
+        key=f"{key}_save"
+    )
+
+def artifact_download_button(artifact, label, key, target=st):
+    """Download button for a registered report or advice"""
+    deferred_download_button(label, key, lambda: read_artifact(artifact), artifact['file_name'], artifact['content_type'], target)
 
 # Payment Approvals Page
 def display_payment_approvals():
@@ -1459,62 +1513,86 @@ def display_payment_approvals():
     
     # Get pending payment requests
     conn = get_db_connection()
-    payment_requests = pd.read_sql("""
-        SELECT pr.request_id, pr.request_number, pr.requested_at, 
-               u1.full_name as requested_by, pr.status, pr.notes,
-               COUNT(pri.invoice_id) as invoice_count,
-               SUM(i.total_amount) as total_amount,
-               MIN(v.vendor_name) as vendor_name
-        FROM payment_requests pr
-        JOIN users u1 ON pr.requested_by = u1.user_id
-        JOIN payment_request_items pri ON pr.request_id = pri.request_id
-        JOIN invoices i ON pri.invoice_id = i.invoice_id
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        WHERE pr.status = 'pending'
-        GROUP BY pr.request_id
-        ORDER BY pr.requested_at ASC
-    """, conn)
+    payment_requests = pd.read_sql(PENDING_APPROVALS_SQL, conn)
+    
+    # Invoice lines of every pending request in one query, grouped below
+    request_invoices = pd.read_sql(PENDING_APPROVAL_INVOICES_SQL, conn)
     conn.close()
     
     # Convert date columns
     payment_requests['requested_at'] = pd.to_datetime(payment_requests['requested_at']).dt.strftime('%Y-%m-%d %H:%M')
+    payment_requests['amount_text'] = format_money(payment_requests['total_cents'])
+    request_invoices['invoice_date'] = pd.to_datetime(request_invoices['invoice_date']).dt.strftime('%Y-%m-%d')
+    request_invoices['due_date'] = pd.to_datetime(request_invoices['due_date']).dt.strftime('%Y-%m-%d')
+    request_invoices['total_amount'] = format_money(request_invoices['total_cents'])
+    invoices_by_request = dict(tuple(request_invoices.groupby('request_id')))
+    
+    # Outcome of the last approve/reject, shown after the rerun
+    if st.session_state.get('approval_result'):
+        action, numbers = st.session_state.approval_result
+        st.session_state.approval_result = None
+        if action == 'approved':
+            st.success(f"Approved {len(numbers)} payment request(s): {', '.join(numbers)}")
+        else:
+            st.error(f"Rejected {len(numbers)} payment request(s): {', '.join(numbers)}")
     
     if payment_requests.empty:
         st.info("No pending payment requests requiring approval.")
     else:
         st.write(f"You have {len(payment_requests)} payment requests pending approval.")
         
-        # Display payment requests
-        for i, pr in payment_requests.iterrows():
-            with st.expander(f"Request #{pr['request_number']} - {pr['vendor_name']} - ${float(pr['total_amount']):,.2f}"):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write(f"**Request Number:** {pr['request_number']}")
-                    st.write(f"**Requested By:** {pr['requested_by']}")
+        # Bulk actions
+        labels = {
+            pr['request_id']: f"{pr['request_number']} - {pr['vendor_name']} - {pr['amount_text']}"
+            for _, pr in payment_requests.iterrows()
+        }
+        selected_requests = st.multiselect(
+            "Select payment requests",
+            options=list(labels),
+            format_func=labels.get,
+            key="approval_selection"
+        )
+        
+        if selected_requests:
+            selected_total = payment_requests.loc[payment_requests['request_id'].isin(selected_requests), 'total_cents'].sum()
+            st.write(f"Selected {len(selected_requests)} requests, {format_money(selected_total)}")
+            
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                if st.button("Approve Selected", type="primary"):
+                    apply_approval_action('approved', selected_requests)
+            
+            with col2:
+                bulk_reason = st.text_input("Rejection Reason", key="bulk_rejection_reason")
+                if st.button("Reject Selected"):
+                    if not bulk_reason:
+                        st.error("Please enter a rejection reason.")
+                    else:
+                        apply_approval_action('rejected', selected_requests, bulk_reason)
+        
+        st.divider()
+        
+        # Display payment requests
+        for i, pr in payment_requests.iterrows():
+            with st.expander(f"Request #{pr['request_number']} - {pr['vendor_name']} - {pr['amount_text']}"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    st.write(f"**Request Number:** {pr['request_number']}")
+                    st.write(f"**Requested By:** {pr['requested_by']}")
                     st.write(f"**Requested At:** {pr['requested_at']}")
                     st.write(f"**Vendor:** {pr['vendor_name']}")
                 
                 with col2:
                     st.write(f"**Invoices:** {pr['invoice_count']}")
-                    st.write(f"**Total Amount:** ${float(pr['total_amount']):,.2f}")
+                    st.write(f"**Total Amount:** {pr['amount_text']}")
                     
                     if pr['notes']:
                         st.write(f"**Notes:** {pr['notes']}")
                 
-                # Get invoices in this request
-                conn = get_db_connection()
-                invoices = pd.read_sql("""
-                    SELECT i.invoice_id, i.invoice_number, i.invoice_date, i.due_date, i.total_amount
-                    FROM payment_request_items pri
-                    JOIN invoices i ON pri.invoice_id = i.invoice_id
-                    WHERE pri.request_id = ?
-                """, conn, params=(pr['request_id'],))
-                conn.close()
-                
-                # Convert date columns
-                invoices['invoice_date'] = pd.to_datetime(invoices['invoice_date']).dt.strftime('%Y-%m-%d')
-                invoices['due_date'] = pd.to_datetime(invoices['due_date']).dt.strftime('%Y-%m-%d')
+                # Invoices in this request
+                invoices = invoices_by_request.get(pr['request_id'], request_invoices.iloc[0:0])
                 
                 # Display invoices
                 st.subheader("Invoices")
@@ -1528,62 +1606,37 @@ def display_payment_approvals():
                 
                 with col1:
                     if st.button("Approve", key=f"approve_{pr['request_id']}"):
-                        conn = get_db_connection()
-                        conn.execute("""
-                            UPDATE payment_requests
-                            SET status = 'approved', approved_by = ?, approved_at = CURRENT_TIMESTAMP
-                            WHERE request_id = ?
-                        """, (st.session_state.user['user_id'], pr['request_id']))
-                        
-                        # Add audit log
-                        conn.execute("""
-                            INSERT INTO audit_logs
-                            (user_id, action, entity_type, entity_id, details)
-                            VALUES (?, 'approved', 'payment_request', ?, ?)
-                        """, (st.session_state.user['user_id'], pr['request_id'], f"Approved payment request {pr['request_number']}"))
-                        
-                        conn.commit()
-                        conn.close()
-                        
-                        st.success(f"Payment request #{pr['request_number']} approved!")
-                        st.rerun()
+                        apply_approval_action('approved', [pr['request_id']])
                 
                 with col2:
+                    rejection_reason = st.text_input("Rejection Reason", key=f"reason_{pr['request_id']}")
+                    
                     if st.button("Reject", key=f"reject_{pr['request_id']}"):
-                        rejection_reason = st.text_area("Rejection Reason", key=f"reason_{pr['request_id']}")
-                        
-                        if st.button("Confirm Rejection", key=f"confirm_reject_{pr['request_id']}"):
-                            conn = get_db_connection()
-                            conn.execute("""
-                                UPDATE payment_requests
-                                SET status = 'rejected', approved_by = ?, approved_at = CURRENT_TIMESTAMP,
-                                    rejection_reason = ?
-                                WHERE request_id = ?
-                            """, (st.session_state.user['user_id'], rejection_reason, pr['request_id']))
-                            
-                            # Update invoice status back to pending
-                            conn.execute("""
-                                UPDATE invoices
-                                SET status = 'pending'
-                                WHERE invoice_id IN (
-                                    SELECT invoice_id FROM payment_request_items WHERE request_id = ?
-                                )
-                            """, (pr['request_id'],))
-                            
-                            # Add audit log
-                            conn.execute("""
-                                INSERT INTO audit_logs
-                                (user_id, action, entity_type, entity_id, details)
-                                VALUES (?, 'rejected', 'payment_request', ?, ?)
-                            """, (st.session_state.user['user_id'], pr['request_id'], f"Rejected payment request {pr['request_number']}"))
-                            
-                            conn.commit()
-                            conn.close()
-                            
-                            st.error(f"Payment request #{pr['request_number']} rejected!")
-                            st.rerun()
+                        if not rejection_reason:
+                            st.error("Please enter a rejection reason.")
+                        else:
+                            apply_approval_action('rejected', [pr['request_id']], rejection_reason)
+
+def apply_approval_action(action, request_ids, reason=None):
+    """Approve or reject payment requests in one transaction and rerun"""
+    conn = get_db_connection()
+    try:
+        if action == 'approved':
+            numbers = approve_payment_requests(conn, request_ids, st.session_state.user['user_id'])
+        else:
+            numbers = reject_payment_requests(conn, request_ids, st.session_state.user['user_id'], reason)
+    except sqlite3.Error as e:
+        st.error(f"Error updating payment requests: {str(e)}")
+        return
+    finally:
+        conn.close()
+    
+    st.session_state.approval_result = (action, numbers)
+    del st.session_state['approval_selection']
+    st.rerun()
 
 # Reports Page
+@traced()
 def display_reports():
     st.title("Reports & Analytics")
     
@@ -1608,182 +1661,175 @@ def display_reports():
     elif report_type == "Monthly Trend":
         display_monthly_trend_report()
 
+def display_report_freshness(conn):
+    """Caption saying when the report's data was read, with a button to queue a new snapshot"""
+    as_of = datetime.fromtimestamp(conn.as_of).strftime('%Y-%m-%d %H:%M:%S')
+    if conn.live:
+        if report_staleness() > 0:
+            st.caption(f"Live data as of {as_of}; reports switch to a snapshot once the first one is taken.")
+        else:
+            st.caption(f"Live data as of {as_of}")
+        return
+    
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.caption(
+            f"Report data as of {as_of}. Reports read a snapshot of the database, "
+            f"refreshed in the background every {report_staleness() // 60} minutes."
+        )
+    with col2:
+        if st.button("Refresh Data", key="refresh_report_data"):
+            conn = get_db_connection()
+            request_snapshot(conn)
+            conn.close()
+            st.info("A new snapshot is being taken; reload the report in a moment.")
+
+@traced()
 def display_aging_report():
     st.subheader("Accounts Payable Aging Report")
     
     # Date selection
     as_of_date = st.date_input("As of Date", datetime.now().date())
     
-    # Generate report button
+    # Generate report button; the workbook is built on the background worker
     if st.button("Generate Report"):
-        try:
-            from utils.excel_generator import ExcelReportGenerator
-            
-            generator = ExcelReportGenerator()
-            success, result = generator.generate_aging_report(as_of_date.strftime("%Y-%m-%d"))
-            
-            if success:
-                # Download button for report
-                with open(result, "rb") as file:
-                    st.download_button(
-                        label="Download Aging Report",
-                        data=file,
-                        file_name=os.path.basename(result),
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                
-                st.success("Aging report generated successfully!")
-            else:
-                st.error(f"Error generating report: {result}")
-        
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
+        conn = get_db_connection()
+        st.session_state.aging_report_job = enqueue_job(
+            conn, AGING_JOB, {"as_of_date": as_of_date.strftime("%Y-%m-%d")}, max_attempts=2
+        )
+        conn.close()
     
-    # Display aging data
-    conn = get_db_connection()
-    invoices = pd.read_sql("""
-        SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number, 
-               i.invoice_date, i.due_date, i.total_amount, i.status
-        FROM invoices i
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        WHERE i.status IN ('pending', 'approved')
-    """, conn)
-    conn.close()
+    report_pending = display_report_job('aging_report_job', "Download Aging Report")
     
-    if not invoices.empty:
-        # Convert date columns
-        invoices['invoice_date'] = pd.to_datetime(invoices['invoice_date'])
-        invoices['due_date'] = pd.to_datetime(invoices['due_date'])
-        
-        # Calculate days overdue - Fixed
-        invoices['due_date_obj'] = invoices['due_date'].dt.date  # Get date objects
-        invoices['days_overdue'] = invoices['due_date_obj'].apply(lambda x: (as_of_date - x).days)
-        
-        # Rest of your aging report function...
-        
-        # Create aging buckets
-        conditions = [
-            (invoices['days_overdue'] <= 0),
-            (invoices['days_overdue'] > 0) & (invoices['days_overdue'] <= 30),
-            (invoices['days_overdue'] > 30) & (invoices['days_overdue'] <= 60),
-            (invoices['days_overdue'] > 60) & (invoices['days_overdue'] <= 90),
-            (invoices['days_overdue'] > 90)
-        ]
-        
-        choices = ['Current', '1-30 Days', '31-60 Days', '61-90 Days', 'Over 90 Days']
-        invoices['aging_bucket'] = np.select(conditions, choices, default='Current')
-        
-        # Group by aging bucket
-        aging_summary = invoices.groupby('aging_bucket').agg(
-            count=('invoice_id', 'count'),
-            total=('total_amount', 'sum')
-        ).reset_index()
-        
-        # Sort buckets
-        bucket_order = {
-            'Current': 0,
-            '1-30 Days': 1,
-            '31-60 Days': 2,
-            '61-90 Days': 3,
-            'Over 90 Days': 4
-        }
-        aging_summary['bucket_order'] = aging_summary['aging_bucket'].map(bucket_order)
-        aging_summary = aging_summary.sort_values('bucket_order').drop('bucket_order', axis=1)
+    # Display aging data from the per-vendor, per-due-date summary; the summary and
+    # the details below read the same report snapshot
+    conn = get_report_connection()
+    aging_df = pd.read_sql(AGING_SUMMARY_SQL, conn)
+    display_report_freshness(conn)
+    
+    if not aging_df.empty:
+        # Bucket each due date as of the selected date; totals are summed in cents
+        with span("age invoices"):
+            _, _, aging_summary = age_invoices(
+                aging_df, as_of_date, amount_col='total_cents', count_col='invoice_count'
+            )
+        aging_summary['amount'] = to_dollars(aging_summary['total'])
         
         # Display summary chart
         fig = px.pie(
             aging_summary, 
-            values='total', 
+            values='amount', 
             names='aging_bucket',
             title='Accounts Payable Aging Summary',
             color='aging_bucket',
-            color_discrete_map={
-                'Current': '#28a745',
-                '1-30 Days': '#ffc107',
-                '31-60 Days': '#fd7e14',
-                '61-90 Days': '#dc3545',
-                'Over 90 Days': '#6c757d'
-            }
+            color_discrete_map=AGING_COLORS
         )
         st.plotly_chart(fig)
         
         # Display data table
         st.subheader("Aging Summary")
-        aging_summary['count'] = aging_summary['count'].apply(lambda x: f"{x}")
-        aging_summary['total'] = aging_summary['total'].apply(lambda x: f"${x:,.2f}")
         st.dataframe(
-            aging_summary.rename(columns={'aging_bucket': 'Aging Bucket', 'count': 'Invoice Count', 'total': 'Total Amount'}),
+            pd.DataFrame({
+                'Aging Bucket': aging_summary['aging_bucket'],
+                'Invoice Count': aging_summary['count'],
+                'Total Amount': format_money(aging_summary['total'])
+            }),
             hide_index=True
         )
         
         # Display detailed data
         st.subheader("Invoice Details")
         
-        # Format for display
-        invoices['invoice_date'] = invoices['invoice_date'].dt.strftime('%Y-%m-%d')
-        invoices['due_date'] = invoices['due_date'].dt.strftime('%Y-%m-%d')
-        invoices['total_amount'] = invoices['total_amount'].apply(lambda x: f"${x:,.2f}")
-        
-        display_cols = ['vendor_name', 'invoice_number', 'invoice_date', 'due_date', 'days_overdue', 'aging_bucket', 'total_amount', 'status']
-        
         # Add filter for aging bucket
         selected_bucket = st.multiselect(
             "Filter by Aging Bucket",
-            options=choices,
-            default=choices
+            options=AGING_LABELS,
+            default=AGING_LABELS
         )
         
-        filtered_invoices = invoices[invoices['aging_bucket'].isin(selected_bucket)]
+        # Translate the selected buckets into due date ranges so the filter runs in SQL
+        detail_limit = 500
+        detail_query = aging_details_query(bucket_due_ranges(as_of_date), selected_bucket, detail_limit)
         
-        st.dataframe(
-            filtered_invoices[display_cols].rename(columns={
-                'vendor_name': 'Vendor',
-                'invoice_number': 'Invoice #',
-                'invoice_date': 'Invoice Date',
-                'due_date': 'Due Date',
-                'days_overdue': 'Days Overdue',
-                'aging_bucket': 'Aging Bucket',
-                'total_amount': 'Amount',
-                'status': 'Status'
-            }),
-            hide_index=True
-        )
+        if detail_query:
+            sql, params = detail_query
+            filtered_invoices = pd.read_sql(sql, conn, params=params)
+            
+            # Format for display
+            days, bucket_index, _ = age_invoices(filtered_invoices, as_of_date, amount_col='total_cents')
+            filtered_invoices['days_overdue'] = days
+            filtered_invoices['aging_bucket'] = bucket_labels(bucket_index)
+            filtered_invoices['invoice_date'] = pd.to_datetime(filtered_invoices['invoice_date']).dt.strftime('%Y-%m-%d')
+            filtered_invoices['due_date'] = pd.to_datetime(filtered_invoices['due_date']).dt.strftime('%Y-%m-%d')
+            filtered_invoices['total_amount'] = format_money(filtered_invoices['total_cents'])
+            
+            display_cols = ['vendor_name', 'invoice_number', 'invoice_date', 'due_date', 'days_overdue', 'aging_bucket', 'total_amount', 'status']
+            
+            st.dataframe(
+                filtered_invoices[display_cols].rename(columns={
+                    'vendor_name': 'Vendor',
+                    'invoice_number': 'Invoice #',
+                    'invoice_date': 'Invoice Date',
+                    'due_date': 'Due Date',
+                    'days_overdue': 'Days Overdue',
+                    'aging_bucket': 'Aging Bucket',
+                    'total_amount': 'Amount',
+                    'status': 'Status'
+                }),
+                hide_index=True
+            )
+            
+            if len(filtered_invoices) == detail_limit:
+                st.caption(f"Showing the {detail_limit} oldest invoices; export the aging report for the full list.")
     else:
         st.info("No pending invoices found.")
+    
+    conn.close()
+    
+    # Poll until the report job finishes
+    if report_pending:
+        time.sleep(REPORT_POLL_SECONDS)
+        st.rerun()
 
+@traced()
 def display_vendor_summary_report():
     st.subheader("Vendor Summary Report")
     
-    # Get vendor summary data
-    conn = get_db_connection()
-    vendor_summary = pd.read_sql("""
-        SELECT v.vendor_id, v.vendor_name,
-               COUNT(i.invoice_id) as total_invoices,
-               SUM(CASE WHEN i.status = 'paid' THEN 1 ELSE 0 END) as paid_invoices,
-               SUM(CASE WHEN i.status IN ('pending', 'approved') THEN 1 ELSE 0 END) as pending_invoices,
-               SUM(CASE WHEN i.status = 'paid' THEN i.total_amount ELSE 0 END) as paid_amount,
-               SUM(CASE WHEN i.status IN ('pending', 'approved') THEN i.total_amount ELSE 0 END) as pending_amount
-        FROM vendors v
-        LEFT JOIN invoices i ON v.vendor_id = i.vendor_id
-        WHERE v.status = 'active'
-        GROUP BY v.vendor_id, v.vendor_name
-        ORDER BY pending_amount DESC
-    """, conn)
+    # Roll the report cube up to active vendors, all months
+    conn = get_report_connection()
+    cube = get_cube(conn)
     conn.close()
+    display_report_freshness(conn)
+    
+    active_vendors = cube.vendor_ids[cube.vendor_active]
+    all_statuses = cube.rollup(("vendor",), vendors=active_vendors, drop_empty=False)
+    paid = cube.rollup(("vendor",), vendors=active_vendors, statuses=["paid"], drop_empty=False)
+    pending = cube.rollup(("vendor",), vendors=active_vendors, statuses=OPEN_STATUSES, drop_empty=False)
+    vendor_summary = pd.DataFrame({
+        'vendor_id': all_statuses['vendor'],
+        'vendor_name': all_statuses['vendor_name'],
+        'total_invoices': all_statuses['invoice_count'],
+        'paid_invoices': paid['invoice_count'],
+        'pending_invoices': pending['invoice_count'],
+        'paid_cents': paid['total_cents'],
+        'pending_cents': pending['total_cents']
+    }).sort_values('pending_cents', ascending=False, kind='stable', ignore_index=True)
     
     if not vendor_summary.empty:
-        # Create totals row
+        # Create totals row; amounts stay integer cents
+        top_vendors = vendor_summary.head(10)
         totals = vendor_summary.sum(numeric_only=True)
         totals['vendor_name'] = 'TOTAL'
         vendor_summary = pd.concat([vendor_summary, pd.DataFrame([totals])], ignore_index=True)
+        vendor_summary['paid_amount'] = to_dollars(vendor_summary['paid_cents'])
+        vendor_summary['pending_amount'] = to_dollars(vendor_summary['pending_cents'])
         
-        # Format currency columns
-        vendor_summary['paid_amount'] = vendor_summary['paid_amount'].apply(lambda x: f"${x:,.2f}")
-        vendor_summary['pending_amount'] = vendor_summary['pending_amount'].apply(lambda x: f"${x:,.2f}")
-        
-        # Display summary table
+        # Display summary table, with the amounts formatted for display only
         st.dataframe(
-            vendor_summary[['vendor_name', 'total_invoices', 'paid_invoices', 'pending_invoices', 'paid_amount', 'pending_amount']].rename(columns={
+            vendor_summary[['vendor_name', 'total_invoices', 'paid_invoices', 'pending_invoices']].assign(
+                paid_amount=format_money(vendor_summary['paid_cents']),
+                pending_amount=format_money(vendor_summary['pending_cents'])
+            ).rename(columns={
                 'vendor_name': 'Vendor',
                 'total_invoices': 'Total Invoices',
                 'paid_invoices': 'Paid Invoices',
@@ -1794,14 +1840,14 @@ def display_vendor_summary_report():
             hide_index=True
         )
         
-        # Bar chart of top vendors by pending amount
-        top_vendors = vendor_summary[vendor_summary['vendor_name'] != 'TOTAL'].sort_values('pending_amount', key=lambda x: pd.to_numeric(x.str.replace('[$,]', '', regex=True)), ascending=False).head(10)
-        
+        # Bar chart of top vendors by pending amount (already sorted above)
         fig = px.bar(
-            top_vendors,
+            top_vendors.assign(
+                pending_amount=to_dollars(top_vendors['pending_cents']),
+                paid_amount=to_dollars(top_vendors['paid_cents'])
+            ),
             x='vendor_name',
-            y=[pd.to_numeric(top_vendors['pending_amount'].str.replace('[$,]', '', regex=True)), 
-               pd.to_numeric(top_vendors['paid_amount'].str.replace('[$,]', '', regex=True))],
+            y=['pending_amount', 'paid_amount'],
             title='Top 10 Vendors by Outstanding Amount',
             labels={'vendor_name': 'Vendor', 'value': 'Amount ($)', 'variable': 'Type'},
             barmode='group'
@@ -1844,6 +1890,11 @@ def display_vendor_summary_report():
             os.makedirs("reports", exist_ok=True)
             wb.save(filepath)
             
+            conn = get_db_connection()
+            register_artifact(conn, filepath, "vendor_summary")
+            conn.commit()
+            conn.close()
+            
             # Download button
             with open(filepath, "rb") as f:
                 st.download_button(
@@ -1856,6 +1907,7 @@ def display_vendor_summary_report():
     else:
         st.info("No vendor data found.")
 
+@traced()
 def display_payment_history_report():
     st.subheader("Payment History Report")
     
@@ -1867,37 +1919,25 @@ def display_payment_history_report():
         end_date = st.date_input("End Date", datetime.now().date())
     
     # Get payment history data
-    conn = get_db_connection()
+    conn = get_report_connection()
     
-    payment_history = pd.read_sql("""
-        SELECT pa.advice_number, pa.generated_at, pa.payment_date, pa.total_amount,
-               pr.request_number, u.full_name as approved_by,
-               COUNT(pri.invoice_id) as invoice_count,
-               GROUP_CONCAT(DISTINCT v.vendor_name) as vendor_names
-        FROM payment_advices pa
-        JOIN payment_requests pr ON pa.request_id = pr.request_id
-        JOIN users u ON pr.approved_by = u.user_id
-        JOIN payment_request_items pri ON pr.request_id = pri.request_id
-        JOIN invoices i ON pri.invoice_id = i.invoice_id
-        JOIN vendors v ON i.vendor_id = v.vendor_id
-        WHERE pa.payment_date BETWEEN ? AND ?
-        GROUP BY pa.advice_id
-        ORDER BY pa.payment_date DESC
-    """, conn, params=(start_date, end_date))
+    payment_history = pd.read_sql(
+        PAYMENT_HISTORY_SQL, conn, params=(day_key(start_date), day_key(end_date))
+    )
     
     conn.close()
+    display_report_freshness(conn)
     
     if not payment_history.empty:
         # Convert date columns
         payment_history['generated_at'] = pd.to_datetime(payment_history['generated_at']).dt.strftime('%Y-%m-%d')
         payment_history['payment_date'] = pd.to_datetime(payment_history['payment_date']).dt.strftime('%Y-%m-%d')
         
-        # Format currency columns
-        payment_history['total_amount'] = payment_history['total_amount'].apply(lambda x: f"${x:,.2f}")
-        
-        # Display data table
+        # Display data table, with the amount formatted for display only
         st.dataframe(
-            payment_history[['advice_number', 'payment_date', 'vendor_names', 'invoice_count', 'total_amount', 'approved_by']].rename(columns={
+            payment_history[['advice_number', 'payment_date', 'vendor_names', 'invoice_count', 'approved_by']].assign(
+                total_amount=format_money(payment_history['total_cents'])
+            ).rename(columns={
                 'advice_number': 'Payment Advice #',
                 'payment_date': 'Payment Date',
                 'vendor_names': 'Vendor',
@@ -1910,23 +1950,23 @@ def display_payment_history_report():
         
         # Calculate summary
         payment_count = len(payment_history)
-        total_paid = payment_history['total_amount'].apply(lambda x: float(x.replace('$', '').replace(',', ''))).sum()
+        total_paid = payment_history['total_cents'].sum()
         
         # Display summary metrics
         col1, col2 = st.columns(2)
         with col1:
             st.metric("Total Payments", payment_count)
         with col2:
-            st.metric("Total Amount Paid", f"${total_paid:,.2f}")
+            st.metric("Total Amount Paid", format_money(total_paid))
         
         # Line chart of payments over time
         payment_history['payment_date_dt'] = pd.to_datetime(payment_history['payment_date'])
-        payment_history['amount_numeric'] = payment_history['total_amount'].apply(lambda x: float(x.replace('$', '').replace(',', '')))
         
         payment_by_date = payment_history.groupby(payment_history['payment_date_dt'].dt.strftime('%Y-%m-%d')).agg(
-            total=('amount_numeric', 'sum'),
+            total=('total_cents', 'sum'),
             count=('advice_number', 'count')
         ).reset_index()
+        payment_by_date['total'] = to_dollars(payment_by_date['total'])
         
         fig = px.line(
             payment_by_date,
@@ -1940,40 +1980,24 @@ def display_payment_history_report():
     else:
         st.info(f"No payment history found between {start_date} and {end_date}.")
 
+@traced()
 def display_invoice_status_report():
     st.subheader("Invoice Status Summary")
     
-    # Get invoice status data
-    conn = get_db_connection()
-    
-    invoice_status = pd.read_sql("""
-        SELECT i.status,
-               COUNT(i.invoice_id) as invoice_count,
-               SUM(i.total_amount) as total_amount
-        FROM invoices i
-        GROUP BY i.status
-    """, conn)
-    
-    # Get invoice trend data
-    invoice_trend = pd.read_sql("""
-        SELECT strftime('%Y-%m', i.invoice_date) as month,
-               COUNT(i.invoice_id) as invoice_count,
-               SUM(i.total_amount) as total_amount
-        FROM invoices i
-        GROUP BY month
-        ORDER BY month DESC
-        LIMIT 12
-    """, conn)
-    
+    # Status totals and the latest 12 months, rolled up from the report cube
+    conn = get_report_connection()
+    cube = get_cube(conn)
     conn.close()
+    display_report_freshness(conn)
+    
+    invoice_status = cube.rollup(("status",))
+    invoice_trend = cube.rollup(("month",))
+    invoice_trend = invoice_trend[invoice_trend['month'] != UNDATED].tail(12)
     
     if not invoice_status.empty:
         # Format the status labels
         invoice_status['status'] = invoice_status['status'].str.title()
         
-        # Format currency columns
-        invoice_status['total_amount'] = invoice_status['total_amount'].apply(lambda x: f"${x:,.2f}")
-        
         # Display pie chart
         fig = px.pie(
             invoice_status,
@@ -1992,7 +2016,9 @@ def display_invoice_status_report():
         
         # Display data table
         st.dataframe(
-            invoice_status.rename(columns={
+            invoice_status[['status', 'invoice_count']].assign(
+                total_amount=format_money(invoice_status['total_cents'])
+            ).rename(columns={
                 'status': 'Status',
                 'invoice_count': 'Count',
                 'total_amount': 'Total Amount'
@@ -2004,9 +2030,10 @@ def display_invoice_status_report():
     if not invoice_trend.empty:
         st.subheader("Invoice Trend (Last 12 Months)")
         
-        # Convert month to datetime for proper sorting
-        invoice_trend['month_dt'] = pd.to_datetime(invoice_trend['month'] + '-01')
-        invoice_trend = invoice_trend.sort_values('month_dt')
+        # The cube keeps months in key order, oldest first
+        invoice_trend['month_key'] = invoice_trend['month']
+        invoice_trend['month'] = month_label(invoice_trend['month_key'])
+        invoice_trend['total_amount'] = to_dollars(invoice_trend['total_cents'])
         
         # Create bar chart
         fig = px.bar(
@@ -2018,62 +2045,87 @@ def display_invoice_status_report():
             barmode='group'
         )
         st.plotly_chart(fig)
+        
+        display_month_drill_down(cube, invoice_trend['month_key'], "status_drill_month")
 
-def display_monthly_trend_report():
-    st.subheader("Monthly AP Trend Analysis")
+def display_month_drill_down(cube, month_keys, key):
+    """Vendors behind one month of a trend chart, from the cube already in memory"""
+    month_keys = [int(month) for month in month_keys][::-1]
+    month = st.selectbox(
+        "Drill down into month",
+        month_keys,
+        format_func=lambda month: f"{month // 100}-{month % 100:02d}",
+        key=key
+    )
+    if month is None:
+        return
     
-    # Get monthly data
-    conn = get_db_connection()
+    vendors = cube.drill_down(month)
+    top_vendors = vendors.head(10)
     
-    # Invoices by month
-    invoices_monthly = pd.read_sql("""
-        SELECT strftime('%Y-%m', invoice_date) as month,
-               COUNT(invoice_id) as invoice_count,
-               SUM(total_amount) as total_amount
-        FROM invoices
-        GROUP BY month
-        ORDER BY month ASC
-    """, conn)
-    
-    # Payments by month
-    payments_monthly = pd.read_sql("""
-        SELECT strftime('%Y-%m', payment_date) as month,
-               COUNT(advice_id) as payment_count,
-               SUM(total_amount) as payment_amount
-        FROM payment_advices
-        WHERE payment_date IS NOT NULL
-        GROUP BY month
-        ORDER BY month ASC
-    """, conn)
+    fig = px.bar(
+        top_vendors.assign(total_amount=to_dollars(top_vendors['total_cents'])),
+        x='vendor_name',
+        y='total_amount',
+        title=f"Top Vendors Invoiced in {month // 100}-{month % 100:02d}",
+        labels={'vendor_name': 'Vendor', 'total_amount': 'Amount ($)'}
+    )
+    fig.update_layout(xaxis_tickangle=-45)
+    st.plotly_chart(fig)
+    
+    st.dataframe(
+        vendors[['vendor_name', 'invoice_count']].assign(
+            total_amount=format_money(vendors['total_cents'])
+        ).rename(columns={
+            'vendor_name': 'Vendor',
+            'invoice_count': 'Invoices',
+            'total_amount': 'Total Amount'
+        }),
+        hide_index=True
+    )
+
+@traced()
+def display_monthly_trend_report():
+    st.subheader("Monthly AP Trend Analysis")
     
+    # Invoices and payments by month, oldest first, from the report cube
+    conn = get_report_connection()
+    cube = get_cube(conn)
     conn.close()
+    display_report_freshness(conn)
+    
+    invoices_monthly = cube.rollup(("month",)).rename(columns={'total_cents': 'invoice_cents'})
+    invoices_monthly = invoices_monthly[invoices_monthly['month'] != UNDATED]
+    payments_monthly = cube.payments_by_month()
     
     if not invoices_monthly.empty:
         # Convert to datetime for proper handling
-        invoices_monthly['month_dt'] = pd.to_datetime(invoices_monthly['month'] + '-01')
+        invoices_monthly['month_dt'] = month_start(invoices_monthly['month'])
+        invoices_monthly['invoice_amount'] = to_dollars(invoices_monthly['invoice_cents'])
         
         # Create trend chart
         fig = px.line(
             invoices_monthly,
             x='month_dt',
-            y='total_amount',
+            y='invoice_amount',
             title='Monthly Invoice Amounts',
-            labels={'month_dt': 'Month', 'total_amount': 'Amount ($)'},
+            labels={'month_dt': 'Month', 'invoice_amount': 'Amount ($)'},
             markers=True
         )
         st.plotly_chart(fig)
         
         # If we have payment data, create a comparison chart
         if not payments_monthly.empty:
-            payments_monthly['month_dt'] = pd.to_datetime(payments_monthly['month'] + '-01')
-            
-            # Merge the datasets on month
+            # Merge the datasets on month key; amounts stay in cents until they are charted
             monthly_comparison = pd.merge(
-                invoices_monthly[['month', 'month_dt', 'total_amount']].rename(columns={'total_amount': 'invoice_amount'}),
-                payments_monthly[['month', 'payment_amount']],
+                invoices_monthly[['month', 'invoice_cents']],
+                payments_monthly[['month', 'payment_cents']],
                 on='month',
                 how='outer'
-            ).fillna(0)
+            ).fillna(0).sort_values('month')
+            monthly_comparison['month_dt'] = month_start(monthly_comparison['month'])
+            monthly_comparison['invoice_amount'] = to_dollars(monthly_comparison['invoice_cents'])
+            monthly_comparison['payment_amount'] = to_dollars(monthly_comparison['payment_cents'])
             
             # Create comparison chart
             fig = px.line(
@@ -2096,8 +2148,8 @@ def display_monthly_trend_report():
             st.plotly_chart(fig)
             
             # Calculate rolling AP aging
-            monthly_comparison['net_change'] = monthly_comparison['invoice_amount'] - monthly_comparison['payment_amount']
-            monthly_comparison['cumulative_ap'] = monthly_comparison['net_change'].cumsum()
+            net_change = monthly_comparison['invoice_cents'].astype('int64') - monthly_comparison['payment_cents'].astype('int64')
+            monthly_comparison['cumulative_ap'] = to_dollars(net_change.cumsum())
             
             # Create cumulative AP chart
             fig = px.area(
@@ -2108,6 +2160,8 @@ def display_monthly_trend_report():
                 labels={'month_dt': 'Month', 'cumulative_ap': 'Balance ($)'}
             )
             st.plotly_chart(fig)
+        
+        display_month_drill_down(cube, invoices_monthly['month'], "trend_drill_month")
     
     else:
         st.info("Insufficient historical data for trend analysis.")
@@ -2131,12 +2185,14 @@ def display_users():
         create_user_form()
 
 def display_user_list():
+    # Search filter; matching users come from the full-text index, best match first
+    search = st.text_input("Search Users", "")
+    
     conn = get_db_connection()
-    users = pd.read_sql("""
-        SELECT user_id, username, full_name, email, role, department, status, created_at
-        FROM users
-        ORDER BY created_at DESC
-    """, conn)
+    if search:
+        users = pd.read_sql(USER_SEARCH_SQL, conn, params=(json.dumps(search_index(conn, "users", search)),))
+    else:
+        users = pd.read_sql(USER_LIST_SQL, conn)
     conn.close()
     
     # Convert date columns
@@ -2146,15 +2202,6 @@ def display_user_list():
     users['role'] = users['role'].str.title()
     users['status'] = users['status'].str.title()
     
-    # Search filter
-    search = st.text_input("Search Users", "")
-    if search:
-        users = users[
-            users['username'].str.contains(search, case=False) | 
-            users['full_name'].str.contains(search, case=False) |
-            users['email'].str.contains(search, case=False)
-        ]
-    
     # Status filter
     status_filter = st.multiselect(
         "Filter by Status", 
@@ -2164,29 +2211,26 @@ def display_user_list():
     if status_filter:
         users = users[users['status'].isin(status_filter)]
     
-    # Display users with edit button
-    for i, user in users.iterrows():
-        col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
-        
-        with col1:
-            st.subheader(user['full_name'])
-            st.write(f"Username: {user['username']}")
-        
-        with col2:
-            st.write(f"Email: {user['email'] or 'N/A'}")
-            st.write(f"Department: {user['department'] or 'N/A'}")
-        
-        with col3:
-            st.write(f"Role: {user['role']}")
-            st.write(f"Status: {user['status']}")
-        
-        with col4:
-            st.write(f"Created: {user['created_at']}")
-            if st.button("Edit", key=f"edit_user_{user['user_id']}"):
-                st.session_state.edit_user_id = user['user_id']
-                st.rerun()
-        
-        st.divider()
+    # Display users in a single grid; tick "Edit" to open a user
+    _, edit_user_id = action_grid(
+        users.set_index('user_id')[['full_name', 'username', 'email', 'department', 'role', 'status', 'created_at']],
+        key="user_grid",
+        action_column="edit",
+        column_config={
+            "full_name": "Name",
+            "username": "Username",
+            "email": "Email",
+            "department": "Department",
+            "role": "Role",
+            "status": "Status",
+            "created_at": "Created",
+            "edit": st.column_config.CheckboxColumn("Edit", width="small")
+        }
+    )
+    
+    if edit_user_id is not None:
+        st.session_state.edit_user_id = int(edit_user_id)
+        st.rerun()
     
     # Edit user modal
     if 'edit_user_id' in st.session_state and st.session_state.edit_user_id:
@@ -2319,7 +2363,7 @@ def display_settings():
         return
     
     # Tabs for different settings
-    tab1, tab2, tab3 = st.tabs(["General Settings", "Tally Integration", "Database"])
+    tab1, tab2, tab3, tab4 = st.tabs(["General Settings", "Tally Integration", "Database", "Performance"])
     
     with tab1:
         display_general_settings()
@@ -2329,6 +2373,9 @@ def display_settings():
     
     with tab3:
         display_database_settings()
+    
+    with tab4:
+        display_performance_settings()
 
 def display_general_settings():
     st.subheader("General Settings")
@@ -2366,9 +2413,7 @@ def display_general_settings():
                     "company_address": company_address
                 }
                 
-                # In a real app, save to database or config file
-                with open("settings.json", "w") as f:
-                    json.dump(settings, f)
+                save_settings(settings)
                 
                 st.success("Company information saved!")
     
@@ -2405,7 +2450,7 @@ def display_general_settings():
     # User Interface Settings
     with st.expander("User Interface Settings"):
         with st.form("ui_settings_form"):
-            items_per_page = st.number_input("Items Per Page", min_value=5, max_value=100, value=10)
+            items_per_page = st.number_input("Items Per Page", min_value=5, max_value=100, value=int(load_settings().get("items_per_page", 10)))
             date_format = st.selectbox("Date Format", ["YYYY-MM-DD", "MM/DD/YYYY", "DD/MM/YYYY"])
             theme = st.selectbox("Theme", ["Light", "Dark", "System"])
             
@@ -2419,29 +2464,47 @@ def display_general_settings():
                     "theme": theme
                 }
                 
-                # In a real app, save to database or config file
+                save_settings(settings)
                 st.success("UI settings saved!")
 
 def display_tally_settings():
     st.subheader("Tally ERP Integration Settings")
     
+    saved = load_settings()
+    frequencies = ["Manual", "Hourly", "Daily", "Weekly"]
+    
     with st.form("tally_settings_form"):
         st.write("Configure the connection to Tally ERP for data synchronization.")
         
-        enable_tally = st.checkbox("Enable Tally Integration", value=True)
+        enable_tally = st.checkbox("Enable Tally Integration", value=saved.get("enable_tally", True))
         
         col1, col2 = st.columns(2)
         with col1:
-            tally_server = st.text_input("Tally Server", "localhost")
+            tally_server = st.text_input("Tally Server", saved.get("tally_server", "localhost"))
         with col2:
-            tally_port = st.text_input("Tally Port", "9000")
+            tally_port = st.text_input("Tally Port", saved.get("tally_port", "9000"))
         
-        tally_company = st.text_input("Tally Company Name", "Your Company")
+        tally_company = st.text_input("Tally Company Name", saved.get("tally_company", "Your Company"))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            tally_source = st.selectbox(
+                "Data Source",
+                TALLY_SOURCES,
+                index=TALLY_SOURCES.index(saved.get("tally_source", TALLY_SOURCES[0]))
+                if saved.get("tally_source") in TALLY_SOURCES else 0
+            )
+        with col2:
+            tally_replay_dir = st.text_input(
+                "Replay Directory",
+                saved.get("tally_replay_dir", DEFAULT_REPLAY_DIR),
+                help="Folder of vendors.jsonl / invoices.jsonl used by the File replay source"
+            )
         
         sync_frequency = st.selectbox(
             "Sync Frequency",
-            ["Manual", "Hourly", "Daily", "Weekly"],
-            index=0
+            frequencies,
+            index=frequencies.index(saved.get("sync_frequency", "Manual"))
         )
         
         # Advanced settings
@@ -2449,14 +2512,14 @@ def display_tally_settings():
         
         col1, col2 = st.columns(2)
         with col1:
-            vendor_ledger = st.text_input("Vendor Ledger Group", "Sundry Creditors")
+            vendor_ledger = st.text_input("Vendor Ledger Group", saved.get("vendor_ledger", "Sundry Creditors"))
         with col2:
-            bill_type = st.text_input("Bill Voucher Type", "Purchase")
+            bill_type = st.text_input("Bill Voucher Type", saved.get("bill_type", "Purchase"))
         
         sync_options = st.multiselect(
             "Items to Sync",
             ["Vendors", "Invoices", "Payments"],
-            default=["Vendors", "Invoices"]
+            default=saved.get("sync_options", ["Vendors", "Invoices"])
         )
         
         submitted = st.form_submit_button("Save Tally Settings")
@@ -2468,32 +2531,154 @@ def display_tally_settings():
                 "tally_server": tally_server,
                 "tally_port": tally_port,
                 "tally_company": tally_company,
+                "tally_source": tally_source,
+                "tally_replay_dir": tally_replay_dir,
                 "sync_frequency": sync_frequency,
                 "vendor_ledger": vendor_ledger,
                 "bill_type": bill_type,
                 "sync_options": sync_options
             }
             
-            # In a real app, save to database or config file
+            save_settings(settings)
+            
+            # Scheduled syncs run on the background worker
+            conn = get_db_connection()
+            set_schedule(
+                conn,
+                TALLY_SYNC_SCHEDULE,
+                TALLY_SYNC_JOB,
+                SYNC_INTERVALS.get(sync_frequency, SYNC_INTERVALS["Daily"]),
+                enabled=enable_tally and sync_frequency in SYNC_INTERVALS
+            )
+            conn.close()
+            
             st.success("Tally integration settings saved!")
     
+    # Sync watermarks
+    st.subheader("Sync State")
+    st.write("Each sync fetches only records whose ALTERID is above the entity's high-water mark.")
+    
+    conn = get_db_connection()
+    watermarks = {entity: get_watermark(conn, entity) for entity in TALLY_ENTITIES}
+    conn.close()
+    
+    cols = st.columns(len(watermarks))
+    for col, (entity, mark) in zip(cols, watermarks.items()):
+        with col:
+            st.metric(f"{entity.title()} high-water mark", mark)
+            if st.button(f"Full Resync of {entity.title()}", key=f"reset_watermark_{entity}"):
+                conn = get_db_connection()
+                reset_watermark(conn, entity)
+                conn.close()
+                st.rerun()
+    
+    # Background jobs
+    st.subheader("Background Jobs")
+    
+    workers = worker_status()
+    conn = get_db_connection()
+    schedule = conn.execute(
+        "SELECT interval_seconds, enabled, next_run_at FROM job_schedules WHERE name = ?",
+        (TALLY_SYNC_SCHEDULE,)
+    ).fetchone()
+    conn.close()
+    
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Workers Running", f"{sum(alive for _, alive in workers)} / {len(workers)}")
+    current = [f"#{job[0]} {job[1]}" for job in (worker.current_job for worker, _ in workers) if job]
+    col2.metric("Current Jobs", ", ".join(current) if current else "Idle")
+    if schedule and schedule['enabled']:
+        col3.metric("Next Scheduled Sync", pd.to_datetime(schedule['next_run_at'], unit='s').strftime("%Y-%m-%d %H:%M"))
+    else:
+        col3.metric("Next Scheduled Sync", "Manual only")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Run Sync Now"):
+            conn = get_db_connection()
+            job_id = enqueue_job(conn, TALLY_SYNC_JOB)
+            conn.close()
+            st.success(f"Sync queued as job #{job_id}.")
+    with col2:
+        if st.button("Refresh Job Status"):
+            st.rerun()
+    
+    display_job_table()
+    
     # Test connection button
     if st.button("Test Tally Connection"):
         try:
-            import pyodbc
-            
-            # Attempt to connect to Tally
-            conn_str = f"DRIVER={{Tally ODBC Driver}};SERVER={tally_server};PORT={tally_port}"
+            source = source_from_settings(load_settings())
             
             with st.spinner("Testing connection to Tally..."):
-                # Simulate connection test (would use pyodbc in real app)
-                time.sleep(2)
-                
-                # Fake success for demo
-                st.success("Successfully connected to Tally!")
+                if isinstance(source, XmlHttpTallySource):
+                    st.success(f"Connected to Tally at {source.url}: {source.ping()}")
+                elif os.path.isdir(source.directory):
+                    st.success(f"Replay directory {source.directory} found.")
+                else:
+                    st.error(f"Replay directory {source.directory} not found.")
         except Exception as e:
             st.error(f"Failed to connect to Tally: {str(e)}")
-            st.info("Make sure Tally is running and the ODBC driver is installed.")
+            st.info("Make sure Tally is running with its HTTP port enabled (F12 > Advanced Configuration).")
+
+def display_job_table(kind=None, limit=20):
+    """Recent background jobs with their status and timings"""
+    conn = get_db_connection()
+    jobs = pd.read_sql(f"""
+        SELECT job_id, kind, status, attempts, max_attempts, schedule_name,
+               created_at, started_at, finished_at, duration_ms, run_at, error
+        FROM jobs
+        {"WHERE kind = ?" if kind else ""}
+        ORDER BY job_id DESC
+        LIMIT {int(limit)}
+    """, conn, params=(kind,) if kind else None)
+    conn.close()
+    
+    if jobs.empty:
+        st.info("No background jobs have run yet.")
+        return
+    
+    # Stored as Unix seconds; shown in UTC like the rest of the database timestamps
+    for column in ['created_at', 'started_at', 'finished_at', 'run_at']:
+        jobs[column] = pd.to_datetime(jobs[column], unit='s')
+    # Next attempt only matters for jobs still waiting
+    jobs.loc[jobs['status'] != 'queued', 'run_at'] = pd.NaT
+    jobs['error'] = jobs['error'].str.split('\n').str[0]
+    
+    st.dataframe(
+        jobs,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'job_id': "Job",
+            'kind': "Kind",
+            'status': "Status",
+            'attempts': "Attempts",
+            'max_attempts': "Max Attempts",
+            'schedule_name': "Schedule",
+            'created_at': st.column_config.DatetimeColumn("Queued", format="YYYY-MM-DD HH:mm:ss"),
+            'started_at': st.column_config.DatetimeColumn("Started", format="YYYY-MM-DD HH:mm:ss"),
+            'finished_at': st.column_config.DatetimeColumn("Finished", format="YYYY-MM-DD HH:mm:ss"),
+            'duration_ms': st.column_config.NumberColumn("Duration (ms)", format="%.0f"),
+            'run_at': st.column_config.DatetimeColumn("Next Attempt", format="YYYY-MM-DD HH:mm:ss"),
+            'error': "Error"
+        }
+    )
+    
+    queued = jobs.loc[jobs['status'] == 'queued', 'job_id'].tolist()
+    if queued:
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            job_id = st.selectbox("Queued Job", queued, key=f"cancel_job_select_{kind or 'all'}")
+        with col2:
+            if st.button("Cancel Job", key=f"cancel_job_{kind or 'all'}"):
+                conn = get_db_connection()
+                cancelled = cancel_job(conn, job_id)
+                conn.close()
+                if cancelled:
+                    st.success(f"Job #{job_id} cancelled.")
+                else:
+                    st.warning(f"Job #{job_id} has already started.")
 
 def display_database_settings():
     st.subheader("Database Management")
@@ -2530,65 +2715,266 @@ def display_database_settings():
     for i, (table, count) in enumerate(table_counts.items()):
         cols[i % 3].metric(table.replace('_', ' ').title(), count)
     
-    # Backup and restore
-    st.subheader("Backup and Restore")
+    # Connection pool metrics
+    st.subheader("Connection Pool")
+    
+    pool_stats = get_pool().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("In Use / Open", f"{pool_stats['in_use']} / {pool_stats['open']}")
+    col2.metric("Peak In Use", f"{pool_stats['peak_in_use']} of {pool_stats['pool_size']}")
+    col3.metric("Checkouts", pool_stats['checkouts'])
+    col4.metric("Avg Wait", f"{pool_stats['avg_wait_ms']:.2f} ms")
+    
+    with st.expander("Pool Details"):
+        st.json(pool_stats)
+    
+    # Query cache statistics
+    st.subheader("Query Cache")
+    
+    cache_stats = query_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+    col2.metric("Hits / Misses", f"{cache_stats['hits']} / {cache_stats['misses']}")
+    col3.metric("Invalidated by Writes", cache_stats['invalidated'])
+    col4.metric("Cached Entries", cache_stats['entries'])
+    st.caption(f"Entries expire after {query_cache.ttl:.0f} seconds; {cache_stats['expired']} expired, {cache_stats['evicted']} evicted.")
+    
+    if st.button("Clear Query Cache"):
+        query_cache.clear()
+        st.success("Query cache cleared!")
+    
+    # Report snapshot
+    st.subheader("Report Snapshot")
+    st.write("Reports read a periodically refreshed copy of the database, so long reports never hold up invoice entry.")
+    
+    taken_at = snapshot_time()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Snapshot Taken", datetime.fromtimestamp(taken_at).strftime('%Y-%m-%d %H:%M') if taken_at else "Never")
+    col2.metric("Snapshot Age", f"{(time.time() - taken_at) / 60:.0f} min" if taken_at else "-")
+    col3.metric("Snapshot Size", f"{os.path.getsize(SNAPSHOT_PATH) / (1024 * 1024):.2f} MB" if taken_at else "-")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("Backup Database"):
-            # Create backup
-            backup_dir = "backups"
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-            backup_path = os.path.join(backup_dir, f"ap_system_backup_{timestamp}.db")
+        staleness_min = st.number_input(
+            "Report data staleness (minutes)",
+            min_value=0,
+            value=report_staleness() // 60,
+            step=5,
+            help="How old report data may get before the snapshot is refreshed. 0 reads live data."
+        )
+        if staleness_min != report_staleness() // 60:
+            save_settings({"report_staleness_seconds": staleness_min * 60})
             
-            with st.spinner("Creating database backup..."):
-                import shutil
-                shutil.copy2(DB_PATH, backup_path)
-                
-                st.success(f"Backup created successfully: {backup_path}")
-                
-                # Provide download link
-                with open(backup_path, "rb") as f:
-                    st.download_button(
-                        label="Download Backup",
-                        data=f,
-                        file_name=os.path.basename(backup_path),
-                        mime="application/octet-stream"
-                    )
+            # Snapshots are refreshed by a schedule on the background worker
+            conn = get_db_connection()
+            schedule_snapshots(conn, staleness_min * 60)
+            conn.close()
     
     with col2:
-        uploaded_backup = st.file_uploader("Restore from Backup", type=["db"])
-        
-        if uploaded_backup and st.button("Restore Database"):
-            # Confirm restore
-            if st.checkbox("I understand this will overwrite the current database"):
-                with st.spinner("Restoring database from backup..."):
-                    # Save the uploaded file
-                    backup_path = os.path.join("backups", "temp_restore.db")
-                    with open(backup_path, "wb") as f:
-                        f.write(uploaded_backup.getbuffer())
-                    
-                    # Close all connections to current DB
-                    import sqlite3
-                    sqlite3.connect(DB_PATH).close()
-                    
-                    # Create a backup of current DB before restore
-                    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                    pre_restore_backup = os.path.join("backups", f"pre_restore_backup_{timestamp}.db")
-                    import shutil
-                    shutil.copy2(DB_PATH, pre_restore_backup)
-                    
-                    # Restore from uploaded backup
-                    shutil.copy2(backup_path, DB_PATH)
-                    
-                    st.success("Database restored successfully!")
-                    st.info("The application will restart to apply changes.")
-                    st.rerun()
+        if st.button("Refresh Report Snapshot"):
+            conn = get_db_connection()
+            request_snapshot(conn)
+            conn.close()
+            st.success("Report snapshot refresh queued!")
+    
+    # Query plan audit
+    st.subheader("Query Plan Audit")
+    st.write("Runs EXPLAIN QUERY PLAN on the registered hot queries and flags full table scans, "
+             "and paged queries that sort every row before their LIMIT.")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        run_audit = st.button("Run Query Plan Audit")
+    
+    with col2:
+        if st.button("Update Planner Statistics"):
+            conn = get_db_connection()
+            conn.execute("ANALYZE")
+            conn.commit()
+            conn.close()
+            st.success("Planner statistics updated!")
+    
+    if run_audit:
+        from utils.query_audit import audit
+    
+        conn = get_db_connection()
+        results = audit(conn)
+        conn.close()
+    
+        flagged = [r for r in results if not r['ok']]
+        if flagged:
+            st.warning(f"{len(flagged)} of {len(results)} queries have unexpected full scans or sorts")
+        else:
+            st.success(f"All {len(results)} queries use an index or an expected scan")
+    
+        st.dataframe(pd.DataFrame([{
+            'Query': r['query'],
+            'Status': "OK" if r['ok'] else "Full scan" if r['full_scans'] else "Sorts before LIMIT",
+            'Full Scans': ", ".join(r['full_scans']),
+            'Expected Scans': ", ".join(r['allowed_scans']),
+            'Temp B-Trees': ", ".join(r['temp_btrees'])
+        } for r in results]), hide_index=True, use_container_width=True)
+    
+        for r in flagged:
+            with st.expander(f"Plan: {r['query']}"):
+                st.code("\n".join(r['plan']))
+    
+    # Query profiler
+    st.subheader("Query Profiler")
+    
+    summary = profiler.summary()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Queries Recorded", summary['queries_recorded'])
+    col2.metric("Page Renders", summary['pages_recorded'])
+    col3.metric("Slow Queries", summary['slow_queries'])
+    col4.metric("Slow Threshold", f"{profiler.slow_ms:g} ms")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        profiler.enabled = st.checkbox("Profile queries", value=profiler.enabled)
+    
+    with col2:
+        slow_ms = st.number_input("Slow query threshold (ms)", min_value=1, value=int(profiler.slow_ms), step=50)
+        if slow_ms != profiler.slow_ms:
+            profiler.slow_ms = slow_ms
+            save_settings({"slow_query_ms": slow_ms})
+    
+    query_tab, page_tab, slow_tab = st.tabs(["By Query", "By Page", "Slow Query Log"])
+    
+    with query_tab:
+        st.dataframe(
+            profiler.query_stats().round(2),
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    with page_tab:
+        st.dataframe(
+            profiler.page_stats().round(2),
+            hide_index=True,
+            use_container_width=True
+        )
+    
+    with slow_tab:
+        st.caption(f"Rolling log of the last {profiler.slow_log_max_rows} queries slower than the threshold, stored in {profiler.slow_log_path}")
+        st.dataframe(profiler.slow_queries(), hide_index=True, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("Reset Profiler"):
+            profiler.clear()
+            st.rerun()
+    
+    with col2:
+        if st.button("Clear Slow Query Log"):
+            profiler.clear(slow_log=True)
+            st.rerun()
+    
+    # Backup and restore
+    st.subheader("Backup and Restore")
+    st.write("Backups are copied from the live database on the background worker, checked with an integrity check and compressed.")
+    
+    saved = load_settings()
+    frequencies = ["Manual"] + list(BACKUP_INTERVALS)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("Backup Database"):
+            conn = get_db_connection()
+            st.session_state.backup_job = enqueue_job(conn, BACKUP_JOB, max_attempts=2)
+            conn.close()
+    with col2:
+        backup_frequency = st.selectbox(
+            "Backup Frequency",
+            frequencies,
+            index=frequencies.index(saved.get("backup_frequency", "Manual"))
+            if saved.get("backup_frequency") in frequencies else 0
+        )
+    with col3:
+        backup_keep = st.number_input(
+            "Backups to Keep", min_value=1, max_value=365, value=int(saved.get("backup_keep", BACKUP_KEEP))
+        )
+    
+    if st.button("Save Backup Settings"):
+        save_settings({"backup_frequency": backup_frequency, "backup_keep": int(backup_keep)})
+        
+        # Scheduled backups run on the background worker
+        conn = get_db_connection()
+        set_schedule(
+            conn,
+            BACKUP_SCHEDULE,
+            BACKUP_JOB,
+            BACKUP_INTERVALS.get(backup_frequency, BACKUP_INTERVALS["Daily"]),
+            enabled=backup_frequency in BACKUP_INTERVALS
+        )
+        conn.close()
+        
+        st.success("Backup settings saved!")
+    
+    backup_pending = display_backup_job()
+    
+    backups = list_backups()
+    if backups:
+        st.dataframe(
+            pd.DataFrame({
+                'Backup': [backup['file_name'] for backup in backups],
+                'Type': [backup['kind'].title() for backup in backups],
+                'Created': [backup['created_at'].strftime('%Y-%m-%d %H:%M:%S') for backup in backups],
+                'Size (MB)': [round(backup['size'] / (1024 * 1024), 2) for backup in backups]
+            }),
+            hide_index=True
+        )
+        
+        backup_names = [backup['file_name'] for backup in backups]
+        selected_name = st.selectbox("Backup", backup_names)
+        selected_backup = backups[backup_names.index(selected_name)]
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            # download_button holds the whole file in memory, so large backups are fetched from the server
+            if selected_backup['size'] > BACKUP_DOWNLOAD_LIMIT:
+                st.info(
+                    f"{selected_name} is {selected_backup['size'] / (1024 * 1024):,.0f} MB, too large to "
+                    f"download here. Copy it from {os.path.abspath(selected_backup['path'])} on the server."
+                )
             else:
-                st.warning("Please confirm that you understand the restore will overwrite the current database.")
+                deferred_download_button(
+                    "Download Backup",
+                    f"download_backup_{selected_name}",
+                    lambda: read_blob(selected_backup['path']),
+                    selected_name,
+                    "application/octet-stream"
+                )
+        with col2:
+            confirm_restore = st.checkbox(
+                "I understand this will overwrite the current database", key="confirm_restore_backup"
+            )
+            if st.button("Restore Selected Backup", disabled=not confirm_restore):
+                restore_database(selected_backup['path'])
+    else:
+        st.info("No backups yet.")
+    
+    uploaded_backup = st.file_uploader("Restore from an Uploaded Backup", type=["db", "gz", "zst"])
+    if uploaded_backup:
+        confirm_upload = st.checkbox(
+            "I understand this will overwrite the current database", key="confirm_restore_upload"
+        )
+        if st.button("Restore Uploaded Backup", disabled=not confirm_upload):
+            # Keep the uploaded file's extension, which says how it is compressed
+            os.makedirs(BACKUP_DIR, exist_ok=True)
+            fd, upload_path = tempfile.mkstemp(
+                prefix="uploaded_", suffix=os.path.splitext(uploaded_backup.name)[1], dir=BACKUP_DIR
+            )
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    shutil.copyfileobj(uploaded_backup, f)
+                restore_database(upload_path)
+            finally:
+                os.remove(upload_path)
     
     # Database optimization
     st.subheader("Database Optimization")
@@ -2605,6 +2991,150 @@ def display_database_settings():
             # Show new size
             new_size = os.path.getsize(DB_PATH) / (1024 * 1024)  # Convert to MB
             st.write(f"**New Database Size:** {new_size:.2f} MB (Reduced by {db_size - new_size:.2f} MB)")
+    
+    if st.button("Rebuild Aging Summary"):
+        with st.spinner("Recomputing aging summary from invoices..."):
+            conn = get_db_connection()
+            rebuild_aging_summary(conn)
+            conn.commit()
+            conn.close()
+            
+            st.success("Aging summary rebuilt!")
+    
+    # Poll until the backup job finishes
+    if backup_pending:
+        time.sleep(REPORT_POLL_SECONDS)
+        st.rerun()
+
+def display_backup_job():
+    """Progress or outcome of the backup job started from this session; True while it is running"""
+    job_id = st.session_state.get('backup_job')
+    if not job_id:
+        return False
+    
+    conn = get_db_connection()
+    job = conn.execute("""
+        SELECT status, attempts, progress, progress_message, result, error
+        FROM jobs WHERE job_id = ?
+    """, (job_id,)).fetchone()
+    conn.close()
+    
+    if job is None:
+        del st.session_state['backup_job']
+        return False
+    
+    if job['status'] in ('queued', 'running'):
+        if job['status'] == 'queued' and job['attempts']:
+            message = "Retrying after an error..."
+        elif job['status'] == 'queued':
+            message = "Waiting for a free worker..."
+        else:
+            message = job['progress_message'] or "Copying the database..."
+        st.progress(job['progress'] or 0.0, text=f"Backup job #{job_id}: {message}")
+        return True
+    
+    if job['status'] == 'succeeded':
+        result = json.loads(job['result'])
+        st.success(
+            f"Backup created: {result['file_name']} "
+            f"({result['database_size'] / (1024 * 1024):,.1f} MB compressed to {result['size'] / (1024 * 1024):,.1f} MB)."
+        )
+    else:
+        st.error(f"Backup failed: {(job['error'] or job['status']).splitlines()[0]}")
+    return False
+
+def restore_database(path):
+    """Restore a backup over the live database, then drop every connection and cache of the old one"""
+    with st.spinner("Restoring database from backup..."):
+        try:
+            result = restore_backup(path)
+        except (BackupError, sqlite3.Error, OSError) as e:
+            st.error(f"Restore failed: {e}")
+            return
+        
+        # The next checkout reopens the pool and migrates the restored schema
+        reset_pool()
+        query_cache.clear()
+        expire_snapshot()
+        st.session_state.pop('backup_job', None)
+    
+    st.success(
+        f"Database restored from {result['restored']}. "
+        f"The previous database was saved as {os.path.basename(result['pre_restore_backup'])}."
+    )
+
+def display_performance_settings():
+    st.subheader("Page Render Tracing")
+    st.write("Every rerun is traced as a tree of spans: queries, transforms, chart building and element rendering.")
+    
+    tracer.enabled = st.checkbox("Trace page renders", value=tracer.enabled)
+    
+    # Slowest pages
+    page_stats = tracer.page_stats()
+    if page_stats.empty:
+        st.info("No traces recorded yet. Open a few pages and come back.")
+        return
+    
+    st.write("**Slowest Pages (p95)**")
+    st.dataframe(page_stats.round(1), hide_index=True, use_container_width=True)
+    
+    # Pick one rerun to break down
+    st.write("**Slowest Reruns**")
+    page_filter = st.selectbox("Page", ["All"] + page_stats['page'].tolist())
+    traces = tracer.slowest_traces(None if page_filter == "All" else page_filter)
+    st.dataframe(traces.drop(columns=['trace_id']).round(1), hide_index=True, use_container_width=True)
+    
+    trace_labels = {
+        f"{row.page} at {row.started_at} ({row.duration_ms:,.0f} ms)": row.trace_id
+        for row in traces.itertuples()
+    }
+    selected_trace = st.selectbox("Break down rerun", list(trace_labels))
+    trace_id = trace_labels[selected_trace]
+    
+    spans = tracer.trace_spans(trace_id)
+    breakdown = tracer.breakdown(trace_id)
+    
+    col1, col2 = st.columns([1, 2])
+    
+    with col1:
+        # Where the time went, by kind of work
+        fig = px.pie(breakdown, values='ms', names='kind', title='Self Time by Kind')
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        # Waterfall of the spans in start order
+        spans['label'] = [
+            f"{'  ' * depth}{name[:60]}" for depth, name in zip(spans['depth'], spans['name'])
+        ]
+        fig = px.bar(
+            spans,
+            x='duration_ms',
+            y='label',
+            base='start_ms',
+            color='kind',
+            orientation='h',
+            title='Span Timeline',
+            labels={'duration_ms': 'Duration (ms)', 'label': ''}
+        )
+        fig.update_yaxes(autorange='reversed', showticklabels=len(spans) <= 60)
+        fig.update_layout(xaxis_title='Milliseconds since rerun start')
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.dataframe(
+        spans[['label', 'kind', 'start_ms', 'duration_ms', 'self_ms']].round(2).rename(columns={
+            'label': 'Span',
+            'kind': 'Kind',
+            'start_ms': 'Start (ms)',
+            'duration_ms': 'Duration (ms)',
+            'self_ms': 'Self (ms)'
+        }),
+        hide_index=True,
+        use_container_width=True
+    )
+    
+    if st.button("Clear Traces"):
+        tracer.clear()
+        st.rerun()
 
 # Initialize database if it doesn't exist
 def init_database():
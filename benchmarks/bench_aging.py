@@ -0,0 +1,77 @@
+"""Micro-benchmark for utils.aging
+
+Run from the repository root:
+
+    python -m benchmarks.bench_aging [--sizes 10000 1000000 10000000]
+
+Prints rows/second for the vectorized engine on datetime64 due dates and
+on ISO date strings (as read from SQLite), plus the old per-row
+.apply(lambda ...) path on the smallest size for comparison.
+"""
+import argparse
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from utils.aging import AGING_EDGES, age_invoices
+
+AS_OF = date(2024, 6, 30)
+
+
+def make_invoices(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    offsets = rng.integers(-60, 365, size=rows)
+    due = np.datetime64(AS_OF, 'D') - offsets.astype('timedelta64[D]')
+    amounts = rng.uniform(10, 50000, size=rows).round(2)
+    return pd.DataFrame({'due_date': due, 'total_amount': amounts})
+
+
+def legacy_aging(invoices, as_of):
+    """The per-row implementation the pages used before utils.aging"""
+    invoices = invoices.copy()
+    invoices['due_date_obj'] = pd.to_datetime(invoices['due_date']).dt.date
+    invoices['days_overdue'] = invoices['due_date_obj'].apply(lambda x: (as_of - x).days)
+    conditions = [invoices['days_overdue'] <= edge for edge in AGING_EDGES]
+    choices = ['Current', '1-30 Days', '31-60 Days', '61-90 Days']
+    invoices['aging_bucket'] = np.select(conditions, choices, default='Over 90 Days')
+    return invoices.groupby('aging_bucket').agg(
+        count=('due_date', 'count'),
+        total=('total_amount', 'sum')
+    )
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>12}  {'variant':<22} {'seconds':>10} {'rows/sec':>14}")
+    for rows in args.sizes:
+        invoices = make_invoices(rows)
+        variants = [('datetime64', lambda: age_invoices(invoices, AS_OF))]
+
+        strings = invoices.assign(due_date=invoices['due_date'].dt.strftime('%Y-%m-%d'))
+        variants.append(('ISO strings', lambda: age_invoices(strings, AS_OF)))
+
+        if rows == min(args.sizes):
+            variants.append(('legacy .apply', lambda: legacy_aging(invoices, AS_OF)))
+
+        for name, func in variants:
+            seconds = timed(func, args.repeat)
+            print(f"{rows:>12,}  {name:<22} {seconds:>10.4f} {rows / seconds:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
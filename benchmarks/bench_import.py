@@ -0,0 +1,100 @@
+"""Benchmark for utils.bulk_import
+
+Run from the repository root:
+
+    python -m benchmarks.bench_import [--rows 500000] [--legacy-rows 20000]
+
+Builds a Tally-style invoice CSV, imports it into a scratch copy of
+accounts_payable.db (with all migrations and triggers applied) and
+prints rows/second for the chunked executemany engine and for the old
+per-row iterrows() loop from the Data Manager.
+"""
+import argparse
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.bulk_import import import_chunks, iter_csv_chunks
+from utils.db import DB_PATH
+from utils.migrations import apply_migrations
+
+
+def make_csv(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    invoice_date = np.datetime64('2024-01-01') + rng.integers(0, 365, size=rows).astype('timedelta64[D]')
+    amount = rng.uniform(100, 100000, size=rows).round(2)
+    tax = np.where(rng.random(rows) < 0.3, np.nan, (amount * 0.18).round(2))
+    df = pd.DataFrame({
+        'vendor_id': rng.integers(1, 500, size=rows),
+        'invoice_number': [f"TALLY/{i:07d}" for i in range(rows)],
+        'invoice_date': invoice_date.astype(str),
+        'due_date': (invoice_date + np.timedelta64(30, 'D')).astype(str),
+        'amount': amount,
+        'tax_amount': tax,
+        'total_amount': (amount + np.nan_to_num(tax)).round(2),
+        'status': 'pending',
+        'description': np.where(rng.random(rows) < 0.5, None, 'Purchase voucher'),
+    })
+    return df.to_csv(index=False)
+
+
+def scratch_db(directory):
+    path = os.path.join(directory, 'bench.db')
+    shutil.copy(DB_PATH, path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    apply_migrations(conn)
+    return conn
+
+
+def legacy_import(conn, table, df):
+    """The per-row loop the Import tab used before utils.bulk_import"""
+    for _, row in df.iterrows():
+        row_dict = {k: v for k, v in row.items() if not pd.isna(v)}
+        if row_dict:
+            columns_str = ", ".join(row_dict.keys())
+            placeholders = ", ".join(["?"] * len(row_dict))
+            conn.execute(
+                f"INSERT INTO {table} ({columns_str}) VALUES ({placeholders})",
+                [v.item() if hasattr(v, 'item') else v for v in row_dict.values()]
+            )
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--legacy-rows', type=int, default=20_000,
+                        help='rows for the old loop (0 to skip); it is too slow for the full file')
+    args = parser.parse_args()
+
+    print(f"{'variant':<24} {'rows':>10} {'seconds':>10} {'rows/sec':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        csv_text = make_csv(args.rows)
+
+        conn = scratch_db(directory)
+        columns = conn.execute("PRAGMA table_info(invoices)").fetchall()
+        result = import_chunks(conn, 'invoices', iter_csv_chunks(io.StringIO(csv_text)), columns)
+        print(f"{'chunked executemany':<24} {result['rows_inserted']:>10,} {result['seconds']:>10.2f} "
+              f"{result['rows_inserted'] / result['seconds']:>12,.0f}")
+        conn.close()
+        os.remove(os.path.join(directory, 'bench.db'))
+
+        if args.legacy_rows:
+            conn = scratch_db(directory)
+            df = pd.read_csv(io.StringIO(csv_text), nrows=args.legacy_rows)
+            start = time.perf_counter()
+            legacy_import(conn, 'invoices', df)
+            seconds = time.perf_counter() - start
+            print(f"{'legacy iterrows':<24} {len(df):>10,} {seconds:>10.2f} {len(df) / seconds:>12,.0f}")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
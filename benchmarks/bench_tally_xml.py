@@ -0,0 +1,137 @@
+"""Benchmark for utils.tally_xml
+
+Run from the repository root:
+
+    python -m benchmarks.bench_tally_xml [--vendors 2000] [--vouchers 200000]
+
+Writes a Tally-style recording (ledgers and purchase vouchers, including
+the control-character references Tally emits), serves it with
+utils.tally_replay and syncs it into a scratch copy of accounts_payable.db.
+Prints rows/second and the peak Python memory of the streaming parse next
+to parsing the whole response with ElementTree.fromstring().
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+import xml.etree.ElementTree as ET
+from datetime import date, timedelta
+
+import numpy as np
+
+from utils.db import DB_PATH
+from utils.migrations import apply_migrations
+from utils.tally_replay import ReplayServer
+from utils.tally_sync import sync_all
+from utils.tally_xml import XmlHttpTallySource, iter_records, parse_voucher
+
+
+def write_recording(directory, vendors, vouchers, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(os.path.join(directory, 'APVendors.xml'), 'w', encoding='utf-8') as f:
+        f.write('<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER><BODY><DESC></DESC><DATA><COLLECTION>\n')
+        for i in range(vendors):
+            f.write(
+                f'<LEDGER NAME="Supplier {i}" RESERVEDNAME=""><GUID>ledger-{i}</GUID><ALTERID>{i + 1}</ALTERID>'
+                f'<PARENT>Sundry Creditors</PARENT><EMAIL>supplier{i}@example.com</EMAIL>'
+                f'<ADDRESS.LIST TYPE="String"><ADDRESS>{i} Market Road&#4;</ADDRESS><ADDRESS>Chennai</ADDRESS></ADDRESS.LIST>'
+                f'<PARTYGSTIN>33AAAAA{i:04d}A1Z5</PARTYGSTIN></LEDGER>\n'
+            )
+        f.write('</COLLECTION></DATA></BODY></ENVELOPE>\n')
+
+    start = date(2020, 4, 1)
+    party = rng.integers(0, vendors, size=vouchers)
+    days = rng.integers(0, 5 * 365, size=vouchers)
+    amount = rng.uniform(1000, 500000, size=vouchers).round(2)
+    with open(os.path.join(directory, 'APBills.xml'), 'w', encoding='utf-8') as f:
+        f.write('<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER><BODY><DESC></DESC><DATA><COLLECTION>\n')
+        for i in range(vouchers):
+            tax = round(amount[i] * 0.18, 2)
+            total = round(amount[i] + tax, 2)
+            f.write(
+                f'<VOUCHER VCHTYPE="Purchase" ACTION="Create"><GUID>voucher-{i}</GUID><ALTERID>{vendors + i + 1}</ALTERID>'
+                f'<DATE>{(start + timedelta(days=int(days[i]))).strftime("%Y%m%d")}</DATE>'
+                f'<VOUCHERTYPENAME>Purchase</VOUCHERTYPENAME><VOUCHERNUMBER>{i + 1}</VOUCHERNUMBER>'
+                f'<REFERENCE>INV/{i:07d}</REFERENCE><PARTYLEDGERNAME>Supplier {party[i]}</PARTYLEDGERNAME>'
+                f'<PARTYGUID>ledger-{party[i]}</PARTYGUID><NARRATION>Being goods purchased&#4;</NARRATION>'
+                f'<ISCANCELLED>No</ISCANCELLED>'
+                f'<ALLLEDGERENTRIES.LIST><LEDGERNAME>Supplier {party[i]}</LEDGERNAME><AMOUNT>{total:.2f}</AMOUNT>'
+                f'<BILLALLOCATIONS.LIST><NAME>INV/{i:07d}</NAME><BILLCREDITPERIOD>45 Days</BILLCREDITPERIOD>'
+                f'<AMOUNT>{total:.2f}</AMOUNT></BILLALLOCATIONS.LIST></ALLLEDGERENTRIES.LIST>'
+                f'<ALLLEDGERENTRIES.LIST><LEDGERNAME>Purchase Accounts</LEDGERNAME><AMOUNT>-{amount[i]:.2f}</AMOUNT></ALLLEDGERENTRIES.LIST>'
+                f'<ALLLEDGERENTRIES.LIST><LEDGERNAME>Input IGST</LEDGERNAME><AMOUNT>-{tax:.2f}</AMOUNT></ALLLEDGERENTRIES.LIST>'
+                f'</VOUCHER>\n'
+            )
+        f.write('</COLLECTION></DATA></BODY></ENVELOPE>\n')
+
+
+def scratch_db(directory):
+    path = os.path.join(directory, 'bench.db')
+    shutil.copy(DB_PATH, path)
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    # Start from scratch whatever the copied database had already synced
+    conn.execute("DELETE FROM tally_sync_state")
+    conn.commit()
+    return conn
+
+
+def measure(func):
+    """(result, seconds, peak traced MB) of func(); timed without tracemalloc, which slows it down"""
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vendors', type=int, default=2000)
+    parser.add_argument('--vouchers', type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_recording(directory, args.vendors, args.vouchers)
+        size = os.path.getsize(os.path.join(directory, 'APBills.xml')) / (1024 * 1024)
+        print(f"APBills.xml: {args.vouchers:,} vouchers, {size:,.1f} MB")
+
+        with ReplayServer(directory) as server:
+            source = XmlHttpTallySource('127.0.0.1', server.port)
+            body = source.request_body('invoices', 0)
+
+            def stream_parse():
+                with urllib.request.urlopen(source.url, data=body) as response:
+                    return sum(1 for _ in iter_records(response, 'invoices'))
+
+            def tree_parse():
+                with urllib.request.urlopen(source.url, data=body) as response:
+                    data = response.read().replace(b'&#4;', b'')
+                return sum(1 for voucher in ET.fromstring(data).iter('VOUCHER') if parse_voucher(voucher))
+
+            print(f"{'variant':<24} {'rows':>10} {'seconds':>10} {'rows/sec':>12} {'peak MB':>10}")
+            for name, func in (('iterparse stream', stream_parse), ('ElementTree.fromstring', tree_parse)):
+                rows, seconds, peak = measure(func)
+                print(f"{name:<24} {rows:>10,} {seconds:>10.2f} {rows / seconds:>12,.0f} {peak:>10.1f}")
+
+            conn = scratch_db(directory)
+            start = time.perf_counter()
+            runs = sync_all(conn, source)
+            seconds = time.perf_counter() - start
+            rows = sum(run['rows_inserted'] + run['rows_updated'] for run in runs)
+            print(f"{'sync into SQLite':<24} {rows:>10,} {seconds:>10.2f} {rows / seconds:>12,.0f}")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
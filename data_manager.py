@@ -1,18 +1,15 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 import os
 from datetime import datetime
-import io
 import numpy as np
 
 # Database connection
-DB_PATH = "accounts_payable.db"
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+from utils.db import get_db_connection
+from utils.migrations import internal_tables
+from utils.table_export import EXPORT_FORMATS, available_formats, export_table
+from utils.bulk_import import ImportValidationError, import_chunks, iter_file_chunks, preview_file
+from utils.tracing import traced
 
 def get_table_columns(table_name):
     """Get column names and types for a table"""
@@ -40,6 +37,7 @@ def get_foreign_keys(table_name):
     
     return foreign_keys
 
+@traced()
 def data_management():
     st.title("Data Management")
     
@@ -47,7 +45,9 @@ def data_management():
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
-    tables = [table[0] for table in cursor.fetchall()]
+    # Search indexes, job queue, aging summary etc. are maintained by the app, not edited here
+    hidden = internal_tables(conn)
+    tables = [table[0] for table in cursor.fetchall() if table[0] not in hidden]
     conn.close()
     
     if not tables:
@@ -421,39 +421,48 @@ def data_management():
     with tab4:
         st.subheader(f"Import/Export Data for {selected_table}")
         
-        # Export data
+        # Export data (built only when requested, streamed to a temporary file)
         st.write("### Export Data")
-        conn = get_db_connection()
-        try:
-            df = pd.read_sql(f"SELECT * FROM {selected_table}", conn)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            export_format = st.selectbox("Export format", available_formats(), key="export_format")
+        with col2:
+            st.write("")
+            prepare_export = st.button("Prepare Export")
+        
+        export_key = (selected_table, export_format)
+        
+        if prepare_export:
+            # Remove the previous export file before creating a new one
+            previous = st.session_state.get('export_file')
+            if previous and os.path.exists(previous[1]):
+                os.remove(previous[1])
+            st.session_state.export_file = None
             
-            if len(df) > 0:
-                csv = df.to_csv(index=False)
-                excel_buffer = io.BytesIO()
-                df.to_excel(excel_buffer, index=False)
-                excel_buffer.seek(0)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.download_button(
-                        "Download as CSV",
-                        data=csv,
-                        file_name=f"{selected_table}.csv",
-                        mime="text/csv"
-                    )
-                with col2:
-                    st.download_button(
-                        "Download as Excel",
-                        data=excel_buffer,
-                        file_name=f"{selected_table}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-            else:
-                st.info(f"No data to export from table '{selected_table}'")
-        except Exception as e:
-            st.error(f"Error exporting data: {e}")
-        finally:
-            conn.close()
+            conn = get_db_connection()
+            try:
+                with st.spinner(f"Exporting {selected_table}..."):
+                    export_path = export_table(conn, selected_table, export_format)
+                st.session_state.export_file = (export_key, export_path)
+            except Exception as e:
+                st.error(f"Error exporting data: {e}")
+            finally:
+                conn.close()
+        
+        export_file = st.session_state.get('export_file')
+        if export_file and export_file[0] == export_key and os.path.exists(export_file[1]):
+            export_path = export_file[1]
+            extension, mime = EXPORT_FORMATS[export_format]
+            st.write(f"Export ready: {os.path.getsize(export_path) / (1024 * 1024):.2f} MB")
+            
+            with open(export_path, "rb") as f:
+                st.download_button(
+                    f"Download as {export_format}",
+                    data=f,
+                    file_name=f"{selected_table}{extension}",
+                    mime=mime
+                )
         
         # Import data
         st.write("### Import Data")
@@ -466,18 +475,16 @@ def data_management():
         
         if uploaded_file is not None:
             try:
-                if upload_type == 'CSV':
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
+                # Only the first rows are parsed here; the import itself streams the file
+                preview = preview_file(uploaded_file, upload_type)
                 
                 st.write("Preview of data to be imported:")
-                st.dataframe(df.head())
+                st.dataframe(preview)
                 
                 # Check if required columns exist
                 table_columns = [col["name"] for col in columns]
                 primary_key = next((col["name"] for col in columns if col["pk"] == 1), None)
-                missing_columns = [col for col in table_columns if col not in df.columns and col != primary_key]
+                missing_columns = [col for col in table_columns if col not in preview.columns and col != primary_key]
                 
                 if missing_columns:
                     st.warning(f"Missing columns in import file: {', '.join(missing_columns)}")
@@ -487,44 +494,69 @@ def data_management():
                     "Import options",
                     ["Append new records", "Replace all data in table (WARNING: This will delete existing records)"]
                 )
+                replace = import_options == "Replace all data in table (WARNING: This will delete existing records)"
                 
-                # Import button
-                if st.button("Import Data"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    validate_clicked = st.button("Validate (Dry Run)")
+                with col2:
+                    import_clicked = st.button("Import Data")
+                
+                if validate_clicked or import_clicked:
+                    dry_run = validate_clicked
+                    progress_bar = st.progress(0.0)
+                    status = st.empty()
+                    
+                    def report_progress(rows_done):
+                        file_size = getattr(uploaded_file, "size", 0)
+                        if file_size:
+                            progress_bar.progress(min(uploaded_file.tell() / file_size, 1.0))
+                        status.write(f"{rows_done:,} rows processed...")
+                    
                     conn = get_db_connection()
                     try:
-                        # Remove columns that don't exist in the table
-                        df = df[[col for col in df.columns if col in table_columns]]
+                        uploaded_file.seek(0)
+                        result = import_chunks(
+                            conn,
+                            selected_table,
+                            iter_file_chunks(uploaded_file, upload_type),
+                            columns,
+                            replace=replace,
+                            dry_run=dry_run,
+                            progress=report_progress
+                        )
+                        progress_bar.progress(1.0)
+                        status.write(
+                            f"{result['rows_read']:,} rows in {result['chunks']} chunks, "
+                            f"{result['seconds']:.2f}s ({result['rows_read'] / max(result['seconds'], 1e-9):,.0f} rows/s)"
+                        )
                         
-                        if import_options == "Replace all data in table (WARNING: This will delete existing records)":
-                            # Delete existing records
-                            conn.execute(f"DELETE FROM {selected_table}")
+                        if result['dropped_columns']:
+                            st.info(f"Ignored columns not in {selected_table}: {', '.join(result['dropped_columns'])}")
                         
-                        # Insert new records
-                        for _, row in df.iterrows():
-                            # Remove NaN values
-                            row_dict = {k: v for k, v in row.items() if not pd.isna(v)}
+                        if dry_run:
+                            if result['errors']:
+                                st.error("Validation found problems:")
+                                for error in result['errors']:
+                                    st.write(f"- {error}")
+                            else:
+                                st.success(f"Validation passed: {result['rows_inserted']} records can be imported to {selected_table}. No changes were made.")
+                        else:
+                            st.success(f"Successfully imported {result['rows_inserted']} records to {selected_table}!")
                             
-                            if row_dict:
-                                columns_str = ", ".join(row_dict.keys())
-                                placeholders = ", ".join(["?"] * len(row_dict))
-                                
+                            # Log the action
+                            user_id = st.session_state.get('user', {}).get('user_id')
+                            if user_id:
                                 conn.execute(
-                                    f"INSERT INTO {selected_table} ({columns_str}) VALUES ({placeholders})",
-                                    list(row_dict.values())
+                                    "INSERT INTO audit_logs (user_id, action, entity_type, details) VALUES (?, ?, ?, ?)",
+                                    (user_id, "imported", selected_table, f"Imported {result['rows_inserted']} records to {selected_table}")
                                 )
-                        
-                        conn.commit()
-                        st.success(f"Successfully imported {len(df)} records to {selected_table}!")
-                        
-                        # Log the action
-                        user_id = st.session_state.get('user', {}).get('user_id')
-                        if user_id:
-                            conn.execute(
-                                "INSERT INTO audit_logs (user_id, action, entity_type, details) VALUES (?, ?, ?, ?)",
-                                (user_id, "imported", selected_table, f"Imported {len(df)} records to {selected_table}")
-                            )
-                            conn.commit()
+                                conn.commit()
                     
+                    except ImportValidationError as e:
+                        st.error("Import cancelled, no records were written:")
+                        for error in e.errors:
+                            st.write(f"- {error}")
                     except Exception as e:
                         st.error(f"Error importing data: {e}")
                     finally:
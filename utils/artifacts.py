@@ -0,0 +1,68 @@
+"""Registry of generated files (reports and payment advices)
+
+Every workbook written to reports/ gets a row in the artifacts table with
+its path, size, SHA-256 checksum and content type, optionally linked to
+the record it belongs to (entity_type, entity_id), e.g. the payment
+advice it was generated for. Pages look files up by id or entity instead
+of scanning the reports folder, and only read the bytes when a download
+is requested.
+"""
+import hashlib
+import json
+import os
+import time
+
+CHUNK_SIZE = 1024 * 1024
+
+# file extension -> content type
+CONTENT_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".csv": "text/csv",
+    ".pdf": "application/pdf",
+}
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def register_artifact(conn, path, kind, entity_type=None, entity_id=None, content_type=None, job_id=None):
+    """Record a generated file and return its artifact_id; the caller commits"""
+    content_type = content_type or CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+    cursor = conn.execute("""
+        INSERT INTO artifacts
+        (kind, path, file_name, size, checksum, content_type, entity_type, entity_id, job_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (kind, path, os.path.basename(path), os.path.getsize(path), file_checksum(path), content_type,
+          entity_type, entity_id, job_id, time.time()))
+    return cursor.lastrowid
+
+
+def get_artifact(conn, artifact_id):
+    return conn.execute("SELECT * FROM artifacts WHERE artifact_id = ?", (artifact_id,)).fetchone()
+
+
+def entity_artifacts(conn, entity_type, entity_ids):
+    """{entity_id: artifact row} for the latest artifact of each entity"""
+    rows = conn.execute("""
+        SELECT * FROM artifacts
+        WHERE entity_type = ? AND entity_id IN (SELECT value FROM json_each(?))
+        ORDER BY artifact_id
+    """, (entity_type, json.dumps([int(i) for i in entity_ids]))).fetchall()
+    return {row["entity_id"]: row for row in rows}
+
+
+def read_artifact(artifact):
+    """File bytes of an artifact, or None if the file is gone or no longer matches its size"""
+    try:
+        if os.path.getsize(artifact["path"]) != artifact["size"]:
+            return None
+        with open(artifact["path"], "rb") as f:
+            return f.read()
+    except OSError:
+        return None
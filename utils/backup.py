@@ -0,0 +1,372 @@
+"""Hot backups and restores of the live database
+
+A backup never copies the database file directly, which could capture a
+torn file while a write is in progress. Instead it reads the database
+through SQLite's online backup API (sqlite3.Connection.backup) into a
+temporary copy, PAGES_PER_STEP pages at a time, pausing between steps so
+writers get the lock. Writes made by other connections during the copy
+make SQLite restart it; after MAX_STEP_RESTARTS the copy is taken in one
+step instead, which in WAL mode is a single read transaction that does
+not block writers.
+
+The copy is checked with PRAGMA integrity_check, switched out of WAL mode
+so it is a single self-contained file, and streamed through zstd (when
+the zstandard package is installed) or gzip into
+backups/ap_system_backup_<timestamp>.db.zst|.gz. Only the newest
+BACKUP_KEEP backups of each kind are kept.
+
+restore_backup() decompresses and checks a backup, saves a pre-restore
+backup of the live database, then copies the backup into the live
+database with the backup API in one write transaction. Every connection,
+in any process, sees either the old database or the restored one, never
+a mix, and nothing replaces the file out from under open connections or
+their WAL.
+
+Backups run on the background worker as the "database_backup" job.
+
+The Settings page offers backups up to DOWNLOAD_LIMIT for download.
+Streamlit's download_button has to hold the whole file in memory, so
+larger backups are copied from backups/ on the server instead.
+
+    python -m utils.backup [--list] [--keep N] [--compression gzip|zstd] [--restore PATH]
+"""
+import argparse
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from utils.db import BUSY_TIMEOUT_MS, DB_PATH
+from utils.jobs import job_handler, report_progress
+
+try:
+    import zstandard
+except ImportError:  # gzip only
+    zstandard = None
+
+BACKUP_DIR = "backups"
+BACKUP_PREFIX = "ap_system_backup_"
+PRE_RESTORE_PREFIX = "pre_restore_backup_"
+BACKUP_KEEP = 7  # newest backups of each kind kept; the setting "backup_keep" overrides it
+PAGES_PER_STEP = 1024
+STEP_PAUSE = 0.005  # seconds between steps, for writers waiting on the lock
+MAX_STEP_RESTARTS = 3
+CHUNK_SIZE = 1024 * 1024
+GZIP_LEVEL = 3
+ZSTD_LEVEL = 10
+DOWNLOAD_LIMIT = 100 * 1024 * 1024  # bytes; larger backups are not offered for in-app download
+BACKUP_JOB = "database_backup"
+BACKUP_SCHEDULE = "database_backup"
+
+# Backup Frequency setting -> schedule interval in seconds; Manual has no schedule
+BACKUP_INTERVALS = {
+    "Daily": 86400,
+    "Weekly": 7 * 86400,
+}
+
+# Tables a file must have to be restored over the live database
+REQUIRED_TABLES = ("users", "vendors", "invoices", "payment_requests")
+
+EXTENSIONS = {"zstd": ".db.zst", "gzip": ".db.gz", None: ".db"}
+BACKUP_NAME_RE = re.compile(r"^(?P<prefix>[a-z_]+_)(?P<stamp>\d{14})\.db(\.gz|\.zst)?$")
+
+
+class BackupError(Exception):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def default_compression():
+    return "zstd" if zstandard is not None else "gzip"
+
+
+def _open_compressed(path, mode, compression):
+    """File object that (de)compresses to or from path as it is written or read"""
+    if compression == "gzip":
+        return gzip.open(path, mode + "b", compresslevel=GZIP_LEVEL) if mode == "w" else gzip.open(path, "rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise BackupError("zstd backups need the zstandard package")
+        raw = open(path, mode + "b")
+        if mode == "w":
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(raw, closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return open(path, mode + "b")
+
+
+def compression_of(path):
+    if path.endswith(".zst"):
+        return "zstd"
+    if path.endswith(".gz"):
+        return "gzip"
+    return None
+
+
+def snapshot(db_path, target_path):
+    """Copy a live database to target_path with the backup API; returns the number of step restarts"""
+    state = {"remaining": None, "restarts": 0}
+
+    def step(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            # Another connection wrote to the database, so SQLite started over
+            state["restarts"] += 1
+            if state["restarts"] > MAX_STEP_RESTARTS:
+                raise _TooManyRestarts()
+        state["remaining"] = remaining
+        time.sleep(STEP_PAUSE)
+
+    source = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=PAGES_PER_STEP, progress=step)
+        except _TooManyRestarts:
+            source.backup(target, pages=-1)
+        # A standalone file: no -wal or -shm needed next to it
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        target.close()
+        source.close()
+    return state["restarts"]
+
+
+def integrity_problems(path):
+    """Messages from PRAGMA integrity_check on a database file; empty if it is sound"""
+    conn = sqlite3.connect(path)
+    try:
+        rows = [row[0] for row in conn.execute("PRAGMA integrity_check").fetchall()]
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        conn.close()
+    return [] if rows == ["ok"] else rows
+
+
+def _compress(source_path, target_path, compression, progress):
+    total = os.path.getsize(source_path) or 1
+    done = 0
+    with open(source_path, "rb") as src, _open_compressed(target_path, "w", compression) as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            dst.write(chunk)
+            done += len(chunk)
+            progress(done / total)
+
+
+def list_backups(backup_dir=BACKUP_DIR, prefix=None):
+    """Backups in backup_dir, newest first, as dicts of path, file_name, kind, created_at and size"""
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for name in os.listdir(backup_dir):
+        match = BACKUP_NAME_RE.match(name)
+        if not match or (prefix and match.group("prefix") != prefix):
+            continue
+        path = os.path.join(backup_dir, name)
+        backups.append({
+            "path": path,
+            "file_name": name,
+            "kind": "pre-restore" if match.group("prefix") == PRE_RESTORE_PREFIX else "backup",
+            "created_at": datetime.strptime(match.group("stamp"), "%Y%m%d%H%M%S"),
+            "size": os.path.getsize(path),
+        })
+    return sorted(backups, key=lambda backup: (backup["created_at"], backup["file_name"]), reverse=True)
+
+
+def prune_backups(backup_dir=BACKUP_DIR, prefix=BACKUP_PREFIX, keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` backups with this prefix; returns the deleted paths"""
+    removed = []
+    for backup in list_backups(backup_dir, prefix)[max(keep, 1):]:
+        os.remove(backup["path"])
+        removed.append(backup["path"])
+    return removed
+
+
+def create_backup(db_path=DB_PATH, backup_dir=BACKUP_DIR, compression=None, keep=BACKUP_KEEP,
+                  prefix=BACKUP_PREFIX, progress=None):
+    """Take a hot backup of db_path and return a summary dict with its path.
+
+    progress(fraction, message) is called while the copy is compressed.
+    """
+    progress = progress or (lambda fraction, message=None: None)
+    compression = compression or default_compression()
+    os.makedirs(backup_dir, exist_ok=True)
+    start = time.monotonic()
+
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    path = os.path.join(backup_dir, f"{prefix}{stamp}{EXTENSIONS[compression]}")
+    fd, copy_path = tempfile.mkstemp(suffix=".db.part", dir=backup_dir)
+    os.close(fd)
+    part_path = path + ".part"
+    try:
+        restarts = snapshot(db_path, copy_path)
+        problems = integrity_problems(copy_path)
+        if problems:
+            raise BackupError(f"Backup copy failed the integrity check: {'; '.join(problems[:5])}")
+
+        progress(0.0, "Compressing")
+        _compress(copy_path, part_path, compression, lambda fraction: progress(fraction, "Compressing"))
+        os.replace(part_path, path)
+        database_size = os.path.getsize(copy_path)
+    finally:
+        for leftover in (copy_path, part_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    pruned = prune_backups(backup_dir, prefix, keep)
+    progress(1.0, "Done")
+    return {
+        "path": path,
+        "file_name": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "database_size": database_size,
+        "compression": compression,
+        "restarts": restarts,
+        "pruned": len(pruned),
+        "seconds": round(time.monotonic() - start, 2),
+    }
+
+
+def _decompress(path, backup_dir):
+    """Uncompressed copy of a backup in a temporary file; the caller removes it"""
+    fd, copy_path = tempfile.mkstemp(suffix=".restore.db", dir=backup_dir)
+    try:
+        with os.fdopen(fd, "wb") as dst, _open_compressed(path, "r", compression_of(path)) as src:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    except Exception:
+        os.remove(copy_path)
+        raise
+    return copy_path
+
+
+def _check_restorable(path):
+    problems = integrity_problems(path)
+    if problems:
+        raise BackupError(f"Backup failed the integrity check: {'; '.join(problems[:5])}")
+    conn = sqlite3.connect(path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    finally:
+        conn.close()
+    missing = [table for table in REQUIRED_TABLES if table not in tables]
+    if missing:
+        raise BackupError(f"Not an accounts payable database (missing {', '.join(missing)})")
+
+
+def restore_backup(path, db_path=DB_PATH, backup_dir=BACKUP_DIR):
+    """Replace the contents of db_path with a backup file (.db, .db.gz or .db.zst).
+
+    The live database is backed up first (as a pre-restore backup). The
+    caller resets its connection pool and caches afterwards so the next
+    checkout migrates the restored schema. Returns a summary dict.
+    """
+    start = time.monotonic()
+    os.makedirs(backup_dir, exist_ok=True)
+    copy_path = _decompress(path, backup_dir)
+    try:
+        _check_restorable(copy_path)
+        pre_restore = create_backup(db_path, backup_dir, prefix=PRE_RESTORE_PREFIX)
+
+        source = sqlite3.connect(copy_path)
+        live = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+        try:
+            # A WAL database can only be the target of a backup with the same page size
+            page_size = live.execute("PRAGMA page_size").fetchone()[0]
+            if source.execute("PRAGMA page_size").fetchone()[0] != page_size:
+                source.execute(f"PRAGMA page_size = {page_size}")
+                source.execute("VACUUM")
+            versions = _table_versions(live)
+            # One step: the whole database is replaced in a single write transaction
+            source.backup(live, pages=-1)
+            _advance_table_versions(live, versions)
+            _cancel_restored_backup_jobs(live)
+            live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            live.close()
+            source.close()
+    finally:
+        os.remove(copy_path)
+
+    return {
+        "restored": os.path.basename(path),
+        "pre_restore_backup": pre_restore["path"],
+        "seconds": round(time.monotonic() - start, 2),
+    }
+
+
+def _table_versions(conn):
+    try:
+        return dict(conn.execute("SELECT table_name, version FROM table_versions").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+
+def _advance_table_versions(conn, before):
+    """Move every table version past both the old and the restored value.
+
+    Cached query results and report cubes are keyed by these counters, so
+    a restored database must not reuse a version some process has cached.
+    """
+    after = _table_versions(conn)
+    if not after:
+        return
+    conn.executemany(
+        "UPDATE table_versions SET version = ? WHERE table_name = ?",
+        [(max(version, before.get(table, 0)) + 1, table) for table, version in after.items()]
+    )
+    conn.commit()
+
+
+def _cancel_restored_backup_jobs(conn):
+    """Backup jobs, like the one that took the copy, are still running in it; nothing will finish them"""
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE kind = ? AND status IN ('queued', 'running')",
+            (time.time(), BACKUP_JOB)
+        )
+    except sqlite3.OperationalError:  # restored from before the job queue existed
+        return
+    conn.commit()
+
+
+@job_handler(BACKUP_JOB)
+def run_backup_job(payload):
+    from utils.settings import load_settings
+
+    keep = int(load_settings().get("backup_keep", BACKUP_KEEP))
+    report_progress(0.0, "Copying the database")
+    return create_backup(compression=payload.get("compression"), keep=keep, progress=report_progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up or restore the database while it is in use")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    parser.add_argument("--compression", choices=["zstd", "gzip"], help="default: zstd if available, else gzip")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="newest backups to keep")
+    parser.add_argument("--list", action="store_true", help="list backups instead of taking one")
+    parser.add_argument("--restore", metavar="PATH", help="restore this backup over the database")
+    args = parser.parse_args()
+
+    if args.list:
+        for backup in list_backups(args.dir):
+            print(f"{backup['file_name']:48} {backup['kind']:12} {backup['size'] / (1024 * 1024):10,.1f} MB")
+    elif args.restore:
+        result = restore_backup(args.restore, args.db, args.dir)
+        print(f"Restored {result['restored']} in {result['seconds']} s; "
+              f"previous database saved as {result['pre_restore_backup']}")
+    else:
+        result = create_backup(args.db, args.dir, args.compression, args.keep)
+        print(f"{result['path']}: {result['database_size'] / (1024 * 1024):,.1f} MB database, "
+              f"{result['size'] / (1024 * 1024):,.1f} MB {result['compression']}, "
+              f"{result['restarts']} restarts, {result['pruned']} pruned, {result['seconds']} s")
+
+
+if __name__ == "__main__":
+    main()
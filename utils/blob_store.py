@@ -0,0 +1,245 @@
+"""Content-addressed store for uploaded invoice files and KYC documents
+
+Uploads are hashed (SHA-256) while they are streamed to a temporary file
+in chunks, then moved to uploads/blobs/<aa>/<bb>/<digest><ext>, sharded
+by the first two bytes of the digest so no directory grows too large.
+The blobs table keeps one row per distinct file with a reference count:
+uploading a file that is already stored only adds a reference, and
+release() removes the file once nothing refers to it.
+
+invoices.invoice_file_path and vendor_documents.document_path hold the
+blob path, so readers open it like any other file. Files uploaded before
+the store existed are copied into it by migration 8, and
+remove_legacy_files() deletes the old copies once nothing refers to them.
+
+    python -m utils.blob_store [--recount] [--remove-legacy]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+UPLOADS_DIR = "uploads"
+BLOB_DIR = os.path.join(UPLOADS_DIR, "blobs")
+CHUNK_SIZE = 1024 * 1024
+
+# Name prefixes of files the upload forms wrote before the store existed
+LEGACY_PREFIXES = ("invoice_", "vendor_")
+
+# (table, column) pairs that reference blobs by path
+REFERENCES = (
+    ("invoices", "invoice_file_path"),
+    ("vendor_documents", "document_path"),
+)
+
+
+def blob_path(digest, extension=""):
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:4], f"{digest}{extension.lower()}")
+
+
+def _write_temp(chunks):
+    """Stream chunks to a temporary file in the blob directory; returns (temp path, digest, size)"""
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=BLOB_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def _read_chunks(fileobj):
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _add_blob(conn, tmp_path, digest, size, extension):
+    """Add a reference to the blob with this digest, moving tmp_path into place if it is new.
+
+    Runs inside the caller's write transaction, which serializes it with
+    release() deleting a blob whose count dropped to zero.
+    """
+    existing = conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+    if existing:
+        os.remove(tmp_path)
+        conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE digest = ?", (digest,))
+        return existing[0]
+
+    path = blob_path(digest, extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    conn.execute("""
+        INSERT INTO blobs (digest, path, size, refcount, created_at)
+        VALUES (?, ?, ?, 1, ?)
+    """, (digest, path, size, time.time()))
+    return path
+
+
+def store(conn, fileobj, filename=""):
+    """Store an uploaded file (any object with read()) and return its blob path.
+
+    The new reference is committed here; release() it if the row that was
+    going to refer to it is not saved.
+    """
+    tmp_path, digest, size = _write_temp(_read_chunks(fileobj))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        path = _add_blob(conn, tmp_path, digest, size, os.path.splitext(filename)[1])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def release(conn, path):
+    """Drop one reference to a blob, deleting the file when it was the last; returns whether it was deleted"""
+    if not path:
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT digest, refcount FROM blobs WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        if row[1] > 1:
+            conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (row[0],))
+            conn.commit()
+            return False
+        conn.execute("DELETE FROM blobs WHERE digest = ?", (row[0],))
+        # Removed under the write lock so a concurrent store() of the same content re-creates it
+        if os.path.exists(path):
+            os.remove(path)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+def read_blob(path):
+    """Bytes of a stored file, or None if it is missing"""
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _reference_counts_sql():
+    return " UNION ALL ".join(
+        f"SELECT {column} AS path FROM {table} WHERE {column} IS NOT NULL" for table, column in REFERENCES
+    )
+
+
+def recount(conn):
+    """Reset every blob's refcount from the rows that refer to it; the caller commits"""
+    conn.execute("UPDATE blobs SET refcount = 0")
+    conn.execute(f"""
+        UPDATE blobs
+        SET refcount = refs.n
+        FROM (SELECT path, COUNT(*) AS n FROM ({_reference_counts_sql()}) GROUP BY path) refs
+        WHERE refs.path = blobs.path
+    """)
+
+
+def migrate_legacy_uploads(conn):
+    """Move files referenced by their old uploads/ paths into the store; the caller commits.
+
+    Files are copied (hard-linked where possible) so a failed migration
+    leaves the old paths working; remove_legacy_files() deletes them later.
+    Returns the number of distinct files migrated.
+    """
+    prefix = os.path.join(BLOB_DIR, "")
+    legacy = conn.execute(f"""
+        SELECT DISTINCT path FROM ({_reference_counts_sql()})
+        WHERE path NOT LIKE ? || '%'
+    """, (prefix,)).fetchall()
+
+    migrated = 0
+    for (old_path,) in legacy:
+        if not os.path.isfile(old_path):
+            continue
+        with open(old_path, "rb") as f:
+            digest = hashlib.sha256()
+            for chunk in _read_chunks(f):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        existing = conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if existing:
+            new_path = existing[0]
+        else:
+            new_path = blob_path(digest, os.path.splitext(old_path)[1])
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            if not os.path.exists(new_path):
+                try:
+                    os.link(old_path, new_path)
+                except OSError:
+                    shutil.copyfile(old_path, new_path)
+            conn.execute("""
+                INSERT INTO blobs (digest, path, size, refcount, created_at)
+                VALUES (?, ?, ?, 0, ?)
+            """, (digest, new_path, os.path.getsize(new_path), time.time()))
+
+        for table, column in REFERENCES:
+            conn.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?", (new_path, old_path))
+        migrated += 1
+
+    recount(conn)
+    return migrated
+
+
+def remove_legacy_files(conn):
+    """Delete old-style upload files directly under uploads/ that no row refers to any more; returns how many"""
+    if not os.path.isdir(UPLOADS_DIR):
+        return 0
+    referenced = {row[0] for row in conn.execute(_reference_counts_sql()).fetchall()}
+    removed = 0
+    for name in os.listdir(UPLOADS_DIR):
+        path = os.path.join(UPLOADS_DIR, name)
+        if name.startswith(LEGACY_PREFIXES) and os.path.isfile(path) and path not in referenced:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def main():
+    from utils.db import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Maintain the uploaded document store")
+    parser.add_argument("--recount", action="store_true", help="recompute reference counts from the database")
+    parser.add_argument("--remove-legacy", action="store_true", help="delete old uploads/ files nothing refers to")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.recount:
+            recount(conn)
+            conn.commit()
+        if args.remove_legacy:
+            print(f"Removed {remove_legacy_files(conn)} legacy files")
+        count, size, refs = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refcount), 0) FROM blobs"
+        ).fetchone()
+        print(f"{count} blobs, {size / (1024 * 1024):,.1f} MB, {refs} references")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
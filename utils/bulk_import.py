@@ -0,0 +1,227 @@
+"""Streaming CSV/Excel import for the Data Manager
+
+Files are read in fixed-size chunks (pandas for CSV, openpyxl read-only
+mode for .xlsx) so only one chunk is held as a DataFrame at a time.
+Consecutive rows in a chunk with the same non-null columns are written
+with a single executemany() call, so rows are inserted in file order. The
+whole import runs in one transaction: it either lands completely or not
+at all.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+IMPORT_CHUNK_SIZE = 10000
+NUMERIC_TYPES = ("INT", "DECIMAL", "REAL", "FLOAT", "NUMERIC", "DOUBLE")
+MAX_REPORTED_ROWS = 5  # example row numbers listed per validation error
+
+
+class ImportValidationError(Exception):
+    """Raised when a chunk fails validation during a real (non dry-run) import"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def iter_csv_chunks(file, chunksize=IMPORT_CHUNK_SIZE):
+    """Yield DataFrames of at most chunksize rows from a CSV file"""
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        yield chunk
+
+
+def iter_excel_chunks(file, chunksize=IMPORT_CHUNK_SIZE):
+    """Yield DataFrames of at most chunksize rows from the first sheet of an .xlsx file"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(name) if name is not None else f"column_{i}" for i, name in enumerate(header)]
+
+        batch = []
+        for row in rows:
+            batch.append(row[:len(header)])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def iter_file_chunks(file, file_type, chunksize=IMPORT_CHUNK_SIZE):
+    """Yield DataFrame chunks from an uploaded CSV or Excel file"""
+    if file_type == "CSV":
+        return iter_csv_chunks(file, chunksize)
+    if getattr(file, "name", "").lower().endswith(".xls"):
+        # Legacy .xls has no streaming reader; it is small by format limits anyway
+        return iter([pd.read_excel(file)])
+    return iter_excel_chunks(file, chunksize)
+
+
+def preview_file(file, file_type, rows=5):
+    """First few rows of an uploaded file, leaving the file rewound"""
+    preview = next(iter_file_chunks(file, file_type, chunksize=rows), pd.DataFrame())
+    file.seek(0)
+    return preview.head(rows)
+
+
+def _row_numbers(mask, first_row):
+    """Spreadsheet row numbers (header is row 1) for the True entries of mask"""
+    rows = np.flatnonzero(mask)[:MAX_REPORTED_ROWS] + first_row
+    return ", ".join(str(row) for row in rows)
+
+
+def validate_chunk(chunk, table_columns, first_row):
+    """Return a list of human readable problems found in a chunk"""
+    errors = []
+
+    for col in table_columns:
+        name = col["name"]
+        required = col["notnull"] and col["dflt_value"] is None and not col["pk"]
+
+        if name not in chunk.columns:
+            if required:
+                errors.append(f"Required column '{name}' is missing")
+            continue
+
+        values = chunk[name]
+        if required:
+            missing = values.isna().to_numpy()
+            if missing.any():
+                errors.append(
+                    f"{int(missing.sum())} rows have no value for required column '{name}' "
+                    f"(rows {_row_numbers(missing, first_row)})"
+                )
+
+        if any(t in col["type"].upper() for t in NUMERIC_TYPES) and not pd.api.types.is_numeric_dtype(values):
+            bad = (pd.to_numeric(values, errors="coerce").isna() & values.notna()).to_numpy()
+            if bad.any():
+                errors.append(
+                    f"{int(bad.sum())} rows have a non-numeric value in '{name}' "
+                    f"(rows {_row_numbers(bad, first_row)})"
+                )
+
+    return errors
+
+
+def _prepare_chunk(chunk, column_names):
+    """Keep known columns and make values bindable by sqlite3"""
+    chunk = chunk[[c for c in chunk.columns if c in column_names]]
+    for name in chunk.columns:
+        values = chunk[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            has_time = (values.dropna().dt.normalize() != values.dropna()).any()
+            chunk = chunk.assign(**{name: values.dt.strftime("%Y-%m-%d %H:%M:%S" if has_time else "%Y-%m-%d")})
+    return chunk
+
+
+def _insert_chunk(conn, table, chunk):
+    """Insert a chunk in file order, with one executemany per run of rows sharing a non-null column signature"""
+    columns = list(chunk.columns)
+    if not columns or chunk.empty:
+        return 0, 0, 0
+
+    mask = chunk.notna().to_numpy()
+    values = chunk.to_numpy(dtype=object)
+
+    # Pack each row's null pattern into bytes and batch consecutive rows with the same
+    # pattern; batching only runs keeps AUTOINCREMENT ids in file order
+    packed = np.ascontiguousarray(np.packbits(mask, axis=1))
+    signatures = packed.view(np.dtype((np.void, packed.shape[1]))).ravel()
+    groups = np.split(np.arange(len(signatures)), np.flatnonzero(signatures[1:] != signatures[:-1]) + 1)
+
+    inserted = 0
+    skipped = 0
+    for rows in groups:
+        col_index = np.flatnonzero(mask[rows[0]])
+        if len(col_index) == 0:
+            # Completely empty rows
+            skipped += len(rows)
+            continue
+        names = ", ".join(columns[i] for i in col_index)
+        placeholders = ", ".join(["?"] * len(col_index))
+        conn.executemany(
+            f"INSERT INTO {table} ({names}) VALUES ({placeholders})",
+            values[np.ix_(rows, col_index)].tolist()
+        )
+        inserted += len(rows)
+
+    return inserted, skipped, len(groups)
+
+
+def import_chunks(conn, table, chunks, table_columns, replace=False, dry_run=False, progress=None):
+    """Validate and insert DataFrame chunks into a table in a single transaction.
+
+    With dry_run=True every chunk is validated and inserted, then the
+    transaction is rolled back, so constraint failures (CHECK, UNIQUE,
+    triggers) are reported without changing the database. progress, if
+    given, is called with the number of rows processed after each chunk.
+    """
+    column_names = [col["name"] for col in table_columns]
+    result = {
+        "rows_read": 0,
+        "rows_inserted": 0,
+        "rows_skipped": 0,
+        "chunks": 0,
+        "statements": 0,
+        "dropped_columns": [],
+        "errors": [],
+        "dry_run": dry_run,
+        "seconds": 0.0,
+    }
+    start = time.perf_counter()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if replace:
+            conn.execute(f"DELETE FROM {table}")
+
+        for chunk in chunks:
+            first_row = result["rows_read"] + 2
+            result["chunks"] += 1
+            result["rows_read"] += len(chunk)
+
+            for name in chunk.columns:
+                if name not in column_names and name not in result["dropped_columns"]:
+                    result["dropped_columns"].append(name)
+
+            errors = validate_chunk(chunk, table_columns, first_row)
+            if errors:
+                result["errors"].extend(e for e in errors if e not in result["errors"])
+                if not dry_run:
+                    raise ImportValidationError(errors)
+                continue
+
+            try:
+                inserted, skipped, statements = _insert_chunk(conn, table, _prepare_chunk(chunk, column_names))
+            except Exception as e:
+                if not dry_run:
+                    raise
+                result["errors"].append(f"Rows {first_row}-{first_row + len(chunk) - 1}: {e}")
+                continue
+
+            result["rows_inserted"] += inserted
+            result["rows_skipped"] += skipped
+            result["statements"] += statements
+
+            if progress:
+                progress(result["rows_read"])
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+    return result
@@ -0,0 +1,45 @@
+"""Integer date keys for grouping and range scans
+
+Migration 11 adds generated columns next to the date columns of invoices,
+payment_advices and payment_requests:
+
+- a day key, the number of days since 1970-01-01 (20697 is 2026-09-01);
+- a month key, year * 100 + month (202609).
+
+Both are indexed, so a report grouping by month or filtering on a date
+range walks an index in key order instead of computing strftime() on every
+row and sorting the result in a temporary B-tree. Times of day are dropped,
+so a TIMESTAMP column gets the key of its date.
+"""
+from datetime import date
+
+import pandas as pd
+
+EPOCH = date(1970, 1, 1)
+
+# SQL expressions for the keys of a DATE or TIMESTAMP column
+DAY_KEY_SQL = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+MONTH_KEY_SQL = "CAST(strftime('%Y%m', {column}) AS INTEGER)"
+
+
+def day_key(value):
+    """Day key of a date or datetime"""
+    if hasattr(value, "date"):
+        value = value.date()
+    return (value - EPOCH).days
+
+
+def month_key(value):
+    """Month key of a date or datetime"""
+    return value.year * 100 + value.month
+
+
+def month_start(keys):
+    """First day of each month key in a Series, as datetimes"""
+    keys = pd.to_numeric(keys)
+    return pd.to_datetime(pd.DataFrame({"year": keys // 100, "month": keys % 100, "day": 1}))
+
+
+def month_label(keys):
+    """'2026-09' labels for a Series of month keys"""
+    return month_start(keys).dt.strftime("%Y-%m")
@@ -0,0 +1,270 @@
+"""Shared SQLite connection pool used by app.py and data_manager.py"""
+import sqlite3
+import threading
+import time
+
+from utils.migrations import apply_migrations
+from utils.profiler import ProfiledCursor
+
+# Database connection
+DB_PATH = "accounts_payable.db"
+
+# Pool settings
+POOL_SIZE = 8
+CHECKOUT_TIMEOUT = 30.0  # seconds to wait for a free connection
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+HEALTH_CHECK_INTERVAL = 60.0  # idle seconds before a connection is pinged on checkout
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute does not go through self.cursor(), so route
+    # the shortcuts explicitly to get every statement profiled
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        pool = getattr(self, "pool", None)
+        if pool is None:
+            sqlite3.Connection.close(self)
+        else:
+            pool.release(self)
+
+    def discard(self):
+        """Really close the underlying connection"""
+        self.pool = None
+        try:
+            sqlite3.Connection.close(self)
+        except sqlite3.Error:
+            pass
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections with per-thread checkout.
+
+    A thread that asks for a connection while it already holds one gets the
+    same connection back, so nested get_db_connection() calls inside one
+    Streamlit rerun never wait on the pool. The connection goes back to the
+    pool when the outermost caller closes it.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_size=POOL_SIZE, timeout=CHECKOUT_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = []
+        self._owners = {}  # thread ident -> [connection, depth, thread]
+        self._created = 0
+        self._generation = 0
+        self._stats = {
+            "checkouts": 0,
+            "reuses": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "peak_in_use": 0,
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "health_check_failures": 0,
+            "reclaimed": 0,
+        }
+        self._init_database()
+
+    def _init_database(self):
+        # journal_mode is stored in the database file, so it only has to be set once
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=PooledConnection,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.pool = self
+        conn.generation = self._generation
+        conn.last_used = time.monotonic()
+        self._stats["connections_opened"] += 1
+        return conn
+
+    def _discard(self, conn):
+        conn.discard()
+        self._created -= 1
+        self._stats["connections_closed"] += 1
+
+    def _is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _reset(self, conn):
+        """Put a returned connection back into a clean state; False if it is broken"""
+        try:
+            if conn.in_transaction:
+                # Same outcome as closing a plain connection without commit
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _checkin(self, conn):
+        if conn.generation != self._generation or not self._reset(conn):
+            self._discard(conn)
+        else:
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+        self._cond.notify()
+
+    def _reap_dead_owners(self):
+        """Reclaim connections held by threads that exited without closing them"""
+        for ident, (conn, depth, thread) in list(self._owners.items()):
+            if not thread.is_alive():
+                del self._owners[ident]
+                self._stats["reclaimed"] += 1
+                self._checkin(conn)
+
+    def acquire(self):
+        thread = threading.current_thread()
+        ident = thread.ident
+
+        with self._cond:
+            held = self._owners.get(ident)
+            if held is not None and held[2] is thread:
+                held[1] += 1
+                self._stats["reuses"] += 1
+                return held[0]
+            if held is not None:
+                # Thread ident was recycled after the previous owner died
+                self._reap_dead_owners()
+
+            start = time.monotonic()
+            deadline = start + self.timeout
+            waited = False
+            conn = None
+            while conn is None:
+                if self._idle:
+                    conn = self._idle.pop()
+                elif self._created < self.max_size:
+                    self._created += 1
+                    try:
+                        conn = self._connect()
+                    except sqlite3.Error:
+                        self._created -= 1
+                        raise
+                else:
+                    self._reap_dead_owners()
+                    if self._idle:
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise sqlite3.OperationalError(
+                            f"Timed out after {self.timeout:.0f}s waiting for a database connection"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+            if time.monotonic() - conn.last_used > HEALTH_CHECK_INTERVAL and not self._is_healthy(conn):
+                self._stats["health_check_failures"] += 1
+                self._discard(conn)
+                self._created += 1
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+
+            wait_time = time.monotonic() - start
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += wait_time
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
+
+            self._owners[ident] = [conn, 1, thread]
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], len(self._owners))
+            return conn
+
+    def release(self, conn):
+        with self._cond:
+            for ident, held in self._owners.items():
+                if held[0] is conn:
+                    held[1] -= 1
+                    if held[1] <= 0:
+                        del self._owners[ident]
+                        self._checkin(conn)
+                    return
+            # Not checked out (e.g. closed twice): nothing to do
+
+    def close_all(self):
+        """Close idle connections and retire checked-out ones when they are returned"""
+        with self._cond:
+            self._generation += 1
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pool_size"] = self.max_size
+            stats["open"] = self._created
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = len(self._owners)
+            stats["avg_wait_ms"] = (
+                stats["wait_time_total"] / stats["checkouts"] * 1000 if stats["checkouts"] else 0.0
+            )
+            return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it and migrating the schema on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool = ConnectionPool(DB_PATH)
+            conn = pool.acquire()
+            try:
+                apply_migrations(conn)
+            finally:
+                conn.close()
+            _pool = pool
+        return _pool
+
+
+def reset_pool():
+    """Close every pooled connection; the next checkout reopens and re-migrates"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+def get_db_connection():
+    """Check out a pooled connection; conn.close() returns it to the pool"""
+    return get_pool().acquire()
@@ -0,0 +1,323 @@
+"""Excel workbooks for the aging report and payment advices
+
+Workbooks are written with openpyxl's write-only mode and the invoice
+rows are read in batches, so memory use does not grow with the size of
+the ledger. Each file is written under a temporary name and renamed into
+reports/ once complete, so a download never sees a partial workbook.
+
+Generation runs on the background job worker (utils.jobs) as the
+"aging_report" and "payment_advice" jobs. Their concurrency limits keep a
+burst of month-end requests from building many workbooks at once. Each
+finished file is registered in utils.artifacts and the job's result holds
+its artifact_id.
+
+The aging workbook reads through utils.report_reader, so a long export
+never holds a read transaction open on the live database; its summary
+sheet records when that data was read.
+"""
+import os
+import tempfile
+from datetime import date, datetime
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from utils.artifacts import register_artifact
+from utils.aging import AGING_LABELS, assign_buckets, bucket_labels, days_overdue
+from utils.db import get_db_connection
+from utils.jobs import current_job_id, job_handler, report_progress
+from utils.migrations import OPEN_STATUSES
+from utils.money import to_dollars
+from utils.report_reader import get_report_connection
+
+REPORTS_DIR = "reports"
+REPORT_BATCH_SIZE = 5000
+REPORT_CONCURRENCY = 2  # workbooks of each kind built at once across all workers
+AGING_JOB = "aging_report"
+PAYMENT_ADVICE_JOB = "payment_advice"
+
+
+class ExcelReportGenerator:
+    def __init__(self, reports_dir=REPORTS_DIR, progress=None):
+        self.reports_dir = reports_dir
+        # progress(fraction, message) is called as rows are written
+        self.progress = progress or (lambda fraction, message=None: None)
+
+    def _bold_row(self, sheet, values):
+        row = []
+        for value in values:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.font = Font(bold=True)
+            row.append(cell)
+        sheet.append(row)
+
+    def _save(self, workbook, filename, publish=True):
+        """Save under a temporary name, then move into place; returns the final path.
+
+        With publish=False the file stays under its private temporary name,
+        which is returned; the caller moves it to the final name itself.
+        """
+        os.makedirs(self.reports_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".xlsx.tmp", dir=self.reports_dir)
+        os.close(fd)
+        try:
+            workbook.save(tmp_path)
+            if not publish:
+                return tmp_path
+            path = os.path.join(self.reports_dir, filename)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return path
+
+    def generate_aging_report(self, as_of_date):
+        """Aging workbook as of a YYYY-MM-DD date; returns (success, path or error message)"""
+        try:
+            return True, self._aging_report(date.fromisoformat(as_of_date))
+        except Exception as e:
+            return False, str(e)
+
+    def _aging_report(self, as_of):
+        conn = get_report_connection()
+        try:
+            summary_rows = conn.execute("""
+                SELECT s.vendor_id, v.vendor_name, s.due_date, s.invoice_count, s.total_cents
+                FROM invoice_aging_summary s
+                JOIN vendors v ON s.vendor_id = v.vendor_id
+            """).fetchall()
+            invoice_count = sum(row["invoice_count"] for row in summary_rows)
+
+            workbook = openpyxl.Workbook(write_only=True)
+            summary_sheet = workbook.create_sheet("Summary")
+            vendor_sheet = workbook.create_sheet("By Vendor")
+            detail_sheet = workbook.create_sheet("Invoices")
+
+            # Bucket totals and the vendor breakdown come from the pre-aggregated summary,
+            # summed in cents and written as dollars
+            self._bold_row(summary_sheet, [f"Accounts Payable Aging as of {as_of.isoformat()}"])
+            summary_sheet.append(["Data as of", datetime.fromtimestamp(conn.as_of).strftime("%Y-%m-%d %H:%M:%S")])
+            self._bold_row(summary_sheet, ["Aging Bucket", "Invoices", "Amount"])
+            totals = {label: [0, 0] for label in AGING_LABELS}
+            vendors = {}
+            if summary_rows:
+                labels = bucket_labels(assign_buckets([row["due_date"] for row in summary_rows], as_of))
+                for row, label in zip(summary_rows, labels):
+                    totals[label][0] += row["invoice_count"]
+                    totals[label][1] += row["total_cents"]
+                    vendor = vendors.setdefault(row["vendor_name"], {name: 0 for name in AGING_LABELS})
+                    vendor[label] += row["total_cents"]
+            for label in AGING_LABELS:
+                summary_sheet.append([label, totals[label][0], to_dollars(totals[label][1])])
+            self._bold_row(summary_sheet, [
+                "Total",
+                sum(count for count, _ in totals.values()),
+                to_dollars(sum(cents for _, cents in totals.values())),
+            ])
+
+            self._bold_row(vendor_sheet, ["Vendor"] + AGING_LABELS + ["Total"])
+            for name in sorted(vendors):
+                cents = [vendors[name][label] for label in AGING_LABELS]
+                vendor_sheet.append([name] + [to_dollars(c) for c in cents] + [to_dollars(sum(cents))])
+
+            # One row per open invoice, read and written a batch at a time
+            self._bold_row(detail_sheet, [
+                "Vendor", "Invoice #", "Invoice Date", "Due Date", "Status", "Total Amount", "Days Overdue", "Aging Bucket"
+            ])
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT v.vendor_name, i.invoice_number, i.invoice_date, i.due_date, i.status, i.total_amount
+                FROM invoices i
+                JOIN vendors v ON i.vendor_id = v.vendor_id
+                WHERE i.status IN {OPEN_STATUSES}
+                ORDER BY v.vendor_name, i.due_date
+            """)
+            written = 0
+            while True:
+                rows = cursor.fetchmany(REPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                due_dates = [row[3] for row in rows]
+                days = days_overdue(due_dates, as_of)
+                labels = bucket_labels(assign_buckets(due_dates, as_of))
+                for row, overdue, label in zip(rows, days, labels):
+                    detail_sheet.append(list(row) + [max(int(overdue), 0), label])
+                written += len(rows)
+                self.progress(0.9 * written / max(invoice_count, 1), f"{written:,} of {invoice_count:,} invoices written")
+            cursor.close()
+        finally:
+            conn.close()
+
+        self.progress(0.95, "Saving workbook")
+        path = self._save(workbook, f"aging_report_{as_of.strftime('%Y%m%d')}_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx")
+        self.progress(1.0, "Done")
+        return path
+
+    def generate_payment_advice(self, request_id, advice_number=None, publish=True):
+        """Payment advice workbook for a payment request; returns (success, path or error message).
+
+        With publish=False the path is a private temporary file, to be moved
+        to advice_path() by the caller.
+        """
+        try:
+            advice_number = advice_number or f"PA{datetime.now().strftime('%Y%m%d%H%M')}"
+            return True, self._payment_advice(request_id, advice_number, publish)
+        except Exception as e:
+            return False, str(e)
+
+    def advice_path(self, request_id, advice_number):
+        return os.path.join(self.reports_dir, f"payment_advice_{advice_number}_{request_id}.xlsx")
+
+    def _payment_advice(self, request_id, advice_number, publish=True):
+        conn = get_db_connection()
+        try:
+            request = conn.execute(
+                "SELECT request_number, notes FROM payment_requests WHERE request_id = ?", (request_id,)
+            ).fetchone()
+            if request is None:
+                raise ValueError(f"Payment request {request_id} not found")
+
+            invoices = conn.execute("""
+                SELECT v.vendor_id, v.vendor_name, i.invoice_number, i.invoice_date, i.due_date,
+                       i.amount, i.tax_amount, i.total_amount, i.total_cents
+                FROM payment_request_items pri
+                JOIN invoices i ON pri.invoice_id = i.invoice_id
+                JOIN vendors v ON i.vendor_id = v.vendor_id
+                WHERE pri.request_id = ?
+                ORDER BY v.vendor_name, i.due_date
+            """, (request_id,)).fetchall()
+
+            banks = {
+                row["vendor_id"]: row
+                for row in conn.execute("""
+                    SELECT vendor_id, bank_name, account_number, ifsc_code, branch_name
+                    FROM vendor_bank_details
+                    WHERE vendor_id IN (
+                        SELECT i.vendor_id FROM payment_request_items pri
+                        JOIN invoices i ON pri.invoice_id = i.invoice_id
+                        WHERE pri.request_id = ?
+                    )
+                    ORDER BY is_primary
+                """, (request_id,)).fetchall()
+            }
+        finally:
+            conn.close()
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Payment Advice")
+        self._bold_row(sheet, ["Payment Advice"])
+        sheet.append(["Advice Number", advice_number])
+        sheet.append(["Payment Request", request["request_number"]])
+        sheet.append(["Date", date.today().isoformat()])
+        if request["notes"]:
+            sheet.append(["Notes", request["notes"]])
+
+        grand_total = 0
+        vendor_id = None
+        vendor_total = 0
+        for i, invoice in enumerate(invoices):
+            if invoice["vendor_id"] != vendor_id:
+                if vendor_id is not None:
+                    self._bold_row(sheet, ["", "", "", "", "Vendor Total", to_dollars(vendor_total)])
+                vendor_id, vendor_total = invoice["vendor_id"], 0
+
+                sheet.append([])
+                self._bold_row(sheet, [invoice["vendor_name"]])
+                bank = banks.get(vendor_id)
+                if bank:
+                    sheet.append(["Bank", bank["bank_name"], "Account", bank["account_number"],
+                                  "IFSC", bank["ifsc_code"], "Branch", bank["branch_name"]])
+                self._bold_row(sheet, ["Invoice #", "Invoice Date", "Due Date", "Amount", "Tax", "Total Amount"])
+
+            sheet.append([invoice["invoice_number"], invoice["invoice_date"], invoice["due_date"],
+                          invoice["amount"], invoice["tax_amount"], invoice["total_amount"]])
+            vendor_total += invoice["total_cents"]
+            grand_total += invoice["total_cents"]
+            self.progress(0.9 * (i + 1) / len(invoices), f"{i + 1} of {len(invoices)} invoices written")
+
+        if vendor_id is not None:
+            self._bold_row(sheet, ["", "", "", "", "Vendor Total", to_dollars(vendor_total)])
+        sheet.append([])
+        self._bold_row(sheet, ["", "", "", "", "Total Payable", to_dollars(grand_total)])
+
+        path = self._save(workbook, os.path.basename(self.advice_path(request_id, advice_number)), publish)
+        self.progress(1.0, "Done")
+        return path
+
+
+
+@job_handler(AGING_JOB, concurrency=REPORT_CONCURRENCY)
+def run_aging_report_job(payload):
+    success, result = ExcelReportGenerator(progress=report_progress).generate_aging_report(payload["as_of_date"])
+    if not success:
+        raise RuntimeError(result)
+
+    conn = get_db_connection()
+    try:
+        artifact_id = register_artifact(conn, result, AGING_JOB, job_id=current_job_id())
+        conn.commit()
+    finally:
+        conn.close()
+    return {"artifact_id": artifact_id, "file_name": os.path.basename(result)}
+
+
+@job_handler(PAYMENT_ADVICE_JOB, concurrency=REPORT_CONCURRENCY)
+def run_payment_advice_job(payload):
+    """Build the advice for an approved request, then record it and mark the request processed"""
+    request_id = payload["request_id"]
+    conn = get_db_connection()
+    try:
+        status = conn.execute("SELECT status FROM payment_requests WHERE request_id = ?", (request_id,)).fetchone()
+        if status is None or status[0] != "approved":
+            return {"skipped": f"Payment request is {status[0] if status else 'missing'}, not approved"}
+
+        advice_number = f"PA{datetime.now().strftime('%Y%m%d%H%M')}"
+        generator = ExcelReportGenerator(progress=report_progress)
+        # Built under a private name: a duplicate job in the same minute would want the same file name
+        success, tmp_path = generator.generate_payment_advice(request_id, advice_number, publish=False)
+        if not success:
+            raise RuntimeError(tmp_path)
+
+        result = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Guarded so a retried or duplicate job cannot record a second advice
+            processed = conn.execute("""
+                UPDATE payment_requests SET status = 'processed'
+                WHERE request_id = ? AND status = 'approved'
+            """, (request_id,)).rowcount
+            if not processed:
+                conn.rollback()
+                os.remove(tmp_path)
+                return {"skipped": "Payment request was processed by another job"}
+
+            # Only the job that won the UPDATE, still holding the write lock, takes the final name
+            result = generator.advice_path(request_id, advice_number)
+            os.replace(tmp_path, result)
+
+            advice_id = conn.execute("""
+                INSERT INTO payment_advices
+                (request_id, advice_number, total_amount, generated_at, payment_date, status)
+                SELECT ?, ?, SUM(i.total_cents) / 100.0, CURRENT_TIMESTAMP, ?, 'pending'
+                FROM payment_request_items pri
+                JOIN invoices i ON pri.invoice_id = i.invoice_id
+                WHERE pri.request_id = ?
+            """, (request_id, advice_number, date.today(), request_id)).lastrowid
+            artifact_id = register_artifact(
+                conn, result, PAYMENT_ADVICE_JOB, "payment_advice", advice_id, job_id=current_job_id()
+            )
+            conn.commit()
+        except Exception:
+            # Remove the file before the rollback releases the lock another job's file would be written under
+            for path in (tmp_path, result):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            conn.rollback()
+            raise
+    finally:
+        conn.close()
+
+    return {"artifact_id": artifact_id, "file_name": os.path.basename(result),
+            "advice_id": advice_id, "advice_number": advice_number}
@@ -0,0 +1,468 @@
+"""Background jobs: a persistent queue, schedules and a polling worker
+
+Work that should not run inside a user's rerun (Tally syncs, large
+exports) is enqueued as a row in the jobs table and picked up by a
+worker. The Streamlit server runs a small pool of worker threads per
+process (start_worker()), and more workers can be started with
+
+    python -m utils.jobs
+
+A worker claims a job by taking a lease on it inside a BEGIN IMMEDIATE
+transaction and renews the lease while the job runs. A job whose worker
+died is requeued once its lease expires. Each kind of job has a
+concurrency limit (1 by default), so only one worker at a time runs a
+Tally sync whatever the number of processes. A failed job is retried
+with exponential backoff until it runs out of attempts. Schedules enqueue
+a job every interval_seconds.
+
+Handlers are registered with @job_handler(kind) and receive the job's
+payload dict; whatever they return is stored as the job's JSON result.
+Long handlers can call report_progress() so the UI can show how far along
+they are.
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+from utils.db import get_db_connection
+
+POLL_INTERVAL = 2.0  # seconds between polls when idle
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # seconds before the first retry; doubles per attempt
+BACKOFF_MAX = 3600
+JOB_RETENTION_DAYS = 30
+PRUNE_INTERVAL = 3600
+WORKER_THREADS = 3  # worker threads per Streamlit process
+PROGRESS_INTERVAL = 0.5  # minimum seconds between progress writes
+
+# Modules whose handlers a standalone worker loads
+HANDLER_MODULES = (
+    "utils.tally_connector", "utils.excel_generator", "utils.backup", "utils.report_reader", "utils.planner_stats"
+)
+
+# kind -> (function, concurrency)
+HANDLERS = {}
+
+# The job the current worker thread is running, for report_progress()
+_local = threading.local()
+
+
+def job_handler(kind, concurrency=1):
+    """Register func(payload) as the handler for jobs of this kind"""
+    def decorator(func):
+        HANDLERS[kind] = (func, concurrency)
+        return func
+    return decorator
+
+
+def _payload_json(payload):
+    return json.dumps(payload or {}, sort_keys=True)
+
+
+def backoff_seconds(attempts):
+    """Delay before retrying after the given number of attempts, with jitter"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+# Queue
+
+def enqueue(conn, kind, payload=None, run_at=None, max_attempts=MAX_ATTEMPTS, schedule_name=None, dedupe=True):
+    """Add a job and return its id.
+
+    With dedupe, an identical job that is still queued or running is
+    returned instead of adding another one.
+    """
+    payload = _payload_json(payload)
+    now = time.time()
+    if dedupe:
+        row = conn.execute("""
+            SELECT job_id FROM jobs
+            WHERE kind = ? AND status IN ('queued', 'running') AND payload = ?
+            ORDER BY job_id LIMIT 1
+        """, (kind, payload)).fetchone()
+        if row:
+            return row[0]
+
+    cursor = conn.execute("""
+        INSERT INTO jobs (kind, payload, status, schedule_name, max_attempts, created_at, run_at)
+        VALUES (?, ?, 'queued', ?, ?, ?, ?)
+    """, (kind, payload, schedule_name, max_attempts, now, run_at or now))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def cancel(conn, job_id):
+    """Cancel a job that has not started yet; returns whether it was cancelled"""
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+        (time.time(), job_id)
+    )
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def _has_work(conn, now):
+    """Cheap read-only check so an idle worker does not take the write lock every poll"""
+    return conn.execute("""
+        SELECT 1 FROM jobs WHERE status = 'queued' AND run_at <= ?
+        UNION ALL
+        SELECT 1 FROM jobs WHERE status = 'running' AND lease_expires_at <= ?
+        LIMIT 1
+    """, (now, now)).fetchone() is not None
+
+
+def claim(conn, worker_id, kinds, lease_seconds=LEASE_SECONDS):
+    """Lease the next due job of one of the given kinds; returns (job_id, kind, payload) or None"""
+    now = time.time()
+    if not _has_work(conn, now):
+        return None
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs whose worker stopped renewing the lease go back to the queue
+        conn.execute("""
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN ? END,
+                error = 'Lease expired (worker stopped or timed out)',
+                lease_owner = NULL, lease_expires_at = NULL, run_at = ?
+            WHERE status = 'running' AND lease_expires_at <= ?
+        """, (now, now, now))
+
+        running = dict(conn.execute("""
+            SELECT kind, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY kind
+        """).fetchall())
+        available = [kind for kind in kinds if running.get(kind, 0) < HANDLERS[kind][1]]
+
+        row = None
+        if available:
+            row = conn.execute("""
+                SELECT job_id, kind, payload FROM jobs
+                WHERE status = 'queued' AND run_at <= ?
+                  AND kind IN (SELECT value FROM json_each(?))
+                ORDER BY run_at, job_id
+                LIMIT 1
+            """, (now, json.dumps(available))).fetchone()
+        if row:
+            conn.execute("""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, started_at = ?, finished_at = NULL,
+                    lease_owner = ?, lease_expires_at = ?, progress = 0, progress_message = NULL
+                WHERE job_id = ?
+            """, (now, worker_id, now + lease_seconds, row[0]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return (row[0], row[1], json.loads(row[2])) if row else None
+
+
+def renew_lease(conn, job_id, worker_id, lease_seconds=LEASE_SECONDS):
+    """Extend a running job's lease; returns False if the lease was lost"""
+    cursor = conn.execute("""
+        UPDATE jobs SET lease_expires_at = ?
+        WHERE job_id = ? AND lease_owner = ? AND status = 'running'
+    """, (time.time() + lease_seconds, job_id, worker_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def set_progress(conn, job_id, worker_id, fraction, message=None):
+    conn.execute("""
+        UPDATE jobs SET progress = ?, progress_message = ?
+        WHERE job_id = ? AND lease_owner = ? AND status = 'running'
+    """, (min(max(float(fraction), 0.0), 1.0), message, job_id, worker_id))
+    conn.commit()
+
+
+def current_job_id():
+    """Id of the job running on this thread, or None outside a job"""
+    job = getattr(_local, "job", None)
+    return job["job_id"] if job else None
+
+
+def report_progress(fraction, message=None):
+    """Record how far the running job has got (0 to 1); a no-op outside a job.
+
+    Writes are throttled to one every PROGRESS_INTERVAL seconds, except
+    for the final one.
+    """
+    job = getattr(_local, "job", None)
+    if job is None:
+        return
+    now = time.monotonic()
+    if fraction < 1 and now - job["reported"] < PROGRESS_INTERVAL:
+        return
+    job["reported"] = now
+    conn = get_db_connection()
+    try:
+        set_progress(conn, job["job_id"], job["worker_id"], fraction, message)
+    finally:
+        conn.close()
+
+
+def complete(conn, job_id, worker_id, result, seconds):
+    conn.execute("""
+        UPDATE jobs
+        SET status = 'succeeded', finished_at = ?, duration_ms = ?, result = ?, error = NULL, progress = 1,
+            lease_owner = NULL, lease_expires_at = NULL
+        WHERE job_id = ? AND lease_owner = ?
+    """, (time.time(), seconds * 1000, json.dumps(result, default=str), job_id, worker_id))
+    conn.commit()
+
+
+def fail(conn, job_id, worker_id, error, seconds):
+    """Requeue a failed job with backoff, or mark it failed once out of attempts"""
+    attempts, max_attempts = conn.execute(
+        "SELECT attempts, max_attempts FROM jobs WHERE job_id = ?", (job_id,)
+    ).fetchone()
+    now = time.time()
+    if attempts < max_attempts:
+        status, run_at, finished_at = "queued", now + backoff_seconds(attempts), None
+    else:
+        status, run_at, finished_at = "failed", now, now
+    conn.execute("""
+        UPDATE jobs
+        SET status = ?, run_at = ?, finished_at = ?, duration_ms = ?, error = ?,
+            lease_owner = NULL, lease_expires_at = NULL
+        WHERE job_id = ? AND lease_owner = ?
+    """, (status, run_at, finished_at, seconds * 1000, error, job_id, worker_id))
+    conn.commit()
+
+
+def prune(conn, days=JOB_RETENTION_DAYS):
+    """Delete finished jobs older than the retention period"""
+    conn.execute("""
+        DELETE FROM jobs
+        WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?
+    """, (time.time() - days * 86400,))
+    conn.commit()
+
+
+# Schedules
+
+def set_schedule(conn, name, kind, interval_seconds, payload=None, enabled=True):
+    """Create or update a schedule; a new or changed interval first runs right away"""
+    now = time.time()
+    conn.execute("""
+        INSERT INTO job_schedules (name, kind, payload, interval_seconds, enabled, next_run_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE
+        SET kind = excluded.kind,
+            payload = excluded.payload,
+            enabled = excluded.enabled,
+            next_run_at = CASE WHEN job_schedules.interval_seconds = excluded.interval_seconds
+                               THEN job_schedules.next_run_at ELSE excluded.next_run_at END,
+            interval_seconds = excluded.interval_seconds
+    """, (name, kind, _payload_json(payload), int(interval_seconds), int(bool(enabled)), now))
+    conn.commit()
+
+
+def enqueue_due_schedules(conn):
+    """Enqueue a job for every enabled schedule that is due; returns the job ids"""
+    now = time.time()
+    if conn.execute(
+        "SELECT 1 FROM job_schedules WHERE enabled = 1 AND next_run_at <= ? LIMIT 1", (now,)
+    ).fetchone() is None:
+        return []
+
+    job_ids = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        due = conn.execute("""
+            SELECT name, kind, payload, interval_seconds, next_run_at FROM job_schedules
+            WHERE enabled = 1 AND next_run_at <= ?
+        """, (now,)).fetchall()
+        for name, kind, payload, interval, next_run_at in due:
+            existing = conn.execute("""
+                SELECT job_id FROM jobs
+                WHERE kind = ? AND status IN ('queued', 'running') AND payload = ?
+                LIMIT 1
+            """, (kind, payload)).fetchone()
+            if existing:
+                job_id = existing[0]
+            else:
+                job_id = conn.execute("""
+                    INSERT INTO jobs (kind, payload, status, schedule_name, max_attempts, created_at, run_at)
+                    VALUES (?, ?, 'queued', ?, ?, ?, ?)
+                """, (kind, payload, name, MAX_ATTEMPTS, now, now)).lastrowid
+            job_ids.append(job_id)
+
+            # Next slot after now, keeping to the original cadence after downtime
+            missed = int((now - next_run_at) // interval) + 1
+            conn.execute(
+                "UPDATE job_schedules SET next_run_at = ?, last_job_id = ? WHERE name = ?",
+                (next_run_at + missed * interval, job_id, name)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return job_ids
+
+
+# Worker
+
+class JobWorker:
+    def __init__(self, worker_id=None, poll_interval=POLL_INTERVAL, lease_seconds=LEASE_SECONDS):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.current_job = None
+        self.last_poll = None
+        self.jobs_run = 0
+        self._stop = threading.Event()
+        self._last_prune = 0.0
+
+    def run_once(self):
+        """Enqueue due schedules, then run at most one job; returns whether a job ran"""
+        self.last_poll = time.time()
+        conn = get_db_connection()
+        try:
+            enqueue_due_schedules(conn)
+            if self.last_poll - self._last_prune > PRUNE_INTERVAL:
+                prune(conn)
+                self._last_prune = self.last_poll
+            job = claim(conn, self.worker_id, list(HANDLERS), self.lease_seconds)
+        finally:
+            conn.close()
+
+        if job is None:
+            return False
+        self._run(*job)
+        return True
+
+    def _run(self, job_id, kind, payload):
+        self.current_job = (job_id, kind)
+        func = HANDLERS[kind][0]
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, heartbeat_stop), daemon=True)
+        heartbeat.start()
+
+        _local.job = {"job_id": job_id, "worker_id": self.worker_id, "reported": 0.0}
+        start = time.perf_counter()
+        try:
+            result = func(payload)
+            error = None
+        except Exception as e:
+            result = None
+            error = f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}"
+        finally:
+            _local.job = None
+        seconds = time.perf_counter() - start
+
+        heartbeat_stop.set()
+        heartbeat.join()
+
+        conn = get_db_connection()
+        try:
+            if error is None:
+                complete(conn, job_id, self.worker_id, result, seconds)
+            else:
+                fail(conn, job_id, self.worker_id, error, seconds)
+        finally:
+            conn.close()
+        self.jobs_run += 1
+        self.current_job = None
+
+    def _heartbeat(self, job_id, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            conn = get_db_connection()
+            try:
+                renew_lease(conn, job_id, self.worker_id, self.lease_seconds)
+            finally:
+                conn.close()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except Exception:
+                # Keep polling through transient errors such as a locked database
+                traceback.print_exc()
+                busy = False
+            if not busy:
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+# This process's worker pool: [(worker, thread)]
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def _start_threads(count, poll_interval=POLL_INTERVAL):
+    pool = []
+    for i in range(count):
+        worker = JobWorker(poll_interval=poll_interval)
+        thread = threading.Thread(target=worker.run_forever, name=f"job-worker-{i}", daemon=True)
+        thread.start()
+        pool.append((worker, thread))
+    return pool
+
+
+def start_worker(threads=WORKER_THREADS):
+    """Start this process's worker pool once (restarting threads that died); returns the workers.
+
+    Per-kind concurrency limits are enforced when a job is claimed, so the
+    pool size only bounds how many jobs of different kinds run at once.
+    """
+    load_handlers()
+    with _workers_lock:
+        alive = [(worker, thread) for worker, thread in _workers if thread.is_alive()]
+        alive += _start_threads(threads - len(alive))
+        _workers[:] = alive
+        return [worker for worker, _ in _workers]
+
+
+def worker_status():
+    """[(worker, alive)] for this process's worker pool"""
+    return [(worker, thread.is_alive()) for worker, thread in _workers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a background job worker")
+    parser.add_argument("--once", action="store_true", help="run due jobs until none is left, then exit")
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help="seconds between polls when idle")
+    parser.add_argument("--threads", type=int, default=1, help="worker threads")
+    args = parser.parse_args()
+
+    load_handlers()
+    print(f"Handling: {', '.join(sorted(HANDLERS))}")
+
+    if args.once:
+        worker = JobWorker(poll_interval=args.poll)
+        while worker.run_once():
+            pass
+        return
+
+    pool = _start_threads(args.threads, args.poll)
+    try:
+        while any(thread.is_alive() for _, thread in pool):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for worker, _ in pool:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    # Run as a script this module is __main__, while handler modules register with utils.jobs
+    from utils.jobs import main
+
+    main()
@@ -0,0 +1,604 @@
+"""Versioned schema migrations, tracked with PRAGMA user_version"""
+import os
+import time
+
+OPEN_STATUSES = "('pending', 'approved')"
+
+# Per-vendor, per-due-date totals of open invoices, kept current by triggers.
+# This is the original DECIMAL version created by migration 1; migration 9
+# replaces it with AGING_SUMMARY_SQL below, which keeps the totals in cents
+AGING_SUMMARY_V1_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS invoice_aging_summary (
+        vendor_id INTEGER NOT NULL,
+        due_date DATE NOT NULL,
+        invoice_count INTEGER NOT NULL DEFAULT 0,
+        total_amount DECIMAL(15, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (vendor_id, due_date)
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_invoices_aging_insert
+    AFTER INSERT ON invoices
+    WHEN NEW.status IN {OPEN_STATUSES}
+    BEGIN
+        INSERT INTO invoice_aging_summary (vendor_id, due_date, invoice_count, total_amount)
+        VALUES (NEW.vendor_id, NEW.due_date, 1, NEW.total_amount)
+        ON CONFLICT (vendor_id, due_date) DO UPDATE
+        SET invoice_count = invoice_count + 1,
+            total_amount = total_amount + excluded.total_amount;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_invoices_aging_update
+    AFTER UPDATE OF vendor_id, due_date, total_amount, status ON invoices
+    BEGIN
+        UPDATE invoice_aging_summary
+        SET invoice_count = invoice_count - 1,
+            total_amount = total_amount - OLD.total_amount
+        WHERE OLD.status IN {OPEN_STATUSES}
+          AND vendor_id = OLD.vendor_id AND due_date = OLD.due_date;
+        DELETE FROM invoice_aging_summary
+        WHERE vendor_id = OLD.vendor_id AND due_date = OLD.due_date AND invoice_count <= 0;
+        INSERT INTO invoice_aging_summary (vendor_id, due_date, invoice_count, total_amount)
+        SELECT NEW.vendor_id, NEW.due_date, 1, NEW.total_amount
+        WHERE NEW.status IN {OPEN_STATUSES}
+        ON CONFLICT (vendor_id, due_date) DO UPDATE
+        SET invoice_count = invoice_count + 1,
+            total_amount = total_amount + excluded.total_amount;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_invoices_aging_delete
+    AFTER DELETE ON invoices
+    WHEN OLD.status IN {OPEN_STATUSES}
+    BEGIN
+        UPDATE invoice_aging_summary
+        SET invoice_count = invoice_count - 1,
+            total_amount = total_amount - OLD.total_amount
+        WHERE vendor_id = OLD.vendor_id AND due_date = OLD.due_date;
+        DELETE FROM invoice_aging_summary
+        WHERE vendor_id = OLD.vendor_id AND due_date = OLD.due_date AND invoice_count <= 0;
+    END
+    """,
+]
+
+
+# Amounts as integer cents (see utils.money). The cents columns are generated
+# from the DECIMAL amounts, so every form, import and sync that writes an
+# amount keeps them current without changes
+MONEY_CENTS_COLUMNS = [
+    ("invoices", "amount_cents", "amount"),
+    ("invoices", "tax_cents", "tax_amount"),
+    ("invoices", "total_cents", "total_amount"),
+    ("payment_advices", "total_cents", "total_amount"),
+]
+
+# The covering indexes from migration 3, rebuilt over total_cents
+MONEY_CENTS_INDEXES = [
+    "DROP INDEX IF EXISTS idx_invoices_status_due_date",
+    "DROP INDEX IF EXISTS idx_invoices_vendor_status",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_status_due_date ON invoices(status, due_date, vendor_id, total_cents)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_vendor_status ON invoices(vendor_id, status, total_cents)",
+]
+
+AGING_SUMMARY_SQL = [
+    "DROP TRIGGER IF EXISTS trg_invoices_aging_insert",
+    "DROP TRIGGER IF EXISTS trg_invoices_aging_update",
+    "DROP TRIGGER IF EXISTS trg_invoices_aging_delete",
+    "DROP TABLE IF EXISTS invoice_aging_summary",
+    """
+    CREATE TABLE invoice_aging_summary (
+        vendor_id INTEGER NOT NULL,
+        due_date DATE NOT NULL,
+        invoice_count INTEGER NOT NULL DEFAULT 0,
+        total_cents INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (vendor_id, due_date)
+    )
+    """,
+    f"""
+    CREATE TRIGGER trg_invoices_aging_insert
+    AFTER INSERT ON invoices
+    WHEN NEW.status IN {OPEN_STATUSES}
+    BEGIN
+        INSERT INTO invoice_aging_summary (vendor_id, due_date, invoice_count, total_cents)
+        VALUES (NEW.vendor_id, NEW.due_date, 1, NEW.total_cents)
+        ON CONFLICT (vendor_id, due_date) DO UPDATE
+        SET invoice_count = invoice_count + 1,
+            total_cents = total_cents + excluded.total_cents;
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_invoices_aging_update
+    AFTER UPDATE OF vendor_id, due_date, total_amount, status ON invoices
+    BEGIN
+        UPDATE invoice_aging_summary
+        SET invoice_count = invoice_count - 1,
+            total_cents = total_cents - OLD.total_cents
+        WHERE OLD.status IN {OPEN_STATUSES}
+          AND vendor_id = OLD.vendor_id AND due_date = OLD.due_date;
+        DELETE FROM invoice_aging_summary
+        WHERE vendor_id = OLD.vendor_id AND due_date = OLD.due_date AND invoice_count <= 0;
+        INSERT INTO invoice_aging_summary (vendor_id, due_date, invoice_count, total_cents)
+        SELECT NEW.vendor_id, NEW.due_date, 1, NEW.total_cents
+        WHERE NEW.status IN {OPEN_STATUSES}
+        ON CONFLICT (vendor_id, due_date) DO UPDATE
+        SET invoice_count = invoice_count + 1,
+            total_cents = total_cents + excluded.total_cents;
+    END
+    """,
+    f"""
+    CREATE TRIGGER trg_invoices_aging_delete
+    AFTER DELETE ON invoices
+    WHEN OLD.status IN {OPEN_STATUSES}
+    BEGIN
+        UPDATE invoice_aging_summary
+        SET invoice_count = invoice_count - 1,
+            total_cents = total_cents - OLD.total_cents
+        WHERE vendor_id = OLD.vendor_id AND due_date = OLD.due_date;
+        DELETE FROM invoice_aging_summary
+        WHERE vendor_id = OLD.vendor_id AND due_date = OLD.due_date AND invoice_count <= 0;
+    END
+    """,
+]
+
+
+def rebuild_aging_summary(conn):
+    """Recompute invoice_aging_summary from the invoices table"""
+    conn.execute("DELETE FROM invoice_aging_summary")
+    conn.execute(f"""
+        INSERT INTO invoice_aging_summary (vendor_id, due_date, invoice_count, total_cents)
+        SELECT vendor_id, due_date, COUNT(*), SUM(total_cents)
+        FROM invoices
+        WHERE status IN {OPEN_STATUSES}
+        GROUP BY vendor_id, due_date
+    """)
+
+
+# Write counters used to invalidate cached query results (see utils.query_cache)
+VERSIONED_TABLES = ("invoices", "vendors", "payment_requests")
+
+
+def _create_table_versions(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in VERSIONED_TABLES:
+        conn.execute(
+            "INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)",
+            (table,)
+        )
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            """)
+
+
+# Composite indexes for the queries in app.py; see utils.query_audit for the
+# registered queries and the plans they are expected to get
+COMPOSITE_INDEXES = [
+    # Open invoices by due date (aging details, dashboard); covers status counts and totals
+    "CREATE INDEX IF NOT EXISTS idx_invoices_status_due_date ON invoices(status, due_date, vendor_id, total_amount)",
+    # Per-vendor invoice counts and outstanding amounts (vendor list, vendor summary)
+    "CREATE INDEX IF NOT EXISTS idx_invoices_vendor_status ON invoices(vendor_id, status, total_amount)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_request_items_request ON payment_request_items(request_id, invoice_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_request_items_invoice ON payment_request_items(invoice_id, request_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_requests_status_requested_at ON payment_requests(status, requested_at)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_advices_payment_date ON payment_advices(payment_date)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_advices_request ON payment_advices(request_id, generated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_logs_action ON audit_logs(action, entity_type, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_vendors_status_name ON vendors(status, vendor_name)",
+    "CREATE INDEX IF NOT EXISTS idx_vendor_bank_details_vendor_id ON vendor_bank_details(vendor_id)",
+]
+
+# Single-column indexes that are now a prefix of a composite index above
+REDUNDANT_INDEXES = [
+    "idx_invoices_status",
+    "idx_invoices_vendor_id",
+    "idx_payment_requests_status",
+]
+
+
+def _create_composite_indexes(conn):
+    for sql in COMPOSITE_INDEXES:
+        conn.execute(sql)
+    for name in REDUNDANT_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    # Give the planner real row counts for choosing between the new indexes;
+    # the planner_statistics job (utils.planner_stats) refreshes them as tables grow
+    conn.execute("ANALYZE")
+
+
+# Tally sync: source identity on synced rows, per-entity high-water marks
+# and a log of sync runs (see utils.tally_sync)
+TALLY_SYNCED_TABLES = ("vendors", "invoices")
+
+TALLY_SYNC_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS tally_sync_state (
+        entity TEXT PRIMARY KEY,
+        high_water_mark INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tally_sync_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        source TEXT NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP,
+        status TEXT NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'success', 'failed')),
+        watermark_from INTEGER NOT NULL DEFAULT 0,
+        watermark_to INTEGER NOT NULL DEFAULT 0,
+        batches INTEGER NOT NULL DEFAULT 0,
+        rows_fetched INTEGER NOT NULL DEFAULT 0,
+        rows_inserted INTEGER NOT NULL DEFAULT 0,
+        rows_updated INTEGER NOT NULL DEFAULT 0,
+        rows_skipped INTEGER NOT NULL DEFAULT 0,
+        duration_ms REAL,
+        error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_tally_sync_runs_entity ON tally_sync_runs(entity, started_at)",
+]
+
+
+def _create_tally_sync_tables(conn):
+    for table in TALLY_SYNCED_TABLES:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if "tally_guid" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN tally_guid TEXT")
+        if "tally_alter_id" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN tally_alter_id INTEGER")
+        # Conflict target for the sync upserts; rows entered by hand keep NULL
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_tally_guid ON {table}(tally_guid)")
+    for sql in TALLY_SYNC_SQL:
+        conn.execute(sql)
+
+
+# Background jobs and their schedules (see utils.jobs); times are Unix seconds
+JOB_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+        schedule_name TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        created_at REAL NOT NULL,
+        run_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        duration_ms REAL,
+        lease_owner TEXT,
+        lease_expires_at REAL,
+        result TEXT,
+        error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs(status, run_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_kind_status ON jobs(kind, status)",
+    """
+    CREATE TABLE IF NOT EXISTS job_schedules (
+        name TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        interval_seconds INTEGER NOT NULL,
+        enabled INTEGER NOT NULL DEFAULT 1,
+        next_run_at REAL NOT NULL,
+        last_job_id INTEGER
+    )
+    """,
+]
+
+
+def _create_job_tables(conn):
+    for sql in JOB_TABLES_SQL:
+        conn.execute(sql)
+
+
+def _add_job_progress(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)").fetchall()}
+    if "progress" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN progress REAL")
+    if "progress_message" not in columns:
+        conn.execute("ALTER TABLE jobs ADD COLUMN progress_message TEXT")
+
+
+# Generated reports and advices (see utils.artifacts)
+ARTIFACTS_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS artifacts (
+        artifact_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        path TEXT NOT NULL,
+        file_name TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        checksum TEXT NOT NULL,
+        content_type TEXT NOT NULL,
+        entity_type TEXT,
+        entity_id INTEGER,
+        job_id INTEGER,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_artifacts_entity ON artifacts(entity_type, entity_id)",
+]
+
+
+def _create_artifacts(conn):
+    from utils.artifacts import register_artifact
+
+    for sql in ARTIFACTS_SQL:
+        conn.execute(sql)
+
+    # Register the advice files generated before the registry existed, matched by advice number
+    if not os.path.isdir("reports"):
+        return
+    files = sorted(name for name in os.listdir("reports") if name.startswith("payment_advice_"))
+    for advice_id, advice_number in conn.execute("SELECT advice_id, advice_number FROM payment_advices").fetchall():
+        for name in files:
+            if advice_number in name:
+                register_artifact(conn, os.path.join("reports", name), "payment_advice", "payment_advice", advice_id)
+                break
+
+
+# Content-addressed upload store (see utils.blob_store)
+BLOBS_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS blobs (
+        digest TEXT PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    )
+    """,
+]
+
+
+# Full-text search indexes (see utils.search): table -> (key column, indexed
+# columns). Each is an external-content FTS5 table named <table>_fts over the
+# table's rows, kept in sync by triggers, with a <table>_fts_vocab term list
+SEARCH_INDEXES = {
+    "invoices": ("invoice_id", ("invoice_number", "description")),
+    "vendors": ("vendor_id", ("vendor_name", "contact_person", "email")),
+    "users": ("user_id", ("username", "full_name", "email")),
+}
+
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2"
+SEARCH_OPTIONS = f"tokenize='{SEARCH_TOKENIZER}', prefix='2 3'"
+
+# Trigram indexes for substring search (see utils.search): table -> (key
+# column, indexed columns), named <table>_substr, so "1234" still finds
+# INV-2024-001234, which no word or prefix of the word index does
+SUBSTRING_INDEXES = {
+    "invoices": ("invoice_id", ("invoice_number",)),
+}
+
+SUBSTRING_OPTIONS = "tokenize='trigram'"
+
+
+def _search_index_sql(table, key, columns, index=None, options=SEARCH_OPTIONS):
+    index = index or f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    old_values = ", ".join(f"OLD.{column}" for column in columns)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+            {names}, content='{table}', content_rowid='{key}', {options}
+        )
+        """,
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {index}_vocab USING fts5vocab({index}, 'row')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{index}_insert
+        AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {index} (rowid, {names}) VALUES (NEW.{key}, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{index}_update
+        AFTER UPDATE OF {names} ON {table}
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', OLD.{key}, {old_values});
+            INSERT INTO {index} (rowid, {names}) VALUES (NEW.{key}, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{index}_delete
+        AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', OLD.{key}, {old_values});
+        END
+        """,
+        # Index the rows that already exist
+        f"INSERT INTO {index} ({index}) VALUES ('rebuild')",
+    ]
+
+
+# Integer day and month keys next to the date columns (see utils.date_keys),
+# generated like the cents columns so every writer keeps them current
+DATE_KEY_COLUMNS = [
+    ("invoices", "invoice_date", "invoice_day", "invoice_month"),
+    ("payment_advices", "payment_date", "payment_day", "payment_month"),
+    ("payment_requests", "requested_at", "requested_day", "requested_month"),
+]
+
+DATE_KEY_INDEXES = [
+    # Monthly trend reports group by month in index order; covers the totals
+    "CREATE INDEX IF NOT EXISTS idx_invoices_invoice_month ON invoices(invoice_month, total_cents)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_invoice_day ON invoices(invoice_day)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_advices_payment_month ON payment_advices(payment_month, total_cents)",
+    # Payment history date ranges; replaces the index on the payment_date text
+    "CREATE INDEX IF NOT EXISTS idx_payment_advices_payment_day ON payment_advices(payment_day)",
+    "DROP INDEX IF EXISTS idx_payment_advices_payment_date",
+    "CREATE INDEX IF NOT EXISTS idx_payment_requests_requested_month ON payment_requests(requested_month)",
+    "CREATE INDEX IF NOT EXISTS idx_payment_requests_requested_day ON payment_requests(requested_day)",
+]
+
+
+# The keyset-paged invoice list walks this index (see utils.queries.INVOICE_PAGE_SQL)
+DUE_DATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_invoices_due_date ON invoices(due_date)"
+
+
+def _create_due_date_index(conn):
+    conn.execute(DUE_DATE_INDEX_SQL)
+
+
+def _schedule_planner_statistics(conn):
+    from utils.planner_stats import STATISTICS_INTERVAL, STATISTICS_JOB, STATISTICS_SCHEDULE
+
+    # Not jobs.set_schedule(), which commits: the migration's transaction does
+    conn.execute("""
+        INSERT OR IGNORE INTO job_schedules (name, kind, interval_seconds, next_run_at)
+        VALUES (?, ?, ?, ?)
+    """, (STATISTICS_SCHEDULE, STATISTICS_JOB, STATISTICS_INTERVAL, time.time()))
+
+
+def _create_search_indexes(conn):
+    for table, (key, columns) in SEARCH_INDEXES.items():
+        for sql in _search_index_sql(table, key, columns):
+            conn.execute(sql)
+
+
+def _create_substring_indexes(conn):
+    for table, (key, columns) in SUBSTRING_INDEXES.items():
+        for sql in _search_index_sql(table, key, columns, f"{table}_substr", SUBSTRING_OPTIONS):
+            conn.execute(sql)
+
+
+def _create_blob_store(conn):
+    from utils.blob_store import migrate_legacy_uploads
+
+    for sql in BLOBS_SQL:
+        conn.execute(sql)
+    migrate_legacy_uploads(conn)
+
+
+def _create_aging_summary(conn):
+    for sql in AGING_SUMMARY_V1_SQL:
+        conn.execute(sql)
+    conn.execute("DELETE FROM invoice_aging_summary")
+    conn.execute(f"""
+        INSERT INTO invoice_aging_summary (vendor_id, due_date, invoice_count, total_amount)
+        SELECT vendor_id, due_date, COUNT(*), SUM(total_amount)
+        FROM invoices
+        WHERE status IN {OPEN_STATUSES}
+        GROUP BY vendor_id, due_date
+    """)
+
+
+def _store_money_in_cents(conn):
+    from utils.money import CENTS_SQL
+
+    for table, column, source in MONEY_CENTS_COLUMNS:
+        conn.execute(f"""
+            ALTER TABLE {table} ADD COLUMN {column} INTEGER
+            GENERATED ALWAYS AS ({CENTS_SQL.format(column=source)}) VIRTUAL
+        """)
+    for sql in MONEY_CENTS_INDEXES + AGING_SUMMARY_SQL:
+        conn.execute(sql)
+    rebuild_aging_summary(conn)
+
+
+def _add_date_keys(conn):
+    from utils.date_keys import DAY_KEY_SQL, MONTH_KEY_SQL
+
+    for table, source, day_column, month_column in DATE_KEY_COLUMNS:
+        for column, key_sql in ((day_column, DAY_KEY_SQL), (month_column, MONTH_KEY_SQL)):
+            conn.execute(f"""
+                ALTER TABLE {table} ADD COLUMN {column} INTEGER
+                GENERATED ALWAYS AS ({key_sql.format(column=source)}) VIRTUAL
+            """)
+    # Building the indexes computes the keys of every existing row
+    for sql in DATE_KEY_INDEXES:
+        conn.execute(sql)
+
+
+# Tables the migrations add for the app's own bookkeeping and derived data.
+# Triggers and the code that owns them keep these in step with the base
+# tables; editing them by hand (e.g. in the Data Manager) corrupts that.
+INTERNAL_TABLES = (
+    "invoice_aging_summary",  # 1
+    "table_versions",  # 2
+    "tally_sync_state",  # 4
+    "tally_sync_runs",  # 4
+    "jobs",  # 5
+    "job_schedules",  # 5
+    "artifacts",  # 7
+    "blobs",  # 8
+)
+
+
+def internal_tables(conn):
+    """Names of INTERNAL_TABLES plus the full-text indexes (virtual tables) and their shadow tables"""
+    names = set(INTERNAL_TABLES)
+    for _, name, kind, *_ in conn.execute("PRAGMA main.table_list").fetchall():
+        if kind in ("virtual", "shadow"):
+            names.add(name)
+    return names
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, "Invoice aging summary table and triggers", _create_aging_summary),
+    (2, "Table version counters for query cache invalidation", _create_table_versions),
+    (3, "Composite indexes for the invoice, payment and audit queries", _create_composite_indexes),
+    (4, "Tally sync watermarks, run log and source ids on vendors and invoices", _create_tally_sync_tables),
+    (5, "Background job queue and schedules", _create_job_tables),
+    (6, "Progress columns on background jobs", _add_job_progress),
+    (7, "Artifact registry for generated reports and advices", _create_artifacts),
+    (8, "Content-addressed store for uploaded files", _create_blob_store),
+    (9, "Amounts in integer cents for invoices, advices and the aging summary", _store_money_in_cents),
+    (10, "Full-text search indexes for invoices, vendors and users", _create_search_indexes),
+    (11, "Indexed day and month keys for invoice, advice and request dates", _add_date_keys),
+    (12, "Trigram indexes for substring search on invoice numbers", _create_substring_indexes),
+    (13, "Due date index for the keyset-paged invoice list", _create_due_date_index),
+    (14, "Scheduled refresh of stale planner statistics", _schedule_planner_statistics),
+]
+
+
+def apply_migrations(conn):
+    """Apply pending migrations and return the descriptions of those applied"""
+    has_schema = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'invoices'"
+    ).fetchone()
+    if not has_schema:
+        # Base schema has not been created yet
+        return []
+
+    latest = MIGRATIONS[-1][0]
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= latest:
+        return []
+
+    applied = []
+
+    for number, description, migrate in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read inside the write lock so concurrent processes don't both migrate
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if number <= version:
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(description)
+
+    return applied
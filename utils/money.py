@@ -0,0 +1,45 @@
+"""Money as integer cents
+
+Amounts are read from SQLite as int64 cents (the *_cents generated
+columns on invoices and payment_advices, and invoice_aging_summary's
+total_cents), so sums, sorting and grouping are exact integer arithmetic
+with no float drift. They are only turned into dollars or "$1,234.56"
+text at display time, with the vectorized helpers below, and never
+parsed back.
+"""
+import numpy as np
+import pandas as pd
+
+CURRENCY_SYMBOL = "$"
+
+# SQL expression for the cents of a DECIMAL amount column
+CENTS_SQL = "CAST(ROUND({column} * 100) AS INTEGER)"
+
+
+def to_cents(amounts):
+    """Dollar amounts (scalar, array or Series) as int64 cents; missing values become 0"""
+    if np.isscalar(amounts) or amounts is None:
+        return int(round((amounts or 0) * 100))
+    values = np.nan_to_num(np.asarray(amounts, dtype=np.float64) * 100)
+    cents = np.round(values).astype(np.int64)
+    return pd.Series(cents, index=amounts.index) if isinstance(amounts, pd.Series) else cents
+
+
+def to_dollars(cents):
+    """Cents as float dollars, for charts and spreadsheets"""
+    if np.isscalar(cents) or cents is None:
+        return (cents or 0) / 100
+    return pd.to_numeric(cents).fillna(0) / 100 if isinstance(cents, pd.Series) else np.asarray(cents) / 100
+
+
+def format_money(cents, symbol=CURRENCY_SYMBOL):
+    """'$1,234.56' text for cents: a scalar, array or Series (missing values show as $0.00), in the same shape"""
+    if np.isscalar(cents) or cents is None:
+        return str(format_money(np.array([cents or 0]), symbol)[0])
+
+    index = cents.index if isinstance(cents, pd.Series) else None
+    values = pd.Series(np.nan_to_num(np.asarray(cents, dtype=np.float64)).astype(np.int64), index=index)
+    dollars, fraction = np.divmod(values.abs(), 100)
+    sign = pd.Series(np.where(values < 0, "-", ""), index=values.index)
+    text = sign + symbol + dollars.map("{:,}".format) + "." + fraction.map("{:02d}".format)
+    return text if index is not None else text.to_numpy(dtype=object)
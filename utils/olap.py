@@ -0,0 +1,280 @@
+"""Vendor x month x status cube of invoice counts and totals for the Reports page
+
+The cube holds MEASURES (invoice count, total cents) for every cell of
+[vendor, month, status] that has invoices. It is built from one pass over
+the invoice month keys of migration 11. Most vendors invoice in only a few
+months, so the cube is stored sparsely: the sorted ids of the non-empty
+cells, with a count and a total for each. A cell id is
+(month * vendors + vendor) * statuses + status, so the cells of a month
+form one contiguous run. Roll-ups sum the selected cells with bincount
+over the dimensions that are kept, and drill-down from a month to its
+vendors reads only that run. Payment advices are not split by vendor (one
+advice pays several), so their counts and totals are kept by payment month
+alongside the cells.
+
+get_cube() builds it once per data version, the table_versions counters of
+utils.query_cache. Every write to invoices, vendors or payment_requests
+bumps them, and advices are only recorded together with their request
+being marked processed, so a cached cube is never stale. After that the
+reports slice, dice and roll it up in memory, and drill-down from a month
+to its vendors needs no further query.
+
+    python -m utils.olap [--month 202609]
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.query_cache import query_cache
+
+DIMENSIONS = ("vendor", "month", "status")
+MEASURES = ("invoice_count", "total_cents")
+STATUSES = ("pending", "approved", "rejected", "paid")
+OPEN_STATUSES = ("pending", "approved")
+
+UNDATED = 0  # month key of invoices whose date has no month key
+
+VENDORS_SQL = "SELECT vendor_id, vendor_name, status FROM vendors ORDER BY vendor_id"
+_STATUS_CASE = " ".join(f"WHEN '{status}' THEN {i}" for i, status in enumerate(STATUSES))
+# Status index -1 marks a status outside STATUSES; those rows are dropped
+INVOICE_CELLS_SQL = f"""
+    SELECT vendor_id, COALESCE(invoice_month, {UNDATED}), CASE status {_STATUS_CASE} ELSE -1 END,
+           COALESCE(total_cents, 0)
+    FROM invoices
+"""
+PAYMENTS_SQL = """
+    SELECT payment_month, COUNT(*), COALESCE(SUM(total_cents), 0)
+    FROM payment_advices
+    WHERE payment_month IS NOT NULL
+    GROUP BY payment_month
+"""
+
+
+def _sum_by(keys, values, size):
+    """Integer sums of values grouped by keys in range(size); exact while a sum stays below 2**53"""
+    return np.rint(np.bincount(keys, weights=values, minlength=size)).astype(np.int64)
+
+
+class InvoiceCube:
+    def __init__(self, vendor_ids, vendor_names, vendor_active, months, cells, counts, cents, payments):
+        self.vendor_ids = vendor_ids
+        self.vendor_names = vendor_names
+        self.vendor_active = vendor_active
+        self.months = months
+        self.statuses = np.array(STATUSES, dtype=object)
+        self.cells = cells
+        self.counts = counts
+        self.cents = cents
+        self.payments = payments
+
+    @property
+    def shape(self):
+        return len(self.vendor_ids), len(self.months), len(self.statuses)
+
+    @property
+    def nbytes(self):
+        return self.cells.nbytes + self.counts.nbytes + self.cents.nbytes + self.payments.nbytes
+
+    @staticmethod
+    def _positions(labels, selected):
+        """Indexes along one dimension of the selected labels, all of them for None"""
+        if selected is None:
+            return np.arange(len(labels))
+        return np.flatnonzero(np.isin(labels, np.asarray(selected, dtype=labels.dtype)))
+
+    def _coordinate(self, cells, name):
+        """Index along one dimension of each cell id"""
+        n_vendors, _, n_statuses = self.shape
+        if name == "vendor":
+            return cells // n_statuses % n_vendors
+        if name == "month":
+            return cells // (n_statuses * n_vendors)
+        return cells % n_statuses
+
+    def _select(self, vendors=None, months=None, statuses=None, dimensions=DIMENSIONS):
+        """(cell rows, their indexes along the given dimensions, selected indexes per dimension)"""
+        n_vendors, _, n_statuses = self.shape
+        selected = {
+            "vendor": self._positions(self.vendor_ids, vendors),
+            "month": self._positions(self.months, months),
+            "status": self._positions(self.statuses, statuses),
+        }
+        if months is None:
+            rows = slice(None)
+        else:
+            # Each month's cells are one contiguous run of the sorted cell ids
+            month = selected["month"]
+            bounds = np.searchsorted(self.cells, np.stack([month, month + 1]) * n_vendors * n_statuses)
+            rows = np.concatenate([np.empty(0, dtype=np.int64)] + [np.arange(lo, hi) for lo, hi in bounds.T])
+
+        cells = self.cells[rows]
+        for name, labels in (("vendor", vendors), ("status", statuses)):
+            if labels is not None:
+                keep = np.zeros(self.shape[DIMENSIONS.index(name)], dtype=bool)
+                keep[selected[name]] = True
+                mask = keep[self._coordinate(cells, name)]
+                rows = np.flatnonzero(mask) if isinstance(rows, slice) else rows[mask]
+                cells = cells[mask]
+        # Only the dimensions asked for; each is a pass over every selected cell
+        return rows, {name: self._coordinate(cells, name) for name in dimensions}, selected
+
+    def dice(self, vendors=None, months=None, statuses=None):
+        """Non-empty cells for the selected labels (None keeps all) as a DataFrame, month by month"""
+        rows, coordinates, _ = self._select(vendors, months, statuses)
+        return pd.DataFrame({
+            "vendor": self.vendor_ids[coordinates["vendor"]],
+            "month": self.months[coordinates["month"]],
+            "status": self.statuses[coordinates["status"]],
+            "invoice_count": self.counts[rows],
+            "total_cents": self.cents[rows],
+        })
+
+    def rollup(self, by, vendors=None, months=None, statuses=None, drop_empty=True):
+        """Counts and totals summed over every dimension not in `by`, as a DataFrame.
+
+        One row per combination of the `by` labels (vendor rows also carry
+        vendor_name), in cube order: vendors by id, months ascending,
+        statuses in STATUSES order. Rows without invoices are dropped unless
+        drop_empty is False.
+        """
+        names = [name for name in DIMENSIONS if name in by]
+        rows, coordinates, selected = self._select(vendors, months, statuses, names)
+        labels = {"vendor": self.vendor_ids, "month": self.months, "status": self.statuses}
+
+        # Number each cell's group by where its labels fall in the selection, so groups come out in cube order
+        sizes = [len(selected[name]) for name in names]
+        ranks = []
+        for name in names:
+            rank = np.zeros(len(labels[name]), dtype=np.int64)
+            rank[selected[name]] = np.arange(len(selected[name]))
+            ranks.append(rank[coordinates[name]])
+        keys = np.ravel_multi_index(ranks, sizes) if names else np.zeros(len(self.counts[rows]), dtype=np.int64)
+        groups = int(np.prod(sizes))
+        if drop_empty and groups > len(keys):
+            # More possible groups than cells (e.g. vendor x month): number only the groups that occur
+            groups, keys = np.unique(keys, return_inverse=True)
+        else:
+            groups = np.arange(groups)
+        counts = _sum_by(keys, self.counts[rows], len(groups))
+        cents = _sum_by(keys, self.cents[rows], len(groups))
+        if drop_empty:
+            groups, counts, cents = groups[counts > 0], counts[counts > 0], cents[counts > 0]
+
+        positions = np.unravel_index(groups, sizes) if names else ()
+        frame = pd.DataFrame({name: labels[name][selected[name][positions[i]]] for i, name in enumerate(names)})
+        frame["invoice_count"] = counts
+        frame["total_cents"] = cents
+        if "vendor" in by:
+            frame.insert(1, "vendor_name", self.vendor_names[selected["vendor"][positions[0]]])
+        return frame
+
+    def drill_down(self, month, statuses=None, limit=None):
+        """Vendors invoiced in one month, largest total first"""
+        frame = self.rollup(("vendor",), months=[month], statuses=statuses)
+        frame = frame.sort_values("total_cents", ascending=False, kind="stable").reset_index(drop=True)
+        return frame.head(limit) if limit else frame
+
+    def payments_by_month(self):
+        """Payment advice counts and totals per payment month, oldest first"""
+        frame = pd.DataFrame({
+            "month": self.months,
+            "payment_count": self.payments[:, 0],
+            "payment_cents": self.payments[:, 1],
+        })
+        return frame[frame["payment_count"] > 0].reset_index(drop=True)
+
+
+def _read_invoice_cells(conn, batch_size=100000):
+    """(vendor id, month key, status index, total cents) of every invoice as an int64 array"""
+    cursor = conn.execute(INVOICE_CELLS_SQL)
+    # Plain rows into NumPy in batches; aggregating here beats a GROUP BY that sorts every row
+    batches = [np.empty((0, 4), dtype=np.int64)]
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        batches.append(np.array(rows, dtype=np.int64))
+    cells = np.concatenate(batches)
+    return cells[cells[:, 2] >= 0]
+
+
+def build_cube(conn):
+    """Read invoices and payment advices into a new InvoiceCube"""
+    vendors = pd.read_sql(VENDORS_SQL, conn)
+    cells = _read_invoice_cells(conn)
+    payments = np.array(conn.execute(PAYMENTS_SQL).fetchall(), dtype=np.int64).reshape(-1, 3)
+
+    # Invoices of vendors that no longer exist keep a nameless slot, so totals match the invoices table
+    known_ids = vendors["vendor_id"].to_numpy(np.int64)
+    vendor_ids = np.union1d(known_ids, cells[:, 0])
+    known = np.searchsorted(vendor_ids, known_ids)
+    vendor_names = np.full(len(vendor_ids), None, dtype=object)
+    vendor_names[known] = vendors["vendor_name"].to_numpy(object)
+    vendor_active = np.zeros(len(vendor_ids), dtype=bool)
+    vendor_active[known] = (vendors["status"] == "active").to_numpy()
+    months = np.union1d(cells[:, 1], payments[:, 0])
+
+    # Sparse cells, month first: ids of the non-empty cells, sorted, with their counts and totals
+    cell = (np.searchsorted(months, cells[:, 1]) * len(vendor_ids) + np.searchsorted(vendor_ids, cells[:, 0])) \
+        * len(STATUSES) + cells[:, 2]
+    cell_ids, cell_index, counts = np.unique(cell, return_inverse=True, return_counts=True)
+    cents = _sum_by(cell_index, cells[:, 3], len(cell_ids))
+
+    payment_totals = np.zeros((len(months), 2), dtype=np.int64)
+    payment_totals[np.searchsorted(months, payments[:, 0])] = payments[:, 1:]
+
+    return InvoiceCube(vendor_ids, vendor_names, vendor_active, months, cell_ids, counts.astype(np.int64), cents,
+                       payment_totals)
+
+
+_lock = threading.Lock()
+_cached = {"versions": None, "cube": None}
+
+
+def get_cube(conn):
+    """The shared cube for the current data version, rebuilt after any write"""
+    versions = query_cache.table_versions(conn)
+    with _lock:
+        if _cached["cube"] is None or _cached["versions"] != versions:
+            _cached["cube"] = build_cube(conn)
+            _cached["versions"] = versions
+        return _cached["cube"]
+
+
+def main():
+    from utils.date_keys import month_label
+    from utils.db import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Build the report cube and time roll-ups over it")
+    parser.add_argument("--month", type=int, help="month key (e.g. 202609) to drill down into")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        start = time.perf_counter()
+        cube = build_cube(conn)
+        print(f"built {cube.shape} cube, {len(cube.cells):,} non-empty cells ({cube.nbytes / (1024 * 1024):,.1f} MB) "
+              f"in {time.perf_counter() - start:.2f} s")
+    finally:
+        conn.close()
+
+    by_month = cube.rollup(("month",))
+    print(by_month.assign(month=month_label(by_month["month"])).to_string(index=False))
+    for by in [("status",), ("month", "status"), ("vendor",)]:
+        start = time.perf_counter()
+        cube.rollup(by)
+        print(f"rollup by {', '.join(by)}: {(time.perf_counter() - start) * 1e6:,.0f} us")
+    if by_month.empty:
+        return
+    month = args.month or int(by_month["month"].iloc[-1])
+    start = time.perf_counter()
+    top = cube.drill_down(month, limit=10)
+    print(f"drill-down into {month}: {(time.perf_counter() - start) * 1e6:,.0f} us")
+    print(top.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Batch creation and approval of payment requests
+
+A selection of invoices is split by vendor and one payment request is
+created per vendor. Everything runs in a single transaction: the requests
+are inserted one per vendor (their ids are needed for the items), each
+vendor's items go in with one executemany() call, invoice statuses change
+with one set-based UPDATE per vendor and the audit entries are written
+with a single executemany() at the end. Either every request lands or
+none does. Request totals are summed as integer cents (see utils.money).
+
+Approving or rejecting a set of pending requests works the same way: one
+set-based UPDATE of the requests (and, on rejection, of their invoices)
+plus one executemany() of audit entries, in a single transaction.
+"""
+import json
+import time
+from datetime import datetime
+
+PAYABLE_STATUSES = ("pending", "approved")
+OPEN_REQUEST_STATUSES = ("pending", "approved")
+
+# Takes the JSON array of the selected invoice ids
+SELECTION_SQL = f"""
+    SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number,
+           i.due_date, i.total_cents, i.status,
+           EXISTS (
+               SELECT 1
+               FROM payment_request_items pri
+               JOIN payment_requests pr ON pri.request_id = pr.request_id
+               WHERE pri.invoice_id = i.invoice_id
+               AND pr.status IN {OPEN_REQUEST_STATUSES}
+           ) as in_open_request
+    FROM invoices i
+    JOIN vendors v ON i.vendor_id = v.vendor_id
+    WHERE i.invoice_id IN (SELECT value FROM json_each(?))
+    ORDER BY v.vendor_name, i.due_date, i.invoice_id
+"""
+
+
+def load_selection(conn, invoice_ids):
+    """Selected invoices with vendor, amount and why (if at all) they cannot be requested"""
+    ids = json.dumps([int(i) for i in invoice_ids])
+    rows = conn.execute(SELECTION_SQL, (ids,)).fetchall()
+
+    selection = []
+    for row in rows:
+        invoice = dict(zip(
+            ("invoice_id", "vendor_id", "vendor_name", "invoice_number", "due_date", "total_cents", "status"),
+            row[:7]
+        ))
+        if invoice["status"] not in PAYABLE_STATUSES:
+            invoice["skip_reason"] = f"status is {invoice['status']}"
+        elif row[7]:
+            invoice["skip_reason"] = "already in an open payment request"
+        else:
+            invoice["skip_reason"] = None
+        selection.append(invoice)
+    return selection
+
+
+def group_by_vendor(selection):
+    """Requestable invoices grouped per vendor, in vendor name order"""
+    batches = {}
+    for invoice in selection:
+        if invoice["skip_reason"] is None:
+            batches.setdefault(invoice["vendor_id"], []).append(invoice)
+    return list(batches.values())
+
+
+def request_numbers(count, now=None):
+    """PR<yyyymmddHHMM>, suffixed -01, -02, ... when several requests are created at once"""
+    timestamp = (now or datetime.now()).strftime("%Y%m%d%H%M")
+    if count == 1:
+        return [f"PR{timestamp}"]
+    return [f"PR{timestamp}-{n:02d}" for n in range(1, count + 1)]
+
+
+def create_payment_requests(conn, invoice_ids, user_id, notes=None):
+    """Create one payment request per vendor for the selected invoices in a single transaction.
+
+    Invoices that are not pending/approved, or that already belong to an
+    open payment request, are skipped and reported. Returns a dict with
+    the created requests (each with its own timing), the skipped
+    invoices and the total time.
+    """
+    result = {
+        "requests": [],
+        "skipped": [],
+        "invoices": 0,
+        "total_cents": 0,
+        "seconds": 0.0,
+    }
+    start = time.perf_counter()
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Validate under the write lock so nothing changes in between
+        selection = load_selection(conn, invoice_ids)
+        result["skipped"] = [
+            {"invoice_id": inv["invoice_id"], "invoice_number": inv["invoice_number"],
+             "vendor_name": inv["vendor_name"], "reason": inv["skip_reason"]}
+            for inv in selection if inv["skip_reason"] is not None
+        ]
+        batches = group_by_vendor(selection)
+        numbers = request_numbers(len(batches)) if batches else []
+
+        audit_rows = []
+        for request_number, invoices in zip(numbers, batches):
+            batch_start = time.perf_counter()
+            ids = [inv["invoice_id"] for inv in invoices]
+
+            cursor = conn.execute("""
+                INSERT INTO payment_requests
+                (request_number, requested_by, notes, status)
+                VALUES (?, ?, ?, 'pending')
+            """, (request_number, user_id, notes))
+            request_id = cursor.lastrowid
+
+            conn.executemany("""
+                INSERT INTO payment_request_items
+                (request_id, invoice_id)
+                VALUES (?, ?)
+            """, [(request_id, invoice_id) for invoice_id in ids])
+
+            conn.execute("""
+                UPDATE invoices
+                SET status = 'approved'
+                WHERE invoice_id IN (SELECT value FROM json_each(?))
+            """, (json.dumps(ids),))
+
+            audit_rows.append((user_id, request_id, f"Created payment request for {len(ids)} invoices"))
+
+            total_cents = sum(inv["total_cents"] for inv in invoices)
+            result["requests"].append({
+                "request_id": request_id,
+                "request_number": request_number,
+                "vendor_id": invoices[0]["vendor_id"],
+                "vendor_name": invoices[0]["vendor_name"],
+                "invoices": len(ids),
+                "total_cents": total_cents,
+                "seconds": time.perf_counter() - batch_start,
+            })
+            result["invoices"] += len(ids)
+            result["total_cents"] += total_cents
+
+        if audit_rows:
+            conn.executemany("""
+                INSERT INTO audit_logs
+                (user_id, action, entity_type, entity_id, details)
+                VALUES (?, 'created', 'payment_request', ?, ?)
+            """, audit_rows)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+    return result
+
+
+def _pending_requests(conn, request_ids):
+    """(request_id, request_number) of the given requests that are still pending"""
+    return conn.execute("""
+        SELECT request_id, request_number
+        FROM payment_requests
+        WHERE request_id IN (SELECT value FROM json_each(?))
+        AND status = 'pending'
+        ORDER BY request_id
+    """, (json.dumps([int(i) for i in request_ids]),)).fetchall()
+
+
+def approve_payment_requests(conn, request_ids, user_id):
+    """Approve the given pending requests in one transaction; returns the request numbers approved"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        pending = _pending_requests(conn, request_ids)
+        ids = json.dumps([row[0] for row in pending])
+
+        conn.execute("""
+            UPDATE payment_requests
+            SET status = 'approved', approved_by = ?, approved_at = CURRENT_TIMESTAMP
+            WHERE request_id IN (SELECT value FROM json_each(?))
+        """, (user_id, ids))
+
+        conn.executemany("""
+            INSERT INTO audit_logs
+            (user_id, action, entity_type, entity_id, details)
+            VALUES (?, 'approved', 'payment_request', ?, ?)
+        """, [(user_id, row[0], f"Approved payment request {row[1]}") for row in pending])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return [row[1] for row in pending]
+
+
+def reject_payment_requests(conn, request_ids, user_id, reason=None):
+    """Reject the given pending requests and return their invoices to pending, in one transaction.
+
+    Returns the request numbers rejected.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        pending = _pending_requests(conn, request_ids)
+        ids = json.dumps([row[0] for row in pending])
+
+        conn.execute("""
+            UPDATE payment_requests
+            SET status = 'rejected', approved_by = ?, approved_at = CURRENT_TIMESTAMP,
+                rejection_reason = ?
+            WHERE request_id IN (SELECT value FROM json_each(?))
+        """, (user_id, reason, ids))
+
+        # Invoices go back to pending so they can be requested again
+        conn.execute("""
+            UPDATE invoices
+            SET status = 'pending'
+            WHERE invoice_id IN (
+                SELECT invoice_id FROM payment_request_items
+                WHERE request_id IN (SELECT value FROM json_each(?))
+            )
+        """, (ids,))
+
+        conn.executemany("""
+            INSERT INTO audit_logs
+            (user_id, action, entity_type, entity_id, details)
+            VALUES (?, 'rejected', 'payment_request', ?, ?)
+        """, [(user_id, row[0], f"Rejected payment request {row[1]}") for row in pending])
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return [row[1] for row in pending]
@@ -0,0 +1,102 @@
+"""Planner statistics kept current as the data grows
+
+SQLite chooses between indexes using the row counts ANALYZE records in
+sqlite_stat1. Statistics taken when a table was small (e.g. at migration
+time on a new database) keep steering the planner long after the table
+has grown. The "planner_statistics" job compares each indexed table's row
+count with the count its statistics were taken at and re-analyzes the
+tables that have grown or shrunk by STALE_RATIO or more. ANALYZE reads at
+most ANALYSIS_LIMIT rows per index, so a refresh costs milliseconds even
+on large tables. Migration 14 schedules the job on the background worker
+every STATISTICS_INTERVAL seconds.
+
+    python -m utils.planner_stats [--all]
+"""
+import argparse
+import time
+
+from utils.jobs import job_handler
+
+STATISTICS_JOB = "planner_statistics"
+STATISTICS_SCHEDULE = "planner_statistics"
+STATISTICS_INTERVAL = 6 * 3600
+STALE_RATIO = 2.0
+STALE_MIN_ROWS = 100  # smaller changes never matter to the planner
+ANALYSIS_LIMIT = 1000
+
+
+def indexed_tables(conn):
+    """Tables with at least one index; only these have statistics the planner uses"""
+    return [row[0] for row in conn.execute("""
+        SELECT DISTINCT tbl_name FROM sqlite_master
+        WHERE type = 'index' AND tbl_name NOT LIKE 'sqlite_%'
+        ORDER BY tbl_name
+    """).fetchall()]
+
+
+def analyzed_rows(conn):
+    """Row count of each table when its statistics were taken"""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        return {}
+    rows = {}
+    for table, stat in conn.execute("SELECT tbl, stat FROM sqlite_stat1").fetchall():
+        rows[table] = max(rows.get(table, 0), int((stat or "0").split()[0]))
+    return rows
+
+
+def stale_tables(conn, ratio=STALE_RATIO):
+    """(table, rows when analyzed, rows now) of tables whose statistics no longer match their size"""
+    analyzed = analyzed_rows(conn)
+    stale = []
+    for table in indexed_tables(conn):
+        then = analyzed.get(table, 0)
+        now = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        if abs(now - then) >= STALE_MIN_ROWS and max(now, then) >= ratio * max(min(now, then), 1):
+            stale.append((table, then, now))
+    return stale
+
+
+def refresh_statistics(conn, tables=None):
+    """ANALYZE the given tables (default: the stale ones); returns the tables analyzed"""
+    tables = [table for table, _, _ in stale_tables(conn)] if tables is None else tables
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    try:
+        for table in tables:
+            conn.execute(f'ANALYZE "{table}"')
+        conn.commit()
+    finally:
+        conn.execute("PRAGMA analysis_limit = 0")
+    return tables
+
+
+@job_handler(STATISTICS_JOB)
+def run_statistics_job(payload):
+    from utils.db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        return {"analyzed": refresh_statistics(conn)}
+    finally:
+        conn.close()
+
+
+def main():
+    from utils.db import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Refresh stale planner statistics")
+    parser.add_argument("--all", action="store_true", help="analyze every indexed table, stale or not")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        for table, then, now in stale_tables(conn):
+            print(f"{table:32} analyzed at {then:,} rows, now {now:,}")
+        start = time.perf_counter()
+        analyzed = refresh_statistics(conn, indexed_tables(conn) if args.all else None)
+        print(f"Analyzed {len(analyzed)} tables in {time.perf_counter() - start:.2f} s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
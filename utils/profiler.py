@@ -0,0 +1,309 @@
+"""Query profiler and slow-query log
+
+Every statement run through a pooled connection (conn.execute, pd.read_sql,
+cursors) is timed from execute to the last fetch and recorded with its
+SQL fingerprint, row count and the page being rendered. Recent queries
+and page renders are kept in in-memory ring buffers for percentiles;
+queries slower than the threshold are also appended to a rolling log in
+a separate SQLite file so they survive restarts.
+"""
+import contextvars
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.tracing import tracer
+
+QUERY_HISTORY_SIZE = 5000  # recent queries kept for percentiles
+PAGE_HISTORY_SIZE = 1000  # recent page renders kept for percentiles
+SLOW_QUERY_MS = 250
+SLOW_LOG_PATH = "slow_queries.db"
+SLOW_LOG_MAX_ROWS = 1000
+
+# Page being rendered by the current Streamlit script thread
+current_page = contextvars.ContextVar("current_page", default=None)
+_page_queries = contextvars.ContextVar("page_queries", default=None)  # [count] for the current page
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """SQL with literals replaced and whitespace collapsed, so calls that differ only in values group together"""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def _percentiles(frame, key, value):
+    """Count, p50/p95/p99, max and total of value (seconds) per key, in milliseconds"""
+    rows = []
+    for name, group in frame.groupby(key, sort=False):
+        ms = group[value].to_numpy() * 1000
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        rows.append({
+            key: name,
+            "calls": len(ms),
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "max_ms": ms.max(),
+            "total_ms": ms.sum(),
+        })
+    columns = [key, "calls", "p50_ms", "p95_ms", "p99_ms", "max_ms", "total_ms"]
+    return pd.DataFrame(rows, columns=columns).sort_values("total_ms", ascending=False, ignore_index=True)
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log_path=SLOW_LOG_PATH,
+                 history_size=QUERY_HISTORY_SIZE, page_history_size=PAGE_HISTORY_SIZE,
+                 slow_log_max_rows=SLOW_LOG_MAX_ROWS):
+        self.enabled = True
+        self.slow_ms = slow_ms
+        self.slow_log_path = slow_log_path
+        self.slow_log_max_rows = slow_log_max_rows
+        self._queries = deque(maxlen=history_size)  # [fingerprint, seconds, rows, page, started_at, log_id]
+        self._pages = deque(maxlen=page_history_size)  # (page, seconds, queries, started_at)
+        self._log_lock = threading.Lock()
+        self._log_ready = False
+
+    # Recording
+
+    def start_query(self, sql, seconds, rows=0):
+        """Record a statement that has just executed; returns the record for later fetches"""
+        if not self.enabled:
+            return None
+        record = [fingerprint(sql), seconds, rows, current_page.get(), time.time(), None]
+        self._queries.append(record)
+        counter = _page_queries.get()
+        if counter is not None:
+            counter[0] += 1
+        return record
+
+    def add_fetch(self, record, seconds, rows):
+        """Add fetch time and rows to a statement's record"""
+        if record is not None:
+            record[1] += seconds
+            record[2] += rows
+
+    def finish(self, record, sql):
+        """Called once a statement's results are consumed; logs it if it was slow"""
+        if record is None or record[1] * 1000 < self.slow_ms:
+            return
+        try:
+            self._log_slow(record, sql)
+        except sqlite3.Error:
+            # The log is diagnostic only; never fail the query because of it
+            pass
+
+    @contextmanager
+    def page(self, name):
+        """Time a page render and attribute the queries run inside it to the page"""
+        counter = [0]
+        token = current_page.set(name)
+        counter_token = _page_queries.set(counter)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            current_page.reset(token)
+            _page_queries.reset(counter_token)
+            if self.enabled:
+                self._pages.append((name, time.perf_counter() - start, counter[0], time.time()))
+
+    # Slow query log
+
+    def _log_connection(self):
+        conn = sqlite3.connect(self.slow_log_path, timeout=1.0)
+        if not self._log_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS slow_queries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    logged_at TIMESTAMP NOT NULL,
+                    page TEXT,
+                    fingerprint TEXT NOT NULL,
+                    sql TEXT,
+                    duration_ms REAL NOT NULL,
+                    rows INTEGER NOT NULL
+                )
+            """)
+            self._log_ready = True
+        return conn
+
+    def _log_slow(self, record, sql):
+        fp, seconds, rows, page, started_at, _ = record
+        with self._log_lock:
+            conn = self._log_connection()
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        "INSERT INTO slow_queries (logged_at, page, fingerprint, sql, duration_ms, rows) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started_at)),
+                         page, fp, sql, seconds * 1000, rows)
+                    )
+                    record[5] = cursor.lastrowid
+                    # Rolling log: keep only the most recent rows
+                    conn.execute(
+                        "DELETE FROM slow_queries WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?",
+                        (self.slow_log_max_rows,)
+                    )
+            finally:
+                conn.close()
+
+    def slow_queries(self, limit=100):
+        """Most recent entries of the slow query log"""
+        with self._log_lock:
+            conn = self._log_connection()
+            try:
+                return pd.read_sql(
+                    "SELECT logged_at, page, duration_ms, rows, fingerprint, sql "
+                    "FROM slow_queries ORDER BY id DESC LIMIT ?",
+                    conn, params=(limit,)
+                )
+            finally:
+                conn.close()
+
+    # Reporting
+
+    def query_stats(self):
+        """Latency percentiles per SQL fingerprint over the recent query history"""
+        records = list(self._queries)
+        frame = pd.DataFrame(
+            [(r[0], r[1], r[2], r[3]) for r in records],
+            columns=["fingerprint", "seconds", "rows", "page"]
+        )
+        stats = _percentiles(frame, "fingerprint", "seconds")
+        if not frame.empty:
+            extra = frame.groupby("fingerprint").agg(
+                avg_rows=("rows", "mean"),
+                pages=("page", lambda pages: ", ".join(sorted({p for p in pages if p})))
+            )
+            stats = stats.join(extra, on="fingerprint")
+        return stats
+
+    def page_stats(self):
+        """Render time percentiles per page over the recent render history"""
+        frame = pd.DataFrame(list(self._pages), columns=["page", "seconds", "queries", "started_at"])
+        stats = _percentiles(frame, "page", "seconds")
+        if not frame.empty:
+            stats = stats.join(frame.groupby("page")["queries"].mean().rename("avg_queries"), on="page")
+        return stats
+
+    def summary(self):
+        return {
+            "queries_recorded": len(self._queries),
+            "pages_recorded": len(self._pages),
+            "slow_queries": sum(1 for record in list(self._queries) if record[5] is not None),
+        }
+
+    def clear(self, slow_log=False):
+        self._queries.clear()
+        self._pages.clear()
+        if slow_log:
+            with self._log_lock:
+                conn = self._log_connection()
+                try:
+                    with conn:
+                        conn.execute("DELETE FROM slow_queries")
+                finally:
+                    conn.close()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch timings to the profiler.
+
+    A statement's record is finished when its rows are exhausted, when the
+    cursor runs another statement, or when the cursor is closed or freed.
+    """
+
+    _record = None
+    _sql = None
+    _span = None  # (parent span, start) when running inside a trace
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, start)
+
+    def _begin(self, sql, start):
+        seconds = time.perf_counter() - start
+        self._sql = sql
+        parent = tracer.current_span()
+        self._span = (parent, start) if parent is not None else None
+        if self.description is None:
+            # No result set: report the rows changed and finish right away
+            self._record = profiler.start_query(sql, seconds, max(self.rowcount, 0))
+            self._finish()
+        else:
+            self._record = profiler.start_query(sql, seconds)
+
+    def _fetched(self, seconds, rows, exhausted):
+        profiler.add_fetch(self._record, seconds, rows)
+        if exhausted:
+            self._finish()
+
+    def _finish(self):
+        if self._record is not None:
+            record, self._record = self._record, None
+            profiler.finish(record, self._sql)
+            if self._span is not None:
+                parent, start = self._span
+                self._span = None
+                tracer.add_span(parent, record[0][:120], "query", start, record[1])
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(time.perf_counter() - start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(time.perf_counter() - start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(time.perf_counter() - start, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Covers the common conn.execute(...).fetchone() where the cursor is simply dropped
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+# Shared by every session in this process
+profiler = QueryProfiler()
@@ -0,0 +1,263 @@
+"""SQL of the hot queries the pages in app.py run
+
+The pages and utils.query_audit both import these, so the plans the audit
+checks are those of the queries the app actually runs. Queries whose WHERE
+clause depends on the filters are built by a function returning
+(sql, params). Queries run by a utils module (the report cube, payment
+batches) live in that module.
+"""
+from datetime import datetime, timedelta
+
+from utils.search import dense_match, id_filter, match_ids_sql, substring_ids_sql
+
+LOGIN_SQL = "SELECT * FROM users WHERE username = ? AND status = 'active'"
+
+ACTIVE_VENDOR_COUNT_SQL = "SELECT COUNT(*) FROM vendors WHERE status = 'active'"
+PENDING_INVOICE_COUNT_SQL = "SELECT COUNT(*) FROM invoices WHERE status = 'pending'"
+OUTSTANDING_TOTAL_SQL = "SELECT SUM(total_cents) FROM invoice_aging_summary"
+PENDING_REQUEST_COUNT_SQL = "SELECT COUNT(*) FROM payment_requests WHERE status = 'pending'"
+
+DASHBOARD_AGING_SQL = """
+    SELECT s.vendor_id, v.vendor_name, s.due_date, s.invoice_count, s.total_cents
+    FROM invoice_aging_summary s
+    JOIN vendors v ON s.vendor_id = v.vendor_id
+"""
+
+RECENT_INVOICES_SQL = """
+    SELECT v.vendor_name, i.invoice_number, i.invoice_date, i.due_date, i.total_cents, i.status
+    FROM invoices i
+    JOIN vendors v ON i.vendor_id = v.vendor_id
+    WHERE i.status IN ('pending', 'approved')
+    ORDER BY i.invoice_date DESC
+    LIMIT 5
+"""
+
+_VENDOR_LIST = """
+    SELECT v.vendor_id, v.vendor_name, v.contact_person, v.email, v.phone, v.status,
+           COUNT(DISTINCT i.invoice_id) as invoice_count,
+           SUM(CASE WHEN i.status IN ('pending', 'approved') THEN i.total_cents ELSE 0 END) as outstanding_cents
+    FROM {source}
+    LEFT JOIN invoices i ON v.vendor_id = i.vendor_id
+    GROUP BY v.vendor_id
+    ORDER BY {order}
+"""
+VENDOR_LIST_SQL = _VENDOR_LIST.format(source="vendors v", order="v.vendor_name")
+# Takes the JSON array of matching vendor ids, best match first
+VENDOR_SEARCH_SQL = _VENDOR_LIST.format(
+    source="json_each(?) s JOIN vendors v ON v.vendor_id = s.value", order="MIN(s.key)"
+)
+
+VENDOR_BANK_DETAILS_SQL = "SELECT * FROM vendor_bank_details WHERE vendor_id = ?"
+VENDOR_DOCUMENTS_SQL = "SELECT * FROM vendor_documents WHERE vendor_id = ?"
+ACTIVE_VENDOR_OPTIONS_SQL = "SELECT vendor_id, vendor_name FROM vendors WHERE status = 'active' ORDER BY vendor_name"
+
+# The join order and indexes are pinned rather than left to the planner: with
+# statistics from a smaller database it starts from vendors and sorts every
+# invoice before the LIMIT. invoice_index is DUE_DATE_ORDER when the page
+# walks invoices in due date order, stopping at LIMIT, or empty when a few
+# search matches are looked up and sorted instead.
+DUE_DATE_ORDER = "INDEXED BY idx_invoices_due_date"
+INVOICE_PAGE_SQL = """
+    SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number,
+           i.invoice_date, i.due_date, i.total_cents, i.status, i.description
+    FROM invoices i {invoice_index}
+    CROSS JOIN vendors v NOT INDEXED ON i.vendor_id = v.vendor_id
+    {where_clause}
+    ORDER BY i.due_date ASC, i.invoice_id ASC
+    LIMIT ?
+"""
+
+IMPORT_HISTORY_SQL = """
+    SELECT started_at, entity, source, status, watermark_from, watermark_to,
+           rows_fetched, rows_inserted, rows_updated, rows_skipped, duration_ms, error
+    FROM tally_sync_runs
+    ORDER BY run_id DESC
+    LIMIT 20
+"""
+
+PAYMENT_REQUEST_LIST_SQL = """
+    SELECT pr.request_id, pr.request_number, pr.requested_at,
+           u1.full_name as requested_by, pr.status,
+           u2.full_name as approved_by, pr.approved_at, pr.notes,
+           COUNT(pri.invoice_id) as invoice_count,
+           SUM(i.total_cents) as total_cents
+    FROM payment_requests pr
+    JOIN users u1 ON pr.requested_by = u1.user_id
+    LEFT JOIN users u2 ON pr.approved_by = u2.user_id
+    JOIN payment_request_items pri ON pr.request_id = pri.request_id
+    JOIN invoices i ON pri.invoice_id = i.invoice_id
+    GROUP BY pr.request_id
+    ORDER BY pr.requested_at DESC
+"""
+
+PAYMENT_REQUEST_ITEMS_SQL = """
+    SELECT i.invoice_id, i.vendor_id, v.vendor_name, i.invoice_number,
+           i.invoice_date, i.due_date, i.total_cents
+    FROM payment_request_items pri
+    JOIN invoices i ON pri.invoice_id = i.invoice_id
+    JOIN vendors v ON i.vendor_id = v.vendor_id
+    WHERE pri.request_id = ?
+"""
+
+PAYMENT_REQUEST_ADVICES_SQL = """
+    SELECT * FROM payment_advices
+    WHERE request_id = ?
+    ORDER BY generated_at DESC
+"""
+
+REJECT_REQUEST_INVOICES_SQL = """
+    UPDATE invoices
+    SET status = 'pending'
+    WHERE invoice_id IN (
+        SELECT invoice_id FROM payment_request_items WHERE request_id = ?
+    )
+"""
+
+PENDING_APPROVALS_SQL = """
+    SELECT pr.request_id, pr.request_number, pr.requested_at,
+           u1.full_name as requested_by, pr.status, pr.notes,
+           COUNT(pri.invoice_id) as invoice_count,
+           SUM(i.total_cents) as total_cents,
+           MIN(v.vendor_name) as vendor_name
+    FROM payment_requests pr
+    JOIN users u1 ON pr.requested_by = u1.user_id
+    JOIN payment_request_items pri ON pr.request_id = pri.request_id
+    JOIN invoices i ON pri.invoice_id = i.invoice_id
+    JOIN vendors v ON i.vendor_id = v.vendor_id
+    WHERE pr.status = 'pending'
+    GROUP BY pr.request_id
+    ORDER BY pr.requested_at ASC
+"""
+
+# Invoice lines of every pending request in one query
+PENDING_APPROVAL_INVOICES_SQL = """
+    SELECT pri.request_id, i.invoice_id, i.invoice_number, i.invoice_date, i.due_date, i.total_cents
+    FROM payment_requests pr
+    JOIN payment_request_items pri ON pr.request_id = pri.request_id
+    JOIN invoices i ON pri.invoice_id = i.invoice_id
+    WHERE pr.status = 'pending'
+    ORDER BY pri.request_id, i.due_date
+"""
+
+AGING_SUMMARY_SQL = """
+    SELECT vendor_id, due_date, invoice_count, total_cents
+    FROM invoice_aging_summary
+"""
+
+# Walks due dates in order like the invoice page: the two open statuses are
+# two ranges of idx_invoices_status_due_date, which would have to be sorted
+AGING_DETAILS_SQL = f"""
+    SELECT v.vendor_name, i.invoice_number, i.invoice_date, i.due_date, i.total_cents, i.status
+    FROM invoices i {DUE_DATE_ORDER}
+    CROSS JOIN vendors v NOT INDEXED ON i.vendor_id = v.vendor_id
+    WHERE +i.status IN ('pending', 'approved')
+      AND ({{range_clauses}})
+    ORDER BY i.due_date ASC
+    LIMIT ?
+"""
+
+PAYMENT_HISTORY_SQL = """
+    SELECT pa.advice_number, pa.generated_at, pa.payment_date, pa.total_cents,
+           pr.request_number, u.full_name as approved_by,
+           COUNT(pri.invoice_id) as invoice_count,
+           GROUP_CONCAT(DISTINCT v.vendor_name) as vendor_names
+    FROM payment_advices pa
+    JOIN payment_requests pr ON pa.request_id = pr.request_id
+    JOIN users u ON pr.approved_by = u.user_id
+    JOIN payment_request_items pri ON pr.request_id = pri.request_id
+    JOIN invoices i ON pri.invoice_id = i.invoice_id
+    JOIN vendors v ON i.vendor_id = v.vendor_id
+    WHERE pa.payment_day BETWEEN ? AND ?
+    GROUP BY pa.advice_id
+    ORDER BY pa.payment_day DESC
+"""
+
+# Takes the JSON array of matching user ids, best match first
+USER_SEARCH_SQL = """
+    SELECT u.user_id, u.username, u.full_name, u.email, u.role, u.department, u.status, u.created_at
+    FROM json_each(?) s
+    JOIN users u ON u.user_id = s.value
+    ORDER BY s.key
+"""
+
+USER_LIST_SQL = """
+    SELECT user_id, username, full_name, email, role, department, status, created_at
+    FROM users
+    ORDER BY created_at DESC
+"""
+
+
+def invoice_page_query(conn, search, status_filter, date_filter, after=None, limit=10, today=None, dense=None):
+    """(sql, params) of one invoice page ordered by (due_date, invoice_id), starting after the given key.
+
+    It selects limit + 1 rows; the extra one only tells whether another
+    page exists. dense overrides dense_match() for the search matches.
+    """
+    conditions = []
+    params = []
+    invoice_index = DUE_DATE_ORDER
+
+    if search:
+        # Every invoice whose number or description matches, contains the text (a fragment of an
+        # invoice number), or whose vendor matches; the keyset LIMIT bounds the work, not a match cap
+        matches = []
+        any_dense = False
+        for column, ids_sql in [
+            ("i.invoice_id", match_ids_sql(conn, "invoices", search)),
+            ("i.invoice_id", substring_ids_sql("invoices", search)),
+            ("i.vendor_id", match_ids_sql(conn, "vendors", search)),
+        ]:
+            if ids_sql:
+                is_dense = dense_match(conn, ids_sql) if dense is None else dense
+                condition, condition_params = id_filter(conn, column, ids_sql, is_dense)
+                matches.append(condition)
+                params += list(condition_params)
+                any_dense = any_dense or is_dense
+        conditions.append(f"({' OR '.join(matches) or '0'})")
+        if not any_dense:
+            # At most a few COMMON_TERM_DOCS matches: sorting them beats walking every due date
+            invoice_index = ""
+
+    if status_filter:
+        # Unary + keeps the planner on the due_date index so the scan stops at LIMIT
+        conditions.append(f"+i.status IN ({','.join(['?'] * len(status_filter))})")
+        params += list(status_filter)
+
+    today = today or datetime.now().date()
+    if date_filter == "Due this week":
+        conditions.append("i.due_date BETWEEN ? AND ?")
+        params += [today, today + timedelta(days=7)]
+    elif date_filter == "Due this month":
+        conditions.append("i.due_date BETWEEN ? AND ?")
+        params += [today, today + timedelta(days=30)]
+    elif date_filter == "Overdue":
+        conditions.append("i.due_date < ?")
+        params.append(today)
+
+    if after:
+        conditions.append("(i.due_date, i.invoice_id) > (?, ?)")
+        params += list(after)
+
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = INVOICE_PAGE_SQL.format(invoice_index=invoice_index, where_clause=where_clause)
+    return sql, params + [limit + 1]
+
+
+def aging_details_query(bucket_ranges, buckets, limit):
+    """(sql, params) of the open invoices due within the selected buckets' date ranges, or None for no buckets"""
+    range_clauses = []
+    params = []
+    for bucket in buckets:
+        earliest, latest = bucket_ranges[bucket]
+        if earliest and latest:
+            range_clauses.append("i.due_date BETWEEN ? AND ?")
+            params += [earliest, latest]
+        elif earliest:
+            range_clauses.append("i.due_date >= ?")
+            params.append(earliest)
+        else:
+            range_clauses.append("i.due_date <= ?")
+            params.append(latest)
+    if not range_clauses:
+        return None
+    return AGING_DETAILS_SQL.format(range_clauses=" OR ".join(range_clauses)), params + [limit]
@@ -0,0 +1,211 @@
+"""EXPLAIN QUERY PLAN audit for the hot queries in app.py
+
+Each registered query is the SQL a page runs, imported from utils.queries
+(or the utils module that runs it), with sample parameters; queries built
+from the page's filters are registered as a function of the connection
+returning (sql, params). audit() runs EXPLAIN QUERY PLAN on each one and
+flags full table scans and temporary sort B-trees, so a missing or
+unusable index shows up before it shows up as a slow page. A query that
+legitimately reads every row of a table lists that table (or its alias)
+in allow_scan. A LIMIT query registered with ordered=True (the keyset
+pages) must read its rows in ORDER BY order from an index; a temporary
+B-tree for its ORDER BY means it sorts every matching row first, and
+fails the audit.
+
+Run from the repository root:
+
+    python -m utils.query_audit [--db accounts_payable.db] [--verbose]
+
+The exit status is 1 if any query has an unexpected full scan or sort.
+"""
+import argparse
+import re
+import sqlite3
+import sys
+from datetime import date, timedelta
+
+from utils import olap, queries
+from utils.aging import bucket_due_ranges
+from utils.date_keys import day_key
+from utils.migrations import MIGRATIONS
+from utils.payment_batches import SELECTION_SQL
+
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?")
+
+# name -> (sql or build(conn) -> (sql, params), params, allow_scan, ordered)
+REGISTERED_QUERIES = {}
+
+
+def register_query(name, sql, params=(), allow_scan=(), ordered=False):
+    """Add a query to the audit; allow_scan names tables/aliases it must read in full.
+
+    ordered=True requires the ORDER BY to come from an index.
+    """
+    REGISTERED_QUERIES[name] = (sql, tuple(params), tuple(allow_scan), ordered)
+
+
+def explain(conn, sql, params=()):
+    """EXPLAIN QUERY PLAN detail lines, indented by depth"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params)).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return lines
+
+
+def audit_query(conn, name, sql, params=(), allow_scan=(), ordered=False):
+    """Plan one query and classify its scans and sorts"""
+    plan = explain(conn, sql, params)
+    full_scans = []
+    allowed_scans = []
+    temp_btrees = []
+
+    for line in plan:
+        detail = line.strip()
+        match = SCAN_RE.match(detail)
+        # Virtual tables (FTS5 MATCH, json_each) report every lookup as SCAN ... VIRTUAL TABLE
+        if match and " USING " not in detail and " VIRTUAL TABLE " not in detail:
+            table = match.group(2) or match.group(1)
+            if table in allow_scan or match.group(1) in allow_scan:
+                allowed_scans.append(table)
+            else:
+                full_scans.append(table)
+        elif detail.startswith("USE TEMP B-TREE"):
+            temp_btrees.append(detail[len("USE TEMP B-TREE FOR "):])
+
+    # A sort over the whole result; "RIGHT PART OF ORDER BY" only sorts rows sharing the indexed prefix
+    unordered = ordered and "ORDER BY" in temp_btrees
+    return {
+        "query": name,
+        "ok": not full_scans and not unordered,
+        "full_scans": full_scans,
+        "unordered": unordered,
+        "allowed_scans": allowed_scans,
+        "temp_btrees": temp_btrees,
+        "plan": plan,
+    }
+
+
+def audit(conn, queries=None):
+    """Audit every registered query (or the given subset of names)"""
+    names = queries or list(REGISTERED_QUERIES)
+    results = []
+    for name in names:
+        sql, params, allow_scan, ordered = REGISTERED_QUERIES[name]
+        try:
+            if callable(sql):
+                sql, params = sql(conn)
+            results.append(audit_query(conn, name, sql, params, allow_scan, ordered))
+        except sqlite3.Error as e:
+            results.append({
+                "query": name,
+                "ok": False,
+                "full_scans": [],
+                "unordered": False,
+                "allowed_scans": [],
+                "temp_btrees": [],
+                "plan": [f"error: {e}"],
+            })
+    return results
+
+
+# Sample parameters
+_today = date.today()
+
+register_query("login", queries.LOGIN_SQL, ("admin",))
+register_query("dashboard_active_vendors", queries.ACTIVE_VENDOR_COUNT_SQL)
+register_query("dashboard_pending_invoices", queries.PENDING_INVOICE_COUNT_SQL)
+register_query("dashboard_outstanding", queries.OUTSTANDING_TOTAL_SQL, allow_scan=("invoice_aging_summary",))
+register_query("dashboard_pending_requests", queries.PENDING_REQUEST_COUNT_SQL)
+register_query("dashboard_aging", queries.DASHBOARD_AGING_SQL, allow_scan=("s",))
+register_query("dashboard_recent_invoices", queries.RECENT_INVOICES_SQL)
+register_query("vendor_list", queries.VENDOR_LIST_SQL, allow_scan=("v",))
+register_query("vendor_list_search", queries.VENDOR_SEARCH_SQL, ("[1, 2, 3]",))
+register_query("vendor_bank_details", queries.VENDOR_BANK_DETAILS_SQL, (1,))
+register_query("vendor_documents", queries.VENDOR_DOCUMENTS_SQL, (1,))
+register_query("active_vendor_options", queries.ACTIVE_VENDOR_OPTIONS_SQL)
+
+register_query("invoice_page", lambda conn: queries.invoice_page_query(
+    conn, "", ["pending", "approved"], "All", after=(str(_today), 0), today=_today
+), ordered=True)
+register_query("invoice_page_overdue", lambda conn: queries.invoice_page_query(
+    conn, "", ["pending", "approved"], "Overdue", today=_today
+), ordered=True)
+# Search matches of a few rows (IN lists, sorted: there are at most a few
+# COMMON_TERM_DOCS of them) and of many rows (per-row EXISTS in due date order)
+register_query("invoice_page_search", lambda conn: queries.invoice_page_query(
+    conn, "inv", ["pending", "approved"], "All", today=_today, dense=False
+))
+register_query("invoice_page_search_common", lambda conn: queries.invoice_page_query(
+    conn, "inv", ["pending", "approved"], "All", today=_today, dense=True
+), ordered=True)
+
+register_query("payment_request_selection", SELECTION_SQL, ("[1, 2, 3]",))
+register_query("import_history", queries.IMPORT_HISTORY_SQL, allow_scan=("tally_sync_runs",), ordered=True)
+register_query("payment_request_list", queries.PAYMENT_REQUEST_LIST_SQL, allow_scan=("pr", "pri", "i"))
+register_query("payment_request_items", queries.PAYMENT_REQUEST_ITEMS_SQL, (1,))
+register_query("payment_request_advices", queries.PAYMENT_REQUEST_ADVICES_SQL, (1,))
+register_query("payment_request_reject_invoices", queries.REJECT_REQUEST_INVOICES_SQL, (1,))
+register_query("pending_approvals", queries.PENDING_APPROVALS_SQL)
+register_query("pending_approval_invoices", queries.PENDING_APPROVAL_INVOICES_SQL)
+
+register_query("aging_summary", queries.AGING_SUMMARY_SQL, allow_scan=("invoice_aging_summary",))
+register_query("aging_details", lambda conn: queries.aging_details_query(
+    bucket_due_ranges(_today), ["31-60 Days"], 500
+), ordered=True)
+# With current statistics the planner starts from the handful of approvers
+register_query(
+    "payment_history", queries.PAYMENT_HISTORY_SQL, (day_key(_today - timedelta(days=30)), day_key(_today)),
+    allow_scan=("u",)
+)
+
+# The report cube (utils.olap) reads every invoice once per data version; the
+# vendor summary, status and monthly trend reports roll it up in memory
+register_query("report_cube_vendors", olap.VENDORS_SQL, allow_scan=("vendors",))
+register_query("report_cube_invoices", olap.INVOICE_CELLS_SQL, allow_scan=("invoices",))
+register_query("report_cube_payments", olap.PAYMENTS_SQL)
+
+register_query("user_search", queries.USER_SEARCH_SQL, ("[1, 2]",))
+register_query("user_list", queries.USER_LIST_SQL, allow_scan=("users",))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="accounts_payable.db")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every query, not just flagged ones")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < MIGRATIONS[-1][0]:
+        print(f"warning: schema is at migration {version} of {MIGRATIONS[-1][0]}; "
+              "start the app once to apply the rest before trusting these plans")
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        print("warning: no ANALYZE statistics; the planner is using default row estimates")
+
+    results = audit(conn)
+    conn.close()
+
+    for result in results:
+        status = "ok" if result["ok"] else "SORT" if not result["full_scans"] else "FULL SCAN"
+        notes = []
+        if result["full_scans"]:
+            notes.append(f"scans {', '.join(result['full_scans'])}")
+        if result["unordered"]:
+            notes.append("sorts every row before the LIMIT")
+        if result["temp_btrees"]:
+            notes.append(f"temp b-tree for {', '.join(result['temp_btrees'])}")
+        print(f"{status:<10} {result['query']:<28} {'; '.join(notes)}")
+        if args.verbose or not result["ok"]:
+            for line in result["plan"]:
+                print(f"{'':<11}{line}")
+
+    flagged = [r["query"] for r in results if not r["ok"]]
+    print(f"\n{len(results)} queries audited, {len(flagged)} with unexpected full scans or sorts")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
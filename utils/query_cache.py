@@ -0,0 +1,110 @@
+"""Query result cache with a TTL and table-version invalidation
+
+Results are keyed by SQL text plus parameters. Each entry remembers the
+table_versions counters it was computed under; the triggers created in
+utils.migrations bump those counters on every write to invoices, vendors
+and payment_requests, so a write anywhere (any page, any process) makes
+the next lookup miss even before the TTL runs out.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+QUERY_CACHE_TTL = 60.0  # seconds
+QUERY_CACHE_MAX_ENTRIES = 256
+TRACKED_TABLES = ("invoices", "vendors", "payment_requests")
+
+
+class QueryCache:
+    def __init__(self, ttl=QUERY_CACHE_TTL, max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, versions)
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "invalidated": 0,
+            "evicted": 0,
+        }
+
+    def table_versions(self, conn, tables=TRACKED_TABLES):
+        rows = conn.execute(
+            f"SELECT table_name, version FROM table_versions WHERE table_name IN ({','.join(['?'] * len(tables))})",
+            tuple(tables)
+        ).fetchall()
+        versions = {row[0]: row[1] for row in rows}
+        return tuple(versions.get(table, 0) for table in tables)
+
+    def _lookup(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at, entry_versions = entry
+            if entry_versions != versions:
+                self._stats["invalidated"] += 1
+                self._stats["misses"] += 1
+                del self._entries[key]
+                return None
+            if time.monotonic() > expires_at:
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def _store(self, key, value, versions):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl, versions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def _cached(self, kind, sql, conn, params, tables, compute):
+        key = (kind, sql, tuple(params or ()), tuple(tables))
+        versions = self.table_versions(conn, tables)
+        entry = self._lookup(key, versions)
+        if entry is not None:
+            return entry[0]
+        value = compute()
+        self._store(key, value, versions)
+        return value
+
+    def read_sql(self, sql, conn, params=None, tables=TRACKED_TABLES):
+        """Cached pd.read_sql; returns a copy so callers may modify it"""
+        df = self._cached(
+            "frame", sql, conn, params, tables,
+            lambda: pd.read_sql(sql, conn, params=params)
+        )
+        return df.copy()
+
+    def scalar(self, sql, conn, params=None, tables=TRACKED_TABLES):
+        """Cached single value from the first column of the first row"""
+        def compute():
+            row = conn.execute(sql, tuple(params or ())).fetchone()
+            return row[0] if row else None
+        return self._cached("scalar", sql, conn, params, tables, compute)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            return stats
+
+
+# Shared by every session in this process
+query_cache = QueryCache()
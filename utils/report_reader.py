@@ -0,0 +1,161 @@
+"""Read path for reports, kept apart from invoice entry
+
+Reports read through get_report_connection() instead of the shared pool.
+By default it serves them from a read-only snapshot of the database,
+snapshots/report_snapshot.db. The snapshot is taken with the online
+backup API (see utils.backup.snapshot) by the "report_snapshot" job,
+which a schedule runs on the background worker once per staleness
+interval, so no report render ever waits for a copy; reports keep
+reading the previous snapshot until the new one is in place. Until the
+first snapshot exists, reports read live data. The snapshot is opened
+immutable, so month-end reports take no locks on the live database, and
+they do not hold back its WAL checkpoints however long they run. A
+refresh writes a new file and renames it into place, so a report that is
+still reading the old snapshot keeps a consistent copy.
+
+With the staleness set to 0, reports instead read the live database
+through a read-only connection whose read transaction is opened up front.
+In WAL mode that pins every query of the report to one consistent point
+without blocking writers.
+
+The staleness is the "report_staleness_seconds" setting
+(REPORT_STALENESS_SECONDS when unset); schedule_snapshots() applies it.
+conn.as_of tells the report how current its data is.
+
+    python -m utils.report_reader [--refresh]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from utils.db import BUSY_TIMEOUT_MS, DB_PATH, MMAP_SIZE, PooledConnection, get_db_connection
+from utils.jobs import enqueue, job_handler, set_schedule
+
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "report_snapshot.db")
+REPORT_STALENESS_SECONDS = 300
+SNAPSHOT_JOB = "report_snapshot"
+SNAPSHOT_SCHEDULE = "report_snapshot"
+
+
+def report_staleness():
+    """Seconds report data may lag behind the live database; 0 reads it live"""
+    from utils.settings import load_settings
+
+    return max(0, int(load_settings().get("report_staleness_seconds", REPORT_STALENESS_SECONDS)))
+
+
+def snapshot_time(path=SNAPSHOT_PATH):
+    """When the snapshot at path was taken (epoch seconds), or None if there is none"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def refresh_snapshot(db_path=DB_PATH, path=SNAPSHOT_PATH):
+    """Take a new snapshot of db_path and swap it in; returns the time it was taken"""
+    from utils.backup import snapshot
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".db.part", dir=directory)
+    os.close(fd)
+    taken_at = time.time()
+    try:
+        snapshot(db_path, tmp_path)
+        # The file's mtime records when the data was read, not when the copy finished
+        os.utime(tmp_path, (taken_at, taken_at))
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return taken_at
+
+
+def expire_snapshot(path=SNAPSHOT_PATH):
+    """Drop the snapshot so reports read live data until a new one is taken, e.g. after a restore"""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def schedule_snapshots(conn, staleness=None):
+    """Refresh the snapshot on the background worker every staleness seconds; none when it is 0"""
+    staleness = report_staleness() if staleness is None else staleness
+    set_schedule(conn, SNAPSHOT_SCHEDULE, SNAPSHOT_JOB, max(staleness, 1), enabled=staleness > 0)
+
+
+def request_snapshot(conn):
+    """Queue a snapshot refresh on the background worker; returns the job id"""
+    return enqueue(conn, SNAPSHOT_JOB, max_attempts=2)
+
+
+@job_handler(SNAPSHOT_JOB)
+def run_snapshot_job(payload):
+    return {"taken_at": refresh_snapshot()}
+
+
+def _connect(uri):
+    conn = sqlite3.connect(uri, uri=True, factory=PooledConnection, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    return conn
+
+
+def get_report_connection(staleness=None, db_path=DB_PATH, path=SNAPSHOT_PATH):
+    """Read-only connection for report queries; conn.close() closes it.
+
+    conn.as_of is the time its data was read and conn.live says whether it
+    is the live database rather than a snapshot.
+    """
+    staleness = report_staleness() if staleness is None else staleness
+    if staleness <= 0:
+        conn = _connect(f"file:{os.path.abspath(db_path)}?mode=ro")
+        # Start the read transaction now so every query of the report sees the same data
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        conn.as_of = time.time()
+        conn.live = True
+        return conn
+
+    taken_at = snapshot_time(path)
+    if taken_at is None:
+        # First use, or just after a restore: have the worker take one and read live data meanwhile
+        conn = get_db_connection()
+        try:
+            schedule_snapshots(conn, staleness)
+            request_snapshot(conn)
+        finally:
+            conn.close()
+        return get_report_connection(0, db_path, path)
+    # Immutable: SQLite reads the file without locks or change checks, which holds because it is only ever replaced
+    conn = _connect(f"file:{os.path.abspath(path)}?mode=ro&immutable=1")
+    conn.as_of = taken_at
+    conn.live = False
+    return conn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or refresh the report snapshot")
+    parser.add_argument("--refresh", action="store_true", help="take a new snapshot now")
+    args = parser.parse_args()
+
+    if args.refresh:
+        start = time.perf_counter()
+        refresh_snapshot()
+        print(f"Snapshot refreshed in {time.perf_counter() - start:.2f} s")
+    taken_at = snapshot_time()
+    if taken_at is None:
+        print("No report snapshot yet")
+    else:
+        print(f"{SNAPSHOT_PATH}: taken {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))}, "
+              f"{os.path.getsize(SNAPSHOT_PATH) / (1024 * 1024):,.1f} MB, "
+              f"staleness limit {report_staleness()} s")
+
+
+if __name__ == "__main__":
+    main()
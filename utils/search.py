@@ -0,0 +1,240 @@
+"""Full-text search over invoices, vendors and users
+
+Migration 10 gives each searchable table an FTS5 index (<table>_fts, see
+SEARCH_INDEXES in utils.migrations) that triggers keep in step with the
+table. search() turns what was typed into an FTS5 query and returns the
+matching row ids best first (bm25 rank), so a search box reads a few index
+pages instead of every row:
+
+- the last word is a prefix, so "acme ind" finds "Acme Industries";
+- a word of FUZZY_MIN_LENGTH or more letters that is not the start of any
+  indexed term is replaced by the indexed terms within a small edit
+  distance of it, so "acne" still finds "Acme".
+
+search() ranks and caps its result, for lists shown in match order. A
+query that bounds its own work, like the keyset-paged invoice list, filters
+with match_ids_sql() instead, which selects every match unranked, through
+id_filter(). Migration 12 adds trigram indexes (<table>_substr, see
+SUBSTRING_INDEXES) for columns like invoice numbers, where what is typed is
+often a fragment from the middle of a word; substring_ids_sql() selects the
+rows containing it.
+
+    python -m utils.search vendors "acme ind"
+"""
+import argparse
+import re
+import time
+
+from utils.migrations import SEARCH_INDEXES, SUBSTRING_INDEXES
+
+SEARCH_LIMIT = 500
+RANK_CANDIDATES = 5000  # matches ranked per search; the rest are not considered
+COMMON_TERM_DOCS = 20000  # earlier words in more rows than this are not searched for
+FUZZY_MIN_LENGTH = 4  # shorter words only match as prefixes
+FUZZY_CANDIDATES = 2000  # vocabulary terms compared with each misspelt word
+FUZZY_TERMS = 8  # closest terms a misspelt word is expanded to
+SUBSTRING_MIN_LENGTH = 3  # trigram indexes cannot look up shorter text
+
+WORD_RE = re.compile(r"\w+")
+TERM_END = "\uffff"  # sorts after any term, for prefix ranges over the vocabulary
+
+
+def _words(text):
+    return WORD_RE.findall((text or "").lower())
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _has_prefix(conn, table, word):
+    return conn.execute(
+        f"SELECT 1 FROM {table}_fts_vocab WHERE term >= ? AND term < ? LIMIT 1", (word, word + TERM_END)
+    ).fetchone() is not None
+
+
+def _term_docs(conn, table, word):
+    """Number of rows containing the word as a whole term, counted up to COMMON_TERM_DOCS + 1"""
+    return conn.execute(f"""
+        SELECT COUNT(*) FROM (SELECT 1 FROM {table}_fts WHERE {table}_fts MATCH ? LIMIT ?)
+    """, (_quote(word), COMMON_TERM_DOCS + 1)).fetchone()[0]
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance with adjacent transpositions, or limit + 1 once it is exceeded"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if previous2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def similar_terms(conn, table, word):
+    """Indexed terms within one edit (two for long words) of a word or of their first letters.
+
+    Comparing with the start of longer terms too means a misspelt word
+    that is still being typed ("acount") finds "accountant". Only terms
+    sharing the word's first letter (first two for long words) are read,
+    which keeps the vocabulary range small; typos there are rare. Closest
+    and most common terms come first.
+    """
+    limit = 1 if len(word) < 8 else 2
+    start = word[:2] if len(word) >= 6 else word[:1]
+    rows = conn.execute(f"""
+        SELECT term, doc FROM {table}_fts_vocab
+        WHERE term >= ? AND term < ? AND length(term) >= ?
+        LIMIT ?
+    """, (start, start + TERM_END, len(word) - limit, FUZZY_CANDIDATES)).fetchall()
+    scored = []
+    for term, docs in rows:
+        distance = min(
+            edit_distance(word, term[:length], limit)
+            for length in range(len(word) - limit, len(word) + limit + 1)
+        )
+        distance = min(distance, edit_distance(word, term, limit))
+        if distance <= limit:
+            scored.append((distance, -docs, term))
+    return [term for _, _, term in sorted(scored)[:FUZZY_TERMS]]
+
+
+def match_query(conn, table, text, fuzzy=True):
+    """FTS5 MATCH expression for search text, or None if there is nothing to search for.
+
+    The last word is a prefix since it may still be being typed; earlier
+    words match whole terms when the index has them. A word found in more
+    than COMMON_TERM_DOCS rows (e.g. the "inv" of every invoice number) is
+    left out unless it is all there is to search for: it hardly narrows the
+    result but would cost a pass over its whole posting list.
+    """
+    words = _words(text)
+    clauses = []
+    for i, word in enumerate(words):
+        last = i == len(words) - 1
+        docs = _term_docs(conn, table, word)
+        if docs > COMMON_TERM_DOCS and not (last and not clauses):
+            continue
+        if docs and (not last or docs > COMMON_TERM_DOCS):
+            # A prefix query over a very common term would first merge its whole posting list
+            clauses.append(_quote(word))
+        elif not fuzzy or len(word) < FUZZY_MIN_LENGTH or _has_prefix(conn, table, word):
+            clauses.append(_quote(word) + "*")
+        else:
+            terms = similar_terms(conn, table, word)
+            clauses.append("(" + " OR ".join(_quote(term) for term in terms or [word]) + ")")
+    return " AND ".join(clauses) or None
+
+
+def search(conn, table, text, limit=SEARCH_LIMIT, fuzzy=True):
+    """Ids (the table's integer key) of rows matching search text, best match first.
+
+    Only the first RANK_CANDIDATES matches are ranked, so a word found in
+    nearly every row costs no more than a specific one.
+    """
+    query = match_query(conn, table, text, fuzzy)
+    if query is None:
+        return []
+    rows = conn.execute(f"""
+        SELECT rowid FROM (
+            SELECT rowid, rank FROM {table}_fts
+            WHERE {table}_fts MATCH ?
+            LIMIT ?
+        )
+        ORDER BY rank
+        LIMIT ?
+    """, (query, RANK_CANDIDATES, limit)).fetchall()
+    return [row[0] for row in rows]
+
+
+def match_ids_sql(conn, table, text, fuzzy=True):
+    """(SELECT of the ids of every row matching search text, params) for an IN (...) filter.
+
+    Unlike search() the matches are neither ranked nor capped, so the
+    query using it must bound its own work, e.g. with a LIMIT. None if
+    there is nothing to search for.
+    """
+    query = match_query(conn, table, text, fuzzy)
+    if query is None:
+        return None
+    return f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?", (query,)
+
+
+def substring_ids_sql(table, text):
+    """(SELECT of the ids of rows whose substring-indexed columns contain the text, params).
+
+    None if the table has no trigram index or the text is shorter than
+    SUBSTRING_MIN_LENGTH.
+    """
+    text = (text or "").strip()
+    if table not in SUBSTRING_INDEXES or len(text) < SUBSTRING_MIN_LENGTH:
+        return None
+    return f"SELECT rowid FROM {table}_substr WHERE {table}_substr MATCH ?", (_quote(text),)
+
+
+def dense_match(conn, ids_sql):
+    """Whether an ids_sql selects more than COMMON_TERM_DOCS rows"""
+    sql, params = ids_sql
+    docs = conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT ?)", params + (COMMON_TERM_DOCS + 1,)).fetchone()[0]
+    return docs > COMMON_TERM_DOCS
+
+
+def id_filter(conn, column, ids_sql, dense=None):
+    """(SQL condition, params) keeping the rows whose column is among the ids an ids_sql selects.
+
+    A match of a few rows is read once into an IN list. A match of more
+    than COMMON_TERM_DOCS rows is looked up per row instead (EXISTS with
+    rowid =), so a LIMIT query walking its own index stops after its first
+    rows rather than first reading every match. dense=True or False picks
+    the form without counting the matches.
+    """
+    sql, params = ids_sql
+    if dense is None:
+        dense = dense_match(conn, ids_sql)
+    if dense:
+        return f"EXISTS ({sql} AND rowid = {column})", params
+    return f"{column} IN ({sql})", params
+
+
+def rebuild(conn, table=None):
+    """Re-index one table (or all of them) from its rows; the caller commits"""
+    for name in [table] if table else SEARCH_INDEXES:
+        conn.execute(f"INSERT INTO {name}_fts ({name}_fts) VALUES ('rebuild')")
+        if name in SUBSTRING_INDEXES:
+            conn.execute(f"INSERT INTO {name}_substr ({name}_substr) VALUES ('rebuild')")
+
+
+def main():
+    from utils.db import get_db_connection
+
+    parser = argparse.ArgumentParser(description="Query or rebuild the full-text search indexes")
+    parser.add_argument("table", choices=sorted(SEARCH_INDEXES))
+    parser.add_argument("text", nargs="?", help="search text; omit with --rebuild")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--rebuild", action="store_true", help="re-index the table from its rows")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.rebuild:
+            rebuild(conn, args.table)
+            conn.commit()
+        if args.text:
+            start = time.perf_counter()
+            ids = search(conn, args.table, args.text, limit=args.limit)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"query: {match_query(conn, args.table, args.text)}")
+            print(f"{len(ids)} matches in {elapsed:.1f} ms: {ids}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
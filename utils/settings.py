@@ -0,0 +1,29 @@
+"""Application settings saved as JSON, shared by the app and background jobs"""
+import json
+import os
+import tempfile
+
+SETTINGS_PATH = "settings.json"
+
+
+def load_settings():
+    """Load saved settings, or an empty dict if none have been saved yet"""
+    if os.path.exists(SETTINGS_PATH):
+        with open(SETTINGS_PATH, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_settings(updates):
+    """Merge the given values into the saved settings"""
+    settings = load_settings()
+    settings.update(updates)
+    # Write to a temporary file and swap it in, so a background job never reads a half-written file
+    fd, path = tempfile.mkstemp(prefix=".settings_", suffix=".json", dir=os.path.dirname(os.path.abspath(SETTINGS_PATH)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(settings, f)
+        os.replace(path, SETTINGS_PATH)
+    except Exception:
+        os.remove(path)
+        raise
@@ -0,0 +1,169 @@
+"""On-demand table export for the Data Manager
+
+Rows are pulled from a cursor in fixed-size batches and written straight
+to a temporary file, so memory use depends on the batch size rather than
+the table size. CSV is produced by a generator, Excel with openpyxl's
+write-only workbook and Parquet (when pyarrow is installed) one row group
+per batch. Parquet columns are typed from the declared column types; a
+column holding a value SQLite accepted but that type cannot (e.g. '' in
+a DECIMAL column) is written as strings instead.
+"""
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+
+EXPORT_BATCH_SIZE = 5000
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), "ap_exports")
+
+# format -> (file extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats():
+    """Export formats usable in this environment"""
+    formats = ["CSV", "Excel"]
+    if importlib.util.find_spec("pyarrow") is not None:
+        formats.append("Parquet")
+    return formats
+
+
+def _column_names(conn, table):
+    return [d[0] for d in conn.execute(f"SELECT * FROM {table} LIMIT 0").description]
+
+
+def iter_batches(conn, table, batch_size=EXPORT_BATCH_SIZE):
+    """Yield lists of at most batch_size plain row tuples"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    try:
+        cursor.execute(f"SELECT * FROM {table}")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def iter_csv(conn, table, batch_size=EXPORT_BATCH_SIZE):
+    """Yield the table as CSV text: the header, then one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(_column_names(conn, table))
+    yield buffer.getvalue()
+
+    for rows in iter_batches(conn, table, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+def write_csv(conn, table, path, batch_size=EXPORT_BATCH_SIZE):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for text in iter_csv(conn, table, batch_size):
+            f.write(text)
+
+
+def write_xlsx(conn, table, path, batch_size=EXPORT_BATCH_SIZE):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=table[:31])
+    sheet.append(_column_names(conn, table))
+
+    for rows in iter_batches(conn, table, batch_size):
+        for row in rows:
+            sheet.append(row)
+
+    workbook.save(path)
+
+
+def _arrow_schema(conn, table, text_columns=()):
+    """Arrow schema for SELECT * from the declared SQLite column types; text_columns are exported as strings"""
+    import pyarrow as pa
+
+    # table_xinfo also lists generated columns, which SELECT * returns and table_info omits
+    declared_types = {col[1]: (col[2] or "").upper() for col in conn.execute(f"PRAGMA table_xinfo({table})")}
+    fields = []
+    for name in _column_names(conn, table):
+        declared = declared_types.get(name, "")
+        if name in text_columns:
+            arrow_type = pa.string()
+        elif "INT" in declared:
+            arrow_type = pa.int64()
+        elif any(t in declared for t in ("DECIMAL", "REAL", "FLOAT", "DOUBLE", "NUMERIC")):
+            arrow_type = pa.float64()
+        elif "BOOL" in declared:
+            arrow_type = pa.bool_()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+class _MixedColumn(Exception):
+    """A value that does not fit its column's declared type, which SQLite allows"""
+
+    def __init__(self, column):
+        super().__init__(column)
+        self.column = column
+
+
+def _write_parquet(conn, table, path, batch_size, text_columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(conn, table, text_columns)
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in iter_batches(conn, table, batch_size):
+            arrays = []
+            for field, values in zip(schema, zip(*rows)):
+                if field.type == pa.string():
+                    arrays.append(pa.array([None if v is None else str(v) for v in values], type=field.type))
+                    continue
+                try:
+                    arrays.append(pa.array(values, type=field.type))
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    raise _MixedColumn(field.name)
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+
+def write_parquet(conn, table, path, batch_size=EXPORT_BATCH_SIZE):
+    """Parquet with typed columns; a column holding a value of another type is written as strings"""
+    text_columns = set()
+    while True:
+        try:
+            return _write_parquet(conn, table, path, batch_size, text_columns)
+        except _MixedColumn as e:
+            # Earlier row groups are already typed, so start over with the column as text
+            text_columns.add(e.column)
+
+
+WRITERS = {
+    "CSV": write_csv,
+    "Excel": write_xlsx,
+    "Parquet": write_parquet,
+}
+
+
+def export_table(conn, table, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Export a table to a new temporary file and return its path"""
+    extension, _ = EXPORT_FORMATS[fmt]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=extension, dir=EXPORT_DIR)
+    os.close(fd)
+    try:
+        WRITERS[fmt](conn, table, path, batch_size)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
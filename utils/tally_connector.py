@@ -0,0 +1,104 @@
+"""Tally connector used by the Invoices page and Tally settings
+
+Wraps utils.tally_sync: picks the configured source and runs incremental
+syncs of vendors and pending bills against the application database.
+Syncs run as "tally_sync" jobs on the background worker (utils.jobs), either
+enqueued from the Invoices page or by the schedule saved with the Tally
+settings.
+"""
+from utils.db import get_db_connection
+from utils.jobs import job_handler
+from utils.settings import load_settings
+from utils.tally_sync import ENTITIES, FileTallySource, TallySyncError, sync_all
+from utils.tally_xml import XmlHttpTallySource
+
+DEFAULT_REPLAY_DIR = "tally_replay"
+
+# Source names offered in the Tally settings form; the first is the default
+SOURCES = ("XML over HTTP", "File replay")
+
+SYNC_JOB = "tally_sync"
+SYNC_SCHEDULE = "tally_sync"
+
+# Sync Frequency setting -> schedule interval in seconds; Manual has no schedule
+SYNC_INTERVALS = {
+    "Hourly": 3600,
+    "Daily": 86400,
+    "Weekly": 7 * 86400,
+}
+
+
+def source_from_settings(settings):
+    """Build the Tally source selected in the saved settings"""
+    source = settings.get("tally_source", SOURCES[0])
+    if source == "XML over HTTP":
+        try:
+            port = int(settings.get("tally_port") or 9000)
+        except ValueError:
+            raise TallySyncError(f"Invalid Tally port: {settings.get('tally_port')}")
+        return XmlHttpTallySource(
+            settings.get("tally_server") or "localhost",
+            port,
+            settings.get("tally_company", ""),
+            settings.get("vendor_ledger") or "Sundry Creditors",
+            settings.get("bill_type") or "Purchase",
+        )
+    if source == "File replay":
+        return FileTallySource(settings.get("tally_replay_dir") or DEFAULT_REPLAY_DIR)
+    raise TallySyncError(f"Unknown Tally source: {source}")
+
+
+class TallyConnector:
+    def __init__(self, settings=None, source=None):
+        self.source = source or source_from_settings(settings or {})
+
+    def _sync(self, entities):
+        conn = get_db_connection()
+        try:
+            return sync_all(conn, self.source, entities)
+        finally:
+            conn.close()
+
+    def sync_vendors(self):
+        """Sync vendor ledgers; returns the number of vendors inserted or updated"""
+        run = self._sync(("vendors",))[0]
+        if run["status"] == "failed":
+            raise TallySyncError(run["error"])
+        return run["rows_inserted"] + run["rows_updated"]
+
+    def sync_invoices(self):
+        """Sync bills (vendors first, so new parties resolve); returns the number of invoices inserted or updated"""
+        runs = self._sync(("vendors", "invoices"))
+        for run in runs:
+            if run["status"] == "failed":
+                raise TallySyncError(run["error"])
+        return runs[-1]["rows_inserted"] + runs[-1]["rows_updated"]
+
+
+def sync_entities(settings):
+    """Entities ticked under Items to Sync, in sync order"""
+    options = [option.lower() for option in settings.get("sync_options", ["Vendors", "Invoices"])]
+    return [entity for entity in ENTITIES if entity in options]
+
+
+@job_handler(SYNC_JOB)
+def run_sync_job(payload):
+    """Background sync; payload["entities"] overrides the saved Items to Sync"""
+    settings = load_settings()
+    if not settings.get("enable_tally", True):
+        return {"skipped": "Tally integration is disabled"}
+
+    entities = payload.get("entities") or sync_entities(settings)
+    runs = TallyConnector(settings)._sync(tuple(entities))
+    for run in runs:
+        # Raising lets the worker retry the job with backoff
+        if run["status"] == "failed":
+            raise TallySyncError(f"{run['entity']}: {run['error']}")
+    return {
+        run["entity"]: {
+            "inserted": run["rows_inserted"],
+            "updated": run["rows_updated"],
+            "skipped": run["rows_skipped"],
+        }
+        for run in runs
+    }
@@ -0,0 +1,106 @@
+"""Stand-in for Tally's XML HTTP interface that replays recorded responses
+
+Answers GET with Tally's status line and a POSTed export request with the
+recorded response for the requested collection, read from
+<directory>/<collection>.xml (APVendors.xml, APBills.xml), streamed in
+chunks like a real Tally. Used to test utils.tally_xml without Tally:
+
+    python -m utils.tally_replay [--dir tally_replay] [--port 9000]
+
+or in-process with ReplayServer(directory).start().
+"""
+import argparse
+import os
+import re
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATUS_LINE = b"<RESPONSE>TallyPrime Server is Running</RESPONSE>"
+CHUNK_SIZE = 64 * 1024
+
+_REQUEST_ID_RE = re.compile(rb"<ID>\s*([^<]+?)\s*</ID>")
+_EMPTY_RESPONSE = b"<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER><BODY><DATA><COLLECTION/></DATA></BODY></ENVELOPE>"
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._send(STATUS_LINE)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(body)
+
+        match = _REQUEST_ID_RE.search(body)
+        path = os.path.join(self.server.directory, f"{match.group(1).decode()}.xml") if match else None
+        if path is None or not os.path.exists(path):
+            self._send(_EMPTY_RESPONSE)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def _send(self, payload):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory, host="127.0.0.1", port=0):
+        super().__init__((host, port), _ReplayHandler)
+        self.directory = directory
+        self.requests = []  # raw request bodies, newest last
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve from a background thread; returns self"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Tally XML responses over HTTP")
+    parser.add_argument("--dir", default="tally_replay", help="folder with APVendors.xml / APBills.xml")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    server = ReplayServer(args.dir, args.host, args.port)
+    print(f"Replaying {os.path.abspath(args.dir)} on http://{args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
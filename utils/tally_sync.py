@@ -0,0 +1,298 @@
+"""Incremental Tally sync
+
+Tally bumps a master's or voucher's ALTERID every time it is created or
+altered, so each synced entity keeps a high-water mark: the largest
+ALTERID already applied. A sync run asks the source only for records
+above the mark, in ALTERID order, and applies them in batches with
+INSERT ... ON CONFLICT (tally_guid) DO UPDATE. Each batch is its own
+transaction that also moves the mark, so an interrupted run resumes where
+it stopped. Every run is recorded in tally_sync_runs with its row counts
+and duration.
+
+A source is any object with a name and
+fetch_changes(entity, since, batch_size) yielding lists of records (dicts
+with the keys in ENTITY_FIELDS plus guid and alter_id) in ALTERID order.
+A source that cannot sort sets ordered = False; the mark then moves only
+once the whole run has been applied. FileTallySource is a file-backed
+stand-in used to test syncs offline; utils.tally_xml reads Tally itself.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+SYNC_BATCH_SIZE = 1000
+ENTITIES = ("vendors", "invoices")
+
+# Fields a source supplies for each entity, besides guid and alter_id
+ENTITY_FIELDS = {
+    "vendors": ("vendor_name", "contact_person", "email", "phone", "address", "tax_id"),
+    "invoices": ("vendor_guid", "invoice_number", "invoice_date", "due_date",
+                 "amount", "tax_amount", "total_amount", "description"),
+}
+
+# Invoices past these statuses keep their local values when Tally alters them
+UPDATABLE_INVOICE_STATUSES = ("pending", "rejected")
+
+
+class TallySyncError(Exception):
+    """Raised when a source cannot be read"""
+
+
+class FileTallySource:
+    """Fake Tally backed by one JSON Lines file per entity, for offline testing.
+
+    record() appends rows the way Tally would alter them: each one gets the
+    next ALTERID, and a row with an existing guid is a new version of it.
+    """
+
+    name = "file"
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, entity):
+        return os.path.join(self.directory, f"{entity}.jsonl")
+
+    def _read(self, entity):
+        path = self._path(entity)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def max_alter_id(self):
+        return max((row["alter_id"] for entity in ENTITIES for row in self._read(entity)), default=0)
+
+    def record(self, entity, rows):
+        """Append rows (dicts with guid and the entity's fields) with increasing ALTERIDs"""
+        os.makedirs(self.directory, exist_ok=True)
+        alter_id = self.max_alter_id()
+        with open(self._path(entity), "a", encoding="utf-8") as f:
+            for row in rows:
+                alter_id += 1
+                f.write(json.dumps({**row, "alter_id": alter_id}) + "\n")
+        return alter_id
+
+    def fetch_changes(self, entity, since, batch_size=SYNC_BATCH_SIZE):
+        if not os.path.isdir(self.directory):
+            raise TallySyncError(f"Tally replay directory not found: {self.directory}")
+        changes = sorted((row for row in self._read(entity) if row["alter_id"] > since),
+                         key=lambda row: row["alter_id"])
+        for i in range(0, len(changes), batch_size):
+            yield changes[i:i + batch_size]
+
+
+# State
+
+def get_watermark(conn, entity):
+    row = conn.execute("SELECT high_water_mark FROM tally_sync_state WHERE entity = ?", (entity,)).fetchone()
+    return row[0] if row else 0
+
+
+def reset_watermark(conn, entity):
+    """Forget the mark so the next run re-reads everything (upserts make this safe)"""
+    conn.execute("DELETE FROM tally_sync_state WHERE entity = ?", (entity,))
+    conn.commit()
+
+
+def _set_watermark(conn, entity, mark):
+    conn.execute("""
+        INSERT INTO tally_sync_state (entity, high_water_mark, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (entity) DO UPDATE
+        SET high_water_mark = excluded.high_water_mark,
+            updated_at = excluded.updated_at
+    """, (entity, mark))
+
+
+def _guids(conn, table, guids):
+    """Subset of guids already present in table"""
+    return {row[0] for row in conn.execute(
+        f"SELECT tally_guid FROM {table} WHERE tally_guid IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(guids)),)
+    ).fetchall()}
+
+
+# Batch upserts: each returns (inserted, updated, skipped, watermark candidate)
+
+def _apply_vendors(conn, batch):
+    existing = _guids(conn, "vendors", {r["guid"] for r in batch})
+    cursor = conn.executemany("""
+        INSERT INTO vendors
+        (tally_guid, tally_alter_id, vendor_name, contact_person, email, phone, address, tax_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (tally_guid) DO UPDATE
+        SET tally_alter_id = excluded.tally_alter_id,
+            vendor_name = excluded.vendor_name,
+            contact_person = excluded.contact_person,
+            email = excluded.email,
+            phone = excluded.phone,
+            address = excluded.address,
+            tax_id = excluded.tax_id
+        WHERE excluded.tally_alter_id > vendors.tally_alter_id
+    """, [
+        (r["guid"], r["alter_id"], r["vendor_name"], r.get("contact_person"), r.get("email"),
+         r.get("phone"), r.get("address"), r.get("tax_id"))
+        for r in batch
+    ])
+    return _counts(batch, existing, cursor.rowcount) + (max(r["alter_id"] for r in batch),)
+
+
+def _apply_invoices(conn, batch):
+    known_vendors = _guids(conn, "vendors", {r["vendor_guid"] for r in batch})
+    orphans = [r for r in batch if r["vendor_guid"] not in known_vendors]
+    rows = [r for r in batch if r["vendor_guid"] in known_vendors]
+
+    existing = _guids(conn, "invoices", {r["guid"] for r in rows})
+    cursor = conn.executemany(f"""
+        INSERT INTO invoices
+        (vendor_id, invoice_number, invoice_date, due_date, amount, tax_amount, total_amount,
+         description, status, tally_guid, tally_alter_id)
+        SELECT v.vendor_id, ?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?
+        FROM vendors v
+        WHERE v.tally_guid = ?
+        ON CONFLICT (tally_guid) DO UPDATE
+        SET tally_alter_id = excluded.tally_alter_id,
+            vendor_id = excluded.vendor_id,
+            invoice_number = excluded.invoice_number,
+            invoice_date = excluded.invoice_date,
+            due_date = excluded.due_date,
+            amount = excluded.amount,
+            tax_amount = excluded.tax_amount,
+            total_amount = excluded.total_amount,
+            description = excluded.description
+        WHERE excluded.tally_alter_id > invoices.tally_alter_id
+          AND invoices.status IN {UPDATABLE_INVOICE_STATUSES}
+    """, [
+        (r["invoice_number"], r["invoice_date"], r["due_date"], r["amount"], r.get("tax_amount") or 0,
+         r["total_amount"], r.get("description"), r["guid"], r["alter_id"], r["vendor_guid"])
+        for r in rows
+    ]) if rows else None
+
+    inserted, updated, skipped = _counts(rows, existing, cursor.rowcount if cursor else 0)
+    # Invoices whose vendor has not been synced yet hold the mark back so
+    # they are fetched again on the next run
+    mark = min(r["alter_id"] for r in orphans) - 1 if orphans else max(r["alter_id"] for r in batch)
+    return inserted, updated, skipped + len(orphans), mark
+
+
+def _counts(batch, existing, changed):
+    """(inserted, updated, skipped) from the rows changed by an upsert batch"""
+    inserted = sum(1 for r in batch if r["guid"] not in existing)
+    updated = max(changed - inserted, 0)
+    return inserted, updated, len(batch) - inserted - updated
+
+
+APPLY = {
+    "vendors": _apply_vendors,
+    "invoices": _apply_invoices,
+}
+
+
+# Runs
+
+def _start_run(conn, entity, source, mark):
+    cursor = conn.execute("""
+        INSERT INTO tally_sync_runs (entity, source, started_at, watermark_from, watermark_to)
+        VALUES (?, ?, ?, ?, ?)
+    """, (entity, source.name, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), mark, mark))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def _finish_run(conn, run):
+    conn.execute("""
+        UPDATE tally_sync_runs
+        SET finished_at = ?, status = ?, watermark_to = ?, batches = ?, rows_fetched = ?,
+            rows_inserted = ?, rows_updated = ?, rows_skipped = ?, duration_ms = ?, error = ?
+        WHERE run_id = ?
+    """, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), run["status"], run["watermark_to"], run["batches"],
+          run["rows_fetched"], run["rows_inserted"], run["rows_updated"], run["rows_skipped"],
+          run["duration_ms"], run["error"], run["run_id"]))
+    conn.commit()
+
+
+def sync_entity(conn, source, entity, batch_size=SYNC_BATCH_SIZE):
+    """Fetch and apply the changes to one entity since its high-water mark; returns the run record.
+
+    Source errors end the run as failed (batches already applied stay
+    applied); database errors are re-raised after the run is recorded.
+    """
+    mark = get_watermark(conn, entity)
+    run = {
+        "run_id": _start_run(conn, entity, source, mark),
+        "entity": entity,
+        "source": source.name,
+        "status": "success",
+        "watermark_from": mark,
+        "watermark_to": mark,
+        "batches": 0,
+        "rows_fetched": 0,
+        "rows_inserted": 0,
+        "rows_updated": 0,
+        "rows_skipped": 0,
+        "duration_ms": 0.0,
+        "error": None,
+    }
+    start = time.perf_counter()
+    ordered = getattr(source, "ordered", True)
+    held = False  # once an invoice is held back the mark stays put for the rest of the run
+    highest, hold_at = mark, None  # for unordered sources, applied once the run completes
+
+    try:
+        for batch in source.fetch_changes(entity, mark, batch_size):
+            if not batch:
+                continue
+            if not ordered:
+                batch = sorted(batch, key=lambda r: r["alter_id"])
+            # Only the latest version of a record altered more than once counts
+            latest = list({r["guid"]: r for r in batch}.values())
+            top = batch[-1]["alter_id"]
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted, updated, skipped, candidate = APPLY[entity](conn, latest)
+                if ordered and not held and candidate > run["watermark_to"]:
+                    run["watermark_to"] = candidate
+                    _set_watermark(conn, entity, candidate)
+                held = held or candidate < top
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            highest = max(highest, top)
+            if candidate < top:
+                hold_at = candidate if hold_at is None else min(hold_at, candidate)
+
+            run["batches"] += 1
+            run["rows_fetched"] += len(batch)
+            run["rows_inserted"] += inserted
+            run["rows_updated"] += updated
+            run["rows_skipped"] += skipped + len(batch) - len(latest)
+        if not ordered:
+            final = highest if hold_at is None else min(highest, hold_at)
+            if final > run["watermark_to"]:
+                run["watermark_to"] = final
+                _set_watermark(conn, entity, final)
+                conn.commit()
+    except TallySyncError as e:
+        run["status"], run["error"] = "failed", str(e)
+    except Exception as e:
+        run["status"], run["error"] = "failed", str(e)
+        run["duration_ms"] = (time.perf_counter() - start) * 1000
+        _finish_run(conn, run)
+        raise
+
+    run["duration_ms"] = (time.perf_counter() - start) * 1000
+    _finish_run(conn, run)
+    return run
+
+
+def sync_all(conn, source, entities=ENTITIES, batch_size=SYNC_BATCH_SIZE):
+    """Sync entities in dependency order (vendors before the invoices that reference them)"""
+    return [sync_entity(conn, source, entity, batch_size) for entity in ENTITIES if entity in entities]
+
@@ -0,0 +1,265 @@
+"""Tally XML-over-HTTP source
+
+Tally answers XML "Export Data" requests on its HTTP port (9000 by
+default). The request carries a small inline TDL collection so Tally only
+returns records whose ALTERID is above the sync's high-water mark.
+
+The response is parsed with iterparse while it downloads. Each LEDGER or
+VOUCHER element is turned into a record and then removed from the tree,
+so memory use stays flat however large the day book is. Records are
+yielded in batches to utils.tally_sync, which applies them.
+
+Tally does not return the collection in ALTERID order, so the source sets
+ordered = False and the sync engine only moves the mark once a run has
+completed.
+"""
+import re
+import urllib.error
+import urllib.request
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timedelta
+from xml.sax.saxutils import escape
+
+from utils.tally_sync import SYNC_BATCH_SIZE, TallySyncError
+
+REQUEST_TIMEOUT = 60  # seconds without data before a request is abandoned
+READ_SIZE = 64 * 1024
+DEFAULT_CREDIT_DAYS = 30
+TAX_LEDGER_WORDS = ("GST", "TAX", "VAT", "CESS", "TDS")
+LEDGER_ENTRY_TAGS = ("ALLLEDGERENTRIES.LIST", "LEDGERENTRIES.LIST")
+
+# entity -> (collection requested, element that holds one record)
+COLLECTIONS = {
+    "vendors": ("APVendors", "LEDGER"),
+    "invoices": ("APBills", "VOUCHER"),
+}
+
+# Character references Tally emits that are not allowed in XML 1.0
+_INVALID_CHAR_REF_RE = re.compile(rb"&#(?:x0*[0-8bBcCeEfF]|x0*1[0-9a-fA-F]|0*(?:[0-8]|1[124-9]|2[0-9]|3[01]));")
+_CREDIT_DAYS_RE = re.compile(r"^\s*(\d+)\s*days?\s*$", re.IGNORECASE)
+
+VENDORS_REQUEST = """<ENVELOPE>
+<HEADER><VERSION>1</VERSION><TALLYREQUEST>Export</TALLYREQUEST><TYPE>Collection</TYPE><ID>APVendors</ID></HEADER>
+<BODY><DESC>
+<STATICVARIABLES><SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT><SVCURRENTCOMPANY>{company}</SVCURRENTCOMPANY></STATICVARIABLES>
+<TDL><TDLMESSAGE>
+<COLLECTION NAME="APVendors" ISMODIFY="No">
+<TYPE>Ledger</TYPE>
+<CHILDOF>{vendor_group}</CHILDOF>
+<BELONGSTO>Yes</BELONGSTO>
+<FETCH>GUID, ALTERID, NAME, LEDGERCONTACT, EMAIL, LEDGERPHONE, LEDGERMOBILE, ADDRESS, PARTYGSTIN, INCOMETAXNUMBER</FETCH>
+<FILTER>APChangedSince</FILTER>
+</COLLECTION>
+<SYSTEM TYPE="Formulae" NAME="APChangedSince">$ALTERID &gt; {since}</SYSTEM>
+</TDLMESSAGE></TDL>
+</DESC></BODY>
+</ENVELOPE>"""
+
+INVOICES_REQUEST = """<ENVELOPE>
+<HEADER><VERSION>1</VERSION><TALLYREQUEST>Export</TALLYREQUEST><TYPE>Collection</TYPE><ID>APBills</ID></HEADER>
+<BODY><DESC>
+<STATICVARIABLES><SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT><SVCURRENTCOMPANY>{company}</SVCURRENTCOMPANY></STATICVARIABLES>
+<TDL><TDLMESSAGE>
+<COLLECTION NAME="APBills" ISMODIFY="No">
+<TYPE>Voucher</TYPE>
+<FETCH>GUID, ALTERID, DATE, VOUCHERNUMBER, REFERENCE, PARTYLEDGERNAME, NARRATION, ISCANCELLED, ALLLEDGERENTRIES.LIST, LEDGERENTRIES.LIST</FETCH>
+<COMPUTE>PARTYGUID : $GUID:Ledger:$PartyLedgerName</COMPUTE>
+<FILTER>APBillType, APFromVendor, APChangedSince</FILTER>
+</COLLECTION>
+<SYSTEM TYPE="Formulae" NAME="APBillType">$VoucherTypeName = "{voucher_type}"</SYSTEM>
+<SYSTEM TYPE="Formulae" NAME="APFromVendor">$$IsLedOfGrp:$PartyLedgerName:"{vendor_group}"</SYSTEM>
+<SYSTEM TYPE="Formulae" NAME="APChangedSince">$ALTERID &gt; {since}</SYSTEM>
+</TDLMESSAGE></TDL>
+</DESC></BODY>
+</ENVELOPE>"""
+
+
+class _SanitizedStream:
+    """File-like wrapper that drops character references Tally emits but XML forbids"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._pending = b""
+
+    def read(self, size=READ_SIZE):
+        while True:
+            chunk = self.raw.read(size)
+            data = self._pending + chunk
+            self._pending = b""
+            if not chunk:
+                return _INVALID_CHAR_REF_RE.sub(b"", data)
+            # Hold back a possibly incomplete reference at the end of the chunk
+            cut = data.rfind(b"&", max(len(data) - 10, 0))
+            if cut != -1 and b";" not in data[cut:]:
+                data, self._pending = data[:cut], data[cut:]
+            # An empty read means end of input to the parser, so keep reading
+            if data:
+                return _INVALID_CHAR_REF_RE.sub(b"", data)
+
+
+def _text(elem, path, default=None):
+    value = elem.findtext(path)
+    return value.strip() if value and value.strip() else default
+
+
+def _amount(value):
+    """Tally amounts may carry a currency prefix or an exchange rate suffix"""
+    if not value:
+        return 0.0
+    match = re.search(r"-?\d[\d,]*(?:\.\d+)?", value)
+    return float(match.group().replace(",", "")) if match else 0.0
+
+
+def _date(value):
+    """Tally dates are YYYYMMDD"""
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+def _due_date(invoice_date, credit_period):
+    """Bill due date from a BILLCREDITPERIOD such as '30 Days' or '15-Feb-2024'"""
+    if credit_period:
+        days = _CREDIT_DAYS_RE.match(credit_period)
+        if days:
+            return invoice_date + timedelta(days=int(days.group(1)))
+        for fmt in ("%d-%b-%Y", "%d-%b-%y", "%Y%m%d"):
+            try:
+                return datetime.strptime(credit_period.strip(), fmt).date()
+            except ValueError:
+                pass
+    return invoice_date + timedelta(days=DEFAULT_CREDIT_DAYS)
+
+
+def parse_ledger(elem):
+    """Vendor record from a LEDGER element"""
+    address = [line.text.strip() for line in elem.iter("ADDRESS") if line.text and line.text.strip()]
+    return {
+        "guid": _text(elem, "GUID"),
+        "alter_id": int(_text(elem, "ALTERID", "0")),
+        "vendor_name": elem.get("NAME") or _text(elem, "NAME"),
+        "contact_person": _text(elem, "LEDGERCONTACT"),
+        "email": _text(elem, "EMAIL"),
+        "phone": _text(elem, "LEDGERPHONE") or _text(elem, "LEDGERMOBILE"),
+        "address": ", ".join(address) or None,
+        "tax_id": _text(elem, "PARTYGSTIN") or _text(elem, "INCOMETAXNUMBER"),
+    }
+
+
+def parse_voucher(elem):
+    """Invoice record from a purchase VOUCHER element, or None for cancelled vouchers"""
+    if _text(elem, "ISCANCELLED", "No").lower() == "yes":
+        return None
+
+    party = _text(elem, "PARTYLEDGERNAME")
+    invoice_date = _date(_text(elem, "DATE"))
+    total = 0.0
+    tax = 0.0
+    credit_period = None
+
+    for entry in elem:
+        # Accounting vouchers list entries in ALLLEDGERENTRIES, item invoices in LEDGERENTRIES
+        if entry.tag not in LEDGER_ENTRY_TAGS:
+            continue
+        ledger = _text(entry, "LEDGERNAME", "")
+        amount = abs(_amount(_text(entry, "AMOUNT")))
+        if ledger == party:
+            total += amount
+            credit_period = credit_period or _text(entry, "BILLALLOCATIONS.LIST/BILLCREDITPERIOD")
+        elif any(word in ledger.upper() for word in TAX_LEDGER_WORDS):
+            tax += amount
+
+    return {
+        "guid": _text(elem, "GUID"),
+        "alter_id": int(_text(elem, "ALTERID", "0")),
+        "vendor_guid": _text(elem, "PARTYGUID"),
+        "invoice_number": _text(elem, "REFERENCE") or _text(elem, "VOUCHERNUMBER"),
+        "invoice_date": invoice_date.isoformat(),
+        "due_date": _due_date(invoice_date, credit_period).isoformat(),
+        "amount": round(total - tax, 2),
+        "tax_amount": round(tax, 2),
+        "total_amount": round(total, 2),
+        "description": _text(elem, "NARRATION"),
+    }
+
+
+PARSERS = {
+    "vendors": parse_ledger,
+    "invoices": parse_voucher,
+}
+
+
+def iter_records(stream, entity, since=0):
+    """Yield records from a Tally XML response as it is read, releasing each element once parsed"""
+    _, tag = COLLECTIONS[entity]
+    parse = PARSERS[entity]
+    parents = []
+
+    try:
+        for event, elem in ET.iterparse(_SanitizedStream(stream), events=("start", "end")):
+            if event == "start":
+                parents.append(elem)
+                continue
+            parents.pop()
+            # Only top-level records; nested elements of the same name are part of a record
+            if elem.tag != tag or any(parent.tag == tag for parent in parents):
+                continue
+
+            record = parse(elem)
+            if parents:
+                parents[-1].remove(elem)
+            elem.clear()
+
+            # Tally applies the filter already; this guards against replays and older releases
+            if record is not None and record["guid"] and record["alter_id"] > since:
+                yield record
+    except ET.ParseError as e:
+        raise TallySyncError(f"Invalid XML from Tally: {e}") from e
+
+
+class XmlHttpTallySource:
+    """Tally source that streams XML exports over HTTP"""
+
+    name = "xml"
+    ordered = False
+
+    def __init__(self, server="localhost", port=9000, company="", vendor_group="Sundry Creditors",
+                 voucher_type="Purchase", timeout=REQUEST_TIMEOUT):
+        self.url = f"http://{server}:{port}"
+        self.company = company
+        self.vendor_group = vendor_group
+        self.voucher_type = voucher_type
+        self.timeout = timeout
+
+    def request_body(self, entity, since):
+        template = VENDORS_REQUEST if entity == "vendors" else INVOICES_REQUEST
+        return template.format(
+            company=escape(self.company),
+            vendor_group=escape(self.vendor_group),
+            voucher_type=escape(self.voucher_type),
+            since=int(since),
+        ).encode("utf-8")
+
+    def _open(self, body=None):
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "text/xml; charset=utf-8"})
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except (urllib.error.URLError, OSError) as e:
+            raise TallySyncError(f"Cannot reach Tally at {self.url}: {e}") from e
+
+    def ping(self):
+        """Tally's status line, e.g. 'TallyPrime Server is Running'"""
+        with self._open() as response:
+            return response.read(1024).decode("utf-8", "replace").strip()
+
+    def fetch_changes(self, entity, since, batch_size=SYNC_BATCH_SIZE):
+        with self._open(self.request_body(entity, since)) as response:
+            batch = []
+            try:
+                for record in iter_records(response, entity, since):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+            except OSError as e:
+                raise TallySyncError(f"Connection to Tally lost: {e}") from e
+            if batch:
+                yield batch
@@ -0,0 +1,313 @@
+"""Span tracing for page renders
+
+Each Streamlit rerun is one trace. main_app() opens the root span, page
+functions decorated with @traced get a "page" span, and inside them:
+
+- every pooled query becomes a "query" span (reported by utils.profiler),
+- Plotly Express figure construction becomes a "chart" span,
+- Streamlit element calls (dataframes, charts, metrics, editors) become
+  "render" spans,
+- span(name, "transform") marks pandas/NumPy work explicitly.
+
+Time inside a span that is not covered by a child is the span's own
+(self) time; for a page span that is mostly data munging. Finished traces
+are written to a separate SQLite file and only the most recent ones are
+kept.
+"""
+import contextvars
+import functools
+import itertools
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+TRACE_STORE_PATH = "traces.db"
+TRACE_RETENTION = 500  # traces kept in the store
+MAX_SPANS_PER_TRACE = 2000
+SPAN_KINDS = ("rerun", "page", "query", "transform", "chart", "render")
+
+# Plotly Express builders and Streamlit element methods timed by install_hooks()
+CHART_FUNCTIONS = ("bar", "pie", "line", "area", "scatter", "histogram", "timeline")
+RENDER_METHODS = ("dataframe", "data_editor", "table", "plotly_chart", "metric", "download_button", "json")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "duration")
+
+    def __init__(self, trace, span_id, parent_id, name, kind, start, duration=None):
+        self.trace = trace
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.duration = duration
+
+
+class Trace:
+    def __init__(self, page):
+        self.trace_id = uuid.uuid4().hex
+        self.page = page
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.dropped = 0
+        self._ids = itertools.count(1)
+
+    def new_span(self, parent, name, kind, start, duration=None, max_spans=MAX_SPANS_PER_TRACE):
+        if len(self.spans) >= max_spans:
+            self.dropped += 1
+            return None
+        span = Span(self, next(self._ids), parent.span_id if parent else None, name, kind, start, duration)
+        self.spans.append(span)
+        return span
+
+
+class Tracer:
+    def __init__(self, store_path=TRACE_STORE_PATH, retention=TRACE_RETENTION, max_spans=MAX_SPANS_PER_TRACE):
+        self.enabled = True
+        self.store_path = store_path
+        self.retention = retention
+        self.max_spans = max_spans
+        self._store_lock = threading.Lock()
+        self._store_ready = False
+        self._hooks_installed = False
+
+    # Recording
+
+    @contextmanager
+    def trace(self, page):
+        """Root span for one rerun of a page; the trace is stored when it ends"""
+        if not self.enabled or _current_span.get() is not None:
+            yield None
+            return
+
+        trace = Trace(page)
+        root = trace.new_span(None, page, "rerun", trace.start)
+        token = _current_span.set(root)
+        try:
+            yield root
+        finally:
+            _current_span.reset(token)
+            root.duration = time.perf_counter() - root.start
+            try:
+                self._save(trace)
+            except sqlite3.Error:
+                # Tracing is diagnostic only; never break the page because of it
+                pass
+
+    @contextmanager
+    def span(self, name, kind="transform"):
+        """Time a block as a child of the current span (no-op outside a trace)"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = parent.trace.new_span(parent, name, kind, time.perf_counter(), max_spans=self.max_spans)
+        if span is None:
+            yield None
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span.start
+
+    def traced(self, kind="page", name=None):
+        """Decorator form of span(); the name defaults to the function name"""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, kind):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def current_span(self):
+        return _current_span.get()
+
+    def add_span(self, parent, name, kind, start, duration):
+        """Record an already finished span (e.g. a query timed elsewhere) under parent"""
+        if parent is not None:
+            parent.trace.new_span(parent, name, kind, start, duration, max_spans=self.max_spans)
+
+    def install_hooks(self):
+        """Time Plotly Express builders as chart spans and Streamlit elements as render spans"""
+        if self._hooks_installed:
+            return
+        import plotly.express as px
+        import streamlit as st
+        from streamlit.delta_generator import DeltaGenerator
+
+        for name in CHART_FUNCTIONS:
+            if hasattr(px, name):
+                setattr(px, name, self._wrap(getattr(px, name), f"px.{name}", "chart"))
+        for name in RENDER_METHODS:
+            # st.<name> is bound to the main container at import time, so it
+            # needs wrapping as well as the method used by columns and tabs
+            for owner in (DeltaGenerator, st):
+                if hasattr(owner, name):
+                    setattr(owner, name, self._wrap(getattr(owner, name), f"st.{name}", "render"))
+        self._hooks_installed = True
+
+    def _wrap(self, func, span_name, kind):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = _current_span.get()
+            # Only time top-level calls (st.write may call st.dataframe, etc.)
+            if parent is None or parent.kind in ("chart", "render"):
+                return func(*args, **kwargs)
+            with self.span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+
+    # Trace store
+
+    def _store_connection(self):
+        conn = sqlite3.connect(self.store_path, timeout=1.0)
+        if not self._store_ready:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS traces (
+                    trace_id TEXT PRIMARY KEY,
+                    page TEXT NOT NULL,
+                    started_at TIMESTAMP NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    span_count INTEGER NOT NULL,
+                    dropped_spans INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_traces_page ON traces(page, duration_ms);
+                CREATE TABLE IF NOT EXISTS spans (
+                    trace_id TEXT NOT NULL,
+                    span_id INTEGER NOT NULL,
+                    parent_id INTEGER,
+                    name TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    start_ms REAL NOT NULL,
+                    duration_ms REAL NOT NULL,
+                    PRIMARY KEY (trace_id, span_id)
+                );
+            """)
+            self._store_ready = True
+        return conn
+
+    def _save(self, trace):
+        rows = [
+            (trace.trace_id, s.span_id, s.parent_id, s.name, s.kind,
+             (s.start - trace.start) * 1000, (s.duration or 0.0) * 1000)
+            for s in trace.spans
+        ]
+        root = trace.spans[0]
+        with self._store_lock:
+            conn = self._store_connection()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT INTO traces (trace_id, page, started_at, duration_ms, span_count, dropped_spans) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (trace.trace_id, trace.page,
+                         time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(trace.started_at)),
+                         root.duration * 1000, len(rows), trace.dropped)
+                    )
+                    conn.executemany("INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+                    # Keep only the most recent traces
+                    expired = conn.execute(
+                        "SELECT trace_id FROM traces ORDER BY started_at DESC, rowid DESC LIMIT -1 OFFSET ?",
+                        (self.retention,)
+                    ).fetchall()
+                    if expired:
+                        conn.executemany("DELETE FROM spans WHERE trace_id = ?", expired)
+                        conn.executemany("DELETE FROM traces WHERE trace_id = ?", expired)
+            finally:
+                conn.close()
+
+    def _read(self, sql, params=()):
+        with self._store_lock:
+            conn = self._store_connection()
+            try:
+                return pd.read_sql(sql, conn, params=params)
+            finally:
+                conn.close()
+
+    def page_stats(self):
+        """Render time percentiles per page over the stored traces, slowest p95 first"""
+        traces = self._read("SELECT page, duration_ms FROM traces")
+        rows = []
+        for page, group in traces.groupby("page"):
+            ms = group["duration_ms"].to_numpy()
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            rows.append({"page": page, "reruns": len(ms), "p50_ms": p50, "p95_ms": p95,
+                         "p99_ms": p99, "max_ms": ms.max()})
+        columns = ["page", "reruns", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+        return pd.DataFrame(rows, columns=columns).sort_values("p95_ms", ascending=False, ignore_index=True)
+
+    def slowest_traces(self, page=None, limit=20):
+        sql = "SELECT trace_id, page, started_at, duration_ms, span_count, dropped_spans FROM traces"
+        params = []
+        if page:
+            sql += " WHERE page = ?"
+            params.append(page)
+        sql += " ORDER BY duration_ms DESC LIMIT ?"
+        params.append(limit)
+        return self._read(sql, params)
+
+    def trace_spans(self, trace_id):
+        """Spans of one trace in start order, with depth and self time"""
+        spans = self._read(
+            "SELECT span_id, parent_id, name, kind, start_ms, duration_ms FROM spans "
+            "WHERE trace_id = ? ORDER BY start_ms, span_id",
+            (trace_id,)
+        )
+        if spans.empty:
+            spans["depth"] = []
+            spans["self_ms"] = []
+            return spans
+
+        parents = dict(zip(spans["span_id"], spans["parent_id"]))
+        depth = {}
+        for span_id in spans["span_id"]:
+            d, parent = 0, parents[span_id]
+            while parent is not None and not pd.isna(parent):
+                d += 1
+                parent = parents.get(int(parent))
+            depth[span_id] = d
+        spans["depth"] = spans["span_id"].map(depth)
+
+        child_time = spans.dropna(subset=["parent_id"]).groupby("parent_id")["duration_ms"].sum()
+        spans["self_ms"] = (spans["duration_ms"] - spans["span_id"].map(child_time).fillna(0)).clip(lower=0)
+        return spans
+
+    def breakdown(self, trace_id):
+        """Self time per span kind for one trace; page and rerun self time is shown as transform/other"""
+        spans = self.trace_spans(trace_id)
+        kinds = spans["kind"].replace({"page": "transform/other", "rerun": "transform/other",
+                                       "transform": "transform/other"})
+        return spans.groupby(kinds)["self_ms"].sum().rename("ms").sort_values(ascending=False).reset_index()
+
+    def clear(self):
+        with self._store_lock:
+            conn = self._store_connection()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM spans")
+                    conn.execute("DELETE FROM traces")
+            finally:
+                conn.close()
+
+
+# Shared by every session in this process
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced